@@ -15,15 +15,25 @@ import { IScraperMovement } from '../interfaces/IScraper';
 import dotenv from 'dotenv';
 import { WebSocketService } from '../services/websocket.service';
 import { CompanyService } from '../services/company.service';
+import { SCRAPER_TASK_STATUS_FIELDS, TERMINAL_TASK_STATUSES, taskFromHash } from '../utils/scraperTaskHash';
 dotenv.config();
 
+// Tiempo que se recuerda la respuesta de un lote enviado con Idempotency-Key
+const IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60;
+// Mientras un lote se procesa, un reintento concurrente recibe 409
+const IDEMPOTENCY_PROCESSING_TTL_SECONDS = 10 * 60;
+// Reintentos cuando otro escritor modifica la tarea entre la lectura y la escritura
+const TASK_UPDATE_MAX_RETRIES = 10;
+
 export class ScraperController {
   private bancoEstadoService: BancoEstadoService;
   private planService: PlanService;
+  private redisService: RedisService;
 
   constructor() {
     const redisService = new RedisService();
     const scraperService = new ScraperService(redisService);
+    this.redisService = redisService;
     this.bancoEstadoService = new BancoEstadoService(redisService, scraperService);
     this.planService = new PlanService();
   }
@@ -180,8 +190,13 @@ export class ScraperController {
   };
   public processScraperData = async (req: Request, res: Response, next: NextFunction): Promise<void | Response> => {
     let scraperTaskId: string | undefined;
+    let chunked = false;
+    // El scraper envía los movimientos por lotes con una clave estable por lote:
+    // un reintento de un lote ya procesado recibe la misma respuesta sin duplicar movimientos
+    const idempotencyKey = req.header('Idempotency-Key');
+    const idempotencyRedisKey = idempotencyKey ? `scraper:idempotency:${idempotencyKey}` : undefined;
     try {
-      const { rawMovements, userId, scraperTaskId: taskId, cuentas } = req.body;
+      const { rawMovements, userId, scraperTaskId: taskId, cuentas, chunkIndex, chunkTotal } = req.body;
       scraperTaskId = taskId;
       if (!Array.isArray(rawMovements) || typeof userId !== 'number' || typeof scraperTaskId !== 'string') {
         return res.status(400).json({ message: 'Datos inválidos en el payload del scraper' });
@@ -189,8 +204,30 @@ export class ScraperController {
       if (userId === 0) {
         return res.status(400).json({ message: 'userId no puede ser 0' });
       }
+      // Un envío por lotes trae chunkIndex/chunkTotal: cada POST es solo una parte de la tarea
+      // y el estado final (completed/failed) lo fija el scraper cuando terminó de enviar todo
+      chunked = Number.isInteger(chunkTotal) && chunkTotal > 0
+        && Number.isInteger(chunkIndex) && chunkIndex >= 0 && chunkIndex < chunkTotal;
+      const chunkLabel = chunked ? `Lote ${chunkIndex + 1}/${chunkTotal}: ` : '';
+      const taskProgress = (progress: number): number => chunked
+        ? Math.min(99, Math.round(((chunkIndex + progress / 100) / chunkTotal) * 100))
+        : progress;
+
+      if (idempotencyRedisKey) {
+        // SET NX: de dos reintentos concurrentes solo uno reclama el lote
+        const claimed = await this.redisService.setNX(idempotencyRedisKey, 'processing', IDEMPOTENCY_PROCESSING_TTL_SECONDS);
+        if (!claimed) {
+          const stored = await this.redisService.get(idempotencyRedisKey);
+          if (!stored || stored === 'processing') {
+            return res.status(409).json({ message: 'El lote ya se está procesando' });
+          }
+          const { status, body } = JSON.parse(stored);
+          console.log(`[ScraperController] Lote ${idempotencyKey} ya procesado, se repite la respuesta`);
+          return res.status(status).json(body);
+        }
+      }
 
-      console.log(`[ScraperController] Procesando ${rawMovements.length} movimientos del scraper para usuario ${userId}`);
+      console.log(`[ScraperController] ${chunkLabel}Procesando ${rawMovements.length} movimientos del scraper para usuario ${userId}`);
       if (cuentas && Array.isArray(cuentas)) {
         console.log(`[ScraperController] Procesando ${cuentas.length} cuentas detectadas por el scraper:`, 
           cuentas.map(c => `${c.tipo} (${c.numero})`));
@@ -198,8 +235,8 @@ export class ScraperController {
       
       await this.updateScraperTaskStatus(scraperTaskId, {
         status: 'processing',
-        message: `Procesando ${rawMovements.length} movimientos...`,
-        progress: 10
+        message: `${chunkLabel}Procesando ${rawMovements.length} movimientos...`,
+        progress: taskProgress(10)
       });
 
       const cardService = new CardService();
@@ -209,6 +246,9 @@ export class ScraperController {
       // Obtener el plan real del usuario desde la base de datos
       const user = await userService.getUserById(userId);
       if (!user) {
+        if (idempotencyRedisKey) {
+          await this.redisService.del(idempotencyRedisKey);
+        }
         return res.status(404).json({ message: 'Usuario no encontrado' });
       }
       const planId = user.plan_id;
@@ -260,8 +300,8 @@ export class ScraperController {
       const errors: any[] = [];
       await this.updateScraperTaskStatus(scraperTaskId, {
         status: 'processing',
-        message: 'Creando tarjetas y preparando datos...',
-        progress: 30
+        message: `${chunkLabel}Creando tarjetas y preparando datos...`,
+        progress: taskProgress(30)
       });
 
       for (let i = 0; i < rawMovements.length; i++) {
@@ -282,8 +322,8 @@ export class ScraperController {
             const progress = 30 + Math.round((i / rawMovements.length) * 60);
             await this.updateScraperTaskStatus(scraperTaskId, {
               status: 'processing',
-              message: `Procesando movimientos: ${i + 1}/${rawMovements.length}`,
-              progress
+              message: `${chunkLabel}Procesando movimientos: ${i + 1}/${rawMovements.length}`,
+              progress: taskProgress(progress)
             });
           }
         } catch (error) {
@@ -305,12 +345,26 @@ export class ScraperController {
       };
 
       console.log(`[ScraperController] Estadísticas del procesamiento del scraper:`, stats);
-      if (errors.length > 0 && createdMovements.length > 0) {
+      if (chunked) {
         await this.updateScraperTaskStatus(scraperTaskId, {
-          status: 'completed',
-          message: `Completado con ${createdMovements.length} movimientos procesados y ${errors.length} errores`,
-          progress: 100,
-          result: { createdMovements, errors, stats }
+          status: 'processing',
+          message: `${chunkLabel}${createdMovements.length} movimientos procesados y ${errors.length} errores`,
+          progress: taskProgress(100)
+        });
+      }
+      if (errors.length > 0 && createdMovements.length > 0) {
+        if (!chunked) {
+          await this.updateScraperTaskStatus(scraperTaskId, {
+            status: 'completed',
+            message: `Completado con ${createdMovements.length} movimientos procesados y ${errors.length} errores`,
+            progress: 100,
+            result: { createdMovements, errors, stats }
+          });
+        }
+        await this.rememberIdempotentResponse(idempotencyRedisKey, 207, {
+          message: 'Procesamiento del scraper completado con algunos errores.',
+          errors,
+          stats
         });
         return res.status(207).json({ 
           message: 'Procesamiento del scraper completado con algunos errores.',
@@ -319,12 +373,19 @@ export class ScraperController {
           stats
         });
       } else if (errors.length > 0) {
-        await this.updateScraperTaskStatus(scraperTaskId, {
-          status: 'failed',
-          message: `Error al procesar movimientos: ${errors.length} errores encontrados`,
-          progress: 100,
-          error: `${errors.length} movimientos fallaron`,
-          result: { errors, stats }
+        if (!chunked) {
+          await this.updateScraperTaskStatus(scraperTaskId, {
+            status: 'failed',
+            message: `Error al procesar movimientos: ${errors.length} errores encontrados`,
+            progress: 100,
+            error: `${errors.length} movimientos fallaron`,
+            result: { errors, stats }
+          });
+        }
+        await this.rememberIdempotentResponse(idempotencyRedisKey, 400, {
+          message: 'Error al procesar todos los movimientos del scraper.',
+          errors,
+          stats
         });
         return res.status(400).json({ 
           message: 'Error al procesar todos los movimientos del scraper.',
@@ -332,11 +393,17 @@ export class ScraperController {
           stats
         });
       } else {
-        await this.updateScraperTaskStatus(scraperTaskId, {
-          status: 'completed',
-          message: `${createdMovements.length} movimientos procesados exitosamente`,
-          progress: 100,
-          result: { movements: createdMovements, stats }
+        if (!chunked) {
+          await this.updateScraperTaskStatus(scraperTaskId, {
+            status: 'completed',
+            message: `${createdMovements.length} movimientos procesados exitosamente`,
+            progress: 100,
+            result: { movements: createdMovements, stats }
+          });
+        }
+        await this.rememberIdempotentResponse(idempotencyRedisKey, 201, {
+          message: 'Movimientos del scraper procesados exitosamente.',
+          stats
         });
         return res.status(201).json({ 
           message: 'Movimientos del scraper procesados exitosamente.',
@@ -347,7 +414,12 @@ export class ScraperController {
 
     } catch (error) {
       console.error('Error general en processScraperData:', error);
-      if (scraperTaskId) {
+      if (idempotencyRedisKey) {
+        // El lote no quedó procesado: permitir que el scraper lo reintente
+        await this.redisService.del(idempotencyRedisKey).catch(() => undefined);
+      }
+      // Un lote fallido se reintenta: la tarea solo falla si el scraper lo decide
+      if (scraperTaskId && !chunked) {
         try {
           await this.updateScraperTaskStatus(scraperTaskId, {
             status: 'failed',
@@ -363,6 +435,45 @@ export class ScraperController {
       return res.status(500).json({ message: 'Error al procesar los datos del scraper' });
     }
   };
+  // Recategorización offline: el scraper envía la categoría nueva (to) y la automática anterior (from)
+  public recategorizeMovements = async (req: Request, res: Response, next: NextFunction): Promise<Response> => {
+    try {
+      const { userId, changes } = req.body;
+      if (typeof userId !== 'number' || userId === 0 || !Array.isArray(changes)) {
+        return res.status(400).json({ message: 'Datos inválidos en el payload de recategorización' });
+      }
+      const validChanges = changes.filter(
+        (change: any) => change && typeof change.uniqueKey === 'string' && typeof change.to === 'string'
+          && (change.from === undefined || change.from === null || typeof change.from === 'string')
+      );
+      if (validChanges.length !== changes.length) {
+        return res.status(400).json({ message: 'Cada cambio requiere uniqueKey y to (from es opcional)' });
+      }
+
+      const movementService = new MovementService();
+      const { updated, unknownCategories } = await movementService.recategorizeScraperMovements(userId, validChanges);
+      console.log(`[ScraperController] Recategorización usuario ${userId}: ${updated}/${validChanges.length} movimientos actualizados`);
+      return res.status(200).json({
+        message: 'Recategorización aplicada',
+        stats: { recibidos: validChanges.length, actualizados: updated, categorias_desconocidas: unknownCategories }
+      });
+    } catch (error) {
+      console.error('Error general en recategorizeMovements:', error);
+      return res.status(500).json({ message: 'Error al recategorizar movimientos' });
+    }
+  };
+
+  private async rememberIdempotentResponse(key: string | undefined, status: number, body: unknown): Promise<void> {
+    if (!key) {
+      return;
+    }
+    try {
+      await this.redisService.set(key, JSON.stringify({ status, body }), IDEMPOTENCY_TTL_SECONDS);
+    } catch (error) {
+      console.error('[ScraperController] Error guardando respuesta idempotente:', error);
+    }
+  }
+
   private async convertScraperMovement(mov: IScraperMovement, taskId: string, defaultCardId: number): Promise<IMovementCreate> {
     // Intentar categorizar usando CompanyService
     const companyService = new CompanyService();
@@ -407,6 +518,9 @@ export class ScraperController {
         estado: mov.estado,
         tipo: mov.tipo,
         uniqueKey,
+        // Categoría asignada automáticamente: la recategorización solo cambia
+        // movimientos que la conservan (no los editados a mano)
+        autoCategoryId: categoryId,
         originalAmount,
         originalDate: mov.fecha
       }
@@ -459,48 +573,81 @@ export class ScraperController {
   }): Promise<void> {
     try {
       console.log(`[ScraperController] Actualizando tarea ${taskId}:`, update);
-      const redisService = new RedisService();
       const webSocketService = WebSocketService.getInstance();
-      
-      const currentTaskData = await redisService.hGet(`scraper:tasks:${taskId}`, 'data');
-      let updatedTask;
-      
-      if (currentTaskData) {
-        const currentTask = JSON.parse(currentTaskData);
-        updatedTask = {
-          ...currentTask,
-          ...update,
-          updated_at: new Date().toISOString()
-        };
-      } else {
-        console.warn(`[ScraperController] No se encontró la tarea ${taskId} en Redis`);
-        // Intentar crear la tarea con la información disponible
-        updatedTask = {
-          id: taskId,
-          status: update.status || 'processing',
-          message: update.message || 'Procesando...',
-          progress: update.progress || 0,
-          result: update.result || null,
-          error: update.error || null,
-          created_at: new Date().toISOString(),
-          updated_at: new Date().toISOString()
-        };
+      const taskKey = `scraper:tasks:${taskId}`;
+
+      const fields: Record<string, string> = { updated_at: new Date().toISOString() };
+      if (update.status !== undefined) {
+        fields.status = update.status;
       }
-      
-      // Guardar en Redis
-      await redisService.hSet(`scraper:tasks:${taskId}`, 'data', JSON.stringify(updatedTask));
-      console.log(`[ScraperController] Tarea ${taskId} actualizada en Redis. Estado: ${updatedTask.status}`);
-      
-      // Notificar a través de WebSocket
-      await webSocketService.updateTaskStatus(taskId, updatedTask);
-      console.log(`[ScraperController] Notificación WebSocket enviada para tarea ${taskId}`);
-      
-      // Verificar que la actualización se guardó correctamente
-      const verifyData = await redisService.hGet(`scraper:tasks:${taskId}`, 'data');
-      if (verifyData) {
-        const verifyTask = JSON.parse(verifyData);
-        console.log(`[ScraperController] Verificación - Tarea ${taskId} estado: ${verifyTask.status}, progreso: ${verifyTask.progress}%`);
+      if (update.message !== undefined) {
+        fields.message = update.message;
+      }
+      if (update.progress !== undefined) {
+        fields.progress = String(update.progress);
+      }
+      if (update.error !== undefined) {
+        fields.error = update.error;
+      }
+
+      // Mismo esquema que el scraper (utils/task_status.py): un avance solo escribe los campos que
+      // cambian, y no reabre una tarea que el scraper ya cerró (p. ej. un lote que llega desde el outbox)
+      if (update.result === undefined && !TERMINAL_TASK_STATUSES.includes(update.status || '')) {
+        const valores = await this.redisService.hSetUnlessStatus(taskKey, fields, TERMINAL_TASK_STATUSES, SCRAPER_TASK_STATUS_FIELDS);
+        if (!valores) {
+          console.log(`[ScraperController] Tarea ${taskId} ya terminó, se omite el progreso`);
+          return;
+        }
+        const estado: Record<string, string> = {};
+        SCRAPER_TASK_STATUS_FIELDS.forEach((name, index) => {
+          if (valores[index] !== null) {
+            estado[name] = valores[index] as string;
+          }
+        });
+        await webSocketService.updateTaskStatus(taskId, { id: taskId, ...taskFromHash(estado) });
+        return;
+      }
+
+      // Transición final: campos y espejo `data` juntos, solo si `data` no cambió desde la lectura
+      for (let attempt = 0; attempt < TASK_UPDATE_MAX_RETRIES; attempt++) {
+        const current = await this.redisService.hGetAll(taskKey);
+        const currentTaskData = current.data ?? null;
+        let updatedTask;
+
+        if (currentTaskData) {
+          updatedTask = {
+            ...taskFromHash(current),
+            ...update,
+            updated_at: fields.updated_at
+          };
+        } else {
+          console.warn(`[ScraperController] No se encontró la tarea ${taskId} en Redis`);
+          // Intentar crear la tarea con la información disponible
+          updatedTask = {
+            id: taskId,
+            status: update.status || 'processing',
+            message: update.message || 'Procesando...',
+            progress: update.progress || 0,
+            result: update.result || null,
+            error: update.error || null,
+            created_at: new Date().toISOString(),
+            updated_at: fields.updated_at
+          };
+        }
+
+        if (!await this.redisService.hSetIfUnchanged(taskKey, 'data', currentTaskData,
+          { ...fields, status: String(updatedTask.status), data: JSON.stringify(updatedTask) })) {
+          // Otro escritor (el scraper u otro lote) actualizó la tarea: leer de nuevo y reintentar
+          continue;
+        }
+        console.log(`[ScraperController] Tarea ${taskId} actualizada en Redis. Estado: ${updatedTask.status}`);
+
+        // Notificar a través de WebSocket
+        await webSocketService.updateTaskStatus(taskId, updatedTask);
+        console.log(`[ScraperController] Notificación WebSocket enviada para tarea ${taskId}`);
+        return;
       }
+      console.error(`[ScraperController] No se pudo actualizar la tarea ${taskId}: demasiadas escrituras concurrentes`);
     } catch (error) {
       console.error(`[ScraperController] Error crítico actualizando tarea ${taskId}:`, error);
       if (error instanceof Error) {
@@ -29,6 +29,7 @@ router.use('/stripe', stripeRoutes);
 router.use('/automation', automationRoutes);
 router.use('/config', configRoutes);
 router.post('/scraper/process-data', scraperController.processScraperData);
+router.post('/scraper/recategorize', scraperController.recategorizeMovements);
 
 router.get('/', (req, res) => {
     res.json({ message: 'rutas publicas funcionando correctamente' });
@@ -1091,4 +1091,68 @@ export class MovementService {
       throw error;
     }
   }
-} 
\ No newline at end of file
+
+  /**
+   * Actualiza la categoría de movimientos del scraper identificados por su
+   * metadata.uniqueKey (la recategorización offline del scraper). Solo toca
+   * movimientos de tarjetas del usuario; los nombres de categoría que no
+   * existen se informan y se omiten.
+   */
+  async recategorizeScraperMovements(
+    userId: number,
+    changes: { uniqueKey: string; from?: string | null; to: string }[]
+  ): Promise<{ updated: number; unknownCategories: string[] }> {
+    const names = new Set<string>();
+    for (const change of changes) {
+      names.add(change.to.toLowerCase());
+      if (change.from) {
+        names.add(change.from.toLowerCase());
+      }
+    }
+
+    const categories = await this.pool.query(
+      'SELECT id, LOWER(name_category) AS name FROM categories WHERE LOWER(name_category) = ANY($1::text[])',
+      [Array.from(names)]
+    );
+    const categoryIds = new Map<string, number>(
+      categories.rows.map((row: { name: string; id: number }) => [row.name, row.id] as [string, number])
+    );
+
+    const keys: string[] = [];
+    const fromIds: (number | null)[] = [];
+    const toIds: number[] = [];
+    const unknownCategories = new Set<string>();
+    for (const change of changes) {
+      const toId = categoryIds.get(change.to.toLowerCase());
+      if (toId === undefined) {
+        unknownCategories.add(change.to.toLowerCase());
+        continue;
+      }
+      keys.push(change.uniqueKey);
+      fromIds.push(change.from ? categoryIds.get(change.from.toLowerCase()) ?? null : null);
+      toIds.push(toId);
+    }
+    if (keys.length === 0) {
+      return { updated: 0, unknownCategories: Array.from(unknownCategories) };
+    }
+
+    // Se compara contra lo que hay guardado, no contra el archivo del scraper:
+    // solo cambian los movimientos que aún tienen su categoría automática
+    // (metadata.autoCategoryId, o la `from` enviada para movimientos anteriores
+    // a ese campo). Los recategorizados a mano no se tocan.
+    const result = await this.pool.query(`
+      UPDATE movements m
+      SET category_id = ch.to_id,
+          metadata = jsonb_set(COALESCE(m.metadata, '{}'::jsonb), '{autoCategoryId}', to_jsonb(ch.to_id)),
+          updated_at = NOW()
+      FROM unnest($2::text[], $3::int[], $4::int[]) AS ch(unique_key, from_id, to_id), cards c
+      WHERE m.card_id = c.id
+        AND c.user_id = $1
+        AND m.movement_source = 'scraper'
+        AND m.metadata->>'uniqueKey' = ch.unique_key
+        AND m.category_id = COALESCE((m.metadata->>'autoCategoryId')::int, ch.from_id)
+        AND m.category_id IS DISTINCT FROM ch.to_id
+    `, [userId, keys, fromIds, toIds]);
+    return { updated: result.rowCount || 0, unknownCategories: Array.from(unknownCategories) };
+  }
+}
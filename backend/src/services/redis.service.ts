@@ -75,6 +75,12 @@ export class RedisService { // quitamos OnModuleDestroy por ahora, manejar desco
     return this.client.set(key, value);
   }
 
+  // SET NX atómico: true solo si la clave no existía y quedó guardada
+  async setNX(key: string, value: string, ttl: number): Promise<boolean> {
+    const result = await this.client.set(key, value, 'EX', ttl, 'NX');
+    return result === 'OK';
+  }
+
   async get(key: string): Promise<string | null> {
     return this.client.get(key);
   }
@@ -126,6 +132,47 @@ export class RedisService { // quitamos OnModuleDestroy por ahora, manejar desco
     return this.client.hget(key, field);
   }
 
+  async hGetAll(key: string): Promise<Record<string, string>> {
+    return this.client.hgetall(key);
+  }
+
+  // HSET de `fields` salvo que el campo `status` del hash ya tenga uno de `finalStatuses`.
+  // Retorna los valores de `readFields` después de escribir, o null si no se escribió.
+  async hSetUnlessStatus(key: string, fields: Record<string, string>, finalStatuses: string[],
+                         readFields: string[]): Promise<(string | null)[] | null> {
+    const script = `
+      local current = redis.call('HGET', KEYS[1], 'status')
+      local finales = cjson.decode(ARGV[1])
+      for _, final in ipairs(finales) do
+        if current == final then return false end
+      end
+      local lectura = cjson.decode(ARGV[2])
+      redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+      return redis.call('HMGET', KEYS[1], unpack(lectura))`;
+    const args = Object.entries(fields).flat();
+    const result = await this.client.eval(script, 1, key, JSON.stringify(finalStatuses), JSON.stringify(readFields), ...args);
+    return result === null ? null : result as (string | null)[];
+  }
+
+  // Compare-and-set sobre un hash: escribe `fields` solo si `guardField` sigue valiendo `expected`
+  // (null = el campo no existe). Es un script Lua y no WATCH/MULTI porque el cliente es una sola
+  // conexión compartida entre requests, y WATCH es por conexión.
+  async hSetIfUnchanged(key: string, guardField: string, expected: string | null,
+                        fields: Record<string, string>): Promise<boolean> {
+    const script = `
+      local current = redis.call('HGET', KEYS[1], ARGV[1])
+      if ARGV[2] == '1' then
+        if current ~= ARGV[3] then return 0 end
+      elseif current then
+        return 0
+      end
+      redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+      return 1`;
+    const args = Object.entries(fields).flat();
+    const result = await this.client.eval(script, 1, key, guardField, expected === null ? '0' : '1', expected ?? '', ...args);
+    return result === 1;
+  }
+
   // Método para desconectar manualmente si es necesario al cerrar la app Express
   async quit(): Promise<void> {
     await this.client.quit();
@@ -6,6 +6,7 @@ import { join } from 'path';
 import { WebSocketService } from '../../websocket.service';
 import { ScraperEvent, TaskStatus } from '../../../interfaces/ScraperEvent';
 import { getErrorMessage, ScraperError } from '../../../utils/errors';
+import { taskFromHash } from '../../../utils/scraperTaskHash';
 
 @Injectable()
 export class BancoEstadoService {
@@ -98,10 +99,11 @@ export class BancoEstadoService {
 
     async getTaskStatus(taskId: string): Promise<ScraperTask | null> {
         try {
-            const scraperTaskData = await this.redisService.hGet(`scraper:tasks:${taskId}`, 'data');
+            // Los avances solo escriben los campos de estado; `data` tiene el resto de la tarea
+            const scraperTaskFields = await this.redisService.hGetAll(`scraper:tasks:${taskId}`);
             
-            if (scraperTaskData) {
-                const scraperTask = JSON.parse(scraperTaskData);
+            if (scraperTaskFields.data) {
+                const scraperTask = taskFromHash(scraperTaskFields);
                 const transformedResult = this.transformScraperResult(scraperTask.result);
                 const task = {
                     id: taskId,
@@ -144,7 +146,10 @@ export class BancoEstadoService {
             bank: 'BancoEstado',
             balance: this.processBalance(cuenta.saldo),
             lastFourDigits: cuenta.numero.slice(-4),
-            movements: cuenta.movimientos,
+            // El estado de la tarea solo trae el resumen; los movimientos completos
+            // quedan en scraper:results:{id} (result.result_key)
+            movements: cuenta.movimientos || [],
+            movementCount: cuenta.total_movimientos ?? cuenta.movimientos?.length ?? 0,
             status: cuenta.estado
         })) || [];
 
@@ -172,10 +177,9 @@ export class BancoEstadoService {
                 };
             }
 
-            await this.redisService.rpush('scraper:control', JSON.stringify({
-                action: 'cancel',
-                id: taskId
-            }));
+            // Clave propia de la tarea (no una lista compartida que otro worker pueda consumir);
+            // el scraper la revisa mientras corre y cierra el navegador al verla
+            await this.redisService.set(`scraper:cancel:${taskId}`, '1', 3600);
 
             return { success: true, message: 'Tarea cancelada exitosamente', taskId };
         } catch (err: unknown) {
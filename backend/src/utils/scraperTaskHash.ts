@@ -0,0 +1,25 @@
+// Tareas del scraper en el hash `scraper:tasks:{id}` (mismo esquema que scraper/utils/task_status.py):
+// los campos de estado se actualizan por separado en cada avance y `data` guarda el resto de la
+// tarea en JSON, reconstruido solo en las transiciones finales.
+export const SCRAPER_TASK_STATUS_FIELDS = ['status', 'message', 'progress', 'error', 'updated_at'];
+export const TERMINAL_TASK_STATUSES = ['completed', 'failed', 'cancelled'];
+
+// Tarea a partir del hash: el JSON de `data` con los campos de estado (más recientes) encima
+export function taskFromHash(fields: Record<string, string>): any {
+  const task = fields.data ? JSON.parse(fields.data) : {};
+  for (const name of SCRAPER_TASK_STATUS_FIELDS) {
+    const value = fields[name];
+    if (value === undefined || value === null) {
+      continue;
+    }
+    if (name === 'progress') {
+      const progress = Number(value);
+      if (!Number.isNaN(progress)) {
+        task.progress = progress;
+      }
+      continue;
+    }
+    task[name] = value;
+  }
+  return task;
+}
@@ -1,3 +1,13 @@
 """
 Paquete principal del scraper
-""" 
\ No newline at end of file
+"""
+import os
+import sys
+
+# Los módulos del scraper importan `utils` y `sites` desde la raíz del scraper
+# (así corre banco_estado_integration.py). Al importarlos como paquete `scraper`
+# (banco_estado_manager desde la raíz del proyecto) esa raíz también debe estar
+# en el path, y este es el único lugar donde se agrega.
+_scraper_root = os.path.dirname(os.path.abspath(__file__))
+if _scraper_root not in sys.path:
+    sys.path.append(_scraper_root)
@@ -5,127 +5,341 @@ Script integrador para conectar el scraper con el backend
 import json
 import asyncio
 import redis
+import redis.asyncio as aioredis
 import time
 import os
+import signal
 from datetime import datetime
-from urllib.parse import urlparse
-from sites.banco_estado.banco_estado_local_v2 import BancoEstadoScraper, ScraperConfig, Credentials
+from typing import Optional
+from sites.banco_estado.banco_estado_local_v2 import BancoEstadoScraper, ScraperConfig
+from sites.banco_estado.browser_pool import BrowserPool
+from sites.banco_estado.session_cache import SessionCache
+from sites.banco_estado.watermark import Marca, SyncWatermarks
+from utils.backend_uploader import BackendUploader
+from utils.companies_catalog import CompaniesCatalog
+from utils.movement_dedup import MovementDeduplicator
+from utils.outbox import Outbox
+from utils.task_queue import TaskStream
+from utils.task_status import set_task_status
+from utils.cancellation import CancellationToken
+from utils.redis_pool import close_redis, get_redis
 
 class ScraperIntegration:
-    def __init__(self):
-        # Configuración automática para Railway/local
-        redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
+    # Segundos que BLPOP espera por una tarea antes de volver a revisar la detención.
+    # No agrega latencia: BLPOP retorna apenas llega una tarea.
+    QUEUE_BLOCK_TIMEOUT = 2
+    # Cada cuántos segundos se buscan entradas huérfanas cuando no hay ninguna
+    RECLAIM_INTERVAL = 30
+    # Cada cuántos segundos se renueva la propiedad de las entradas en curso
+    HEARTBEAT_INTERVAL = 30
+    # Cada cuántos segundos se reenvían los lotes guardados en el outbox
+    OUTBOX_FLUSH_INTERVAL = int(os.getenv('SCRAPER_OUTBOX_FLUSH_INTERVAL', '30'))
+
+    def __init__(self, redis_client: Optional[aioredis.Redis] = None):
+        # Cliente del pool compartido del proceso (configurado desde REDIS_URL).
+        # El socket_timeout debe superar el timeout de BLPOP para no cortar la espera bloqueante
+        self.redis_client = redis_client or get_redis(socket_timeout=self.QUEUE_BLOCK_TIMEOUT + 5)
         
-        print(f"[DEBUG] REDIS_URL: {redis_url}")
+        # Pool de workers: cada worker ejecuta una sesión de BancoEstadoScraper
+        self.concurrency = max(1, int(os.getenv('SCRAPER_CONCURRENCY', '2')))
+        self.drain_timeout = int(os.getenv('SCRAPER_DRAIN_TIMEOUT', '300'))
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._stopping = asyncio.Event()
+        self._in_flight = {}
+        self.stream = TaskStream(self.redis_client)
+        # Navegador compartido: cada tarea recibe un BrowserContext aislado
+        self.browser_pool = BrowserPool(max_contexts=self.concurrency)
+        # Caché cifrado de sesiones (solo si SCRAPER_SESSION_KEY está definido)
+        self.session_cache = SessionCache.from_env(self.redis_client)
+        # Marcas de sincronización incremental por cuenta (SCRAPER_INCREMENTAL=0 las desactiva)
+        self.watermarks = SyncWatermarks.from_env(self.redis_client)
+        # Catálogo de empresas compartido por todas las tareas del proceso
+        self.companies_catalog = CompaniesCatalog()
+        # Sesión HTTP compartida para enviar movimientos al backend
+        self.backend_uploader = BackendUploader()
+        # Lotes que no llegaron al backend, para reenviarlos sin repetir el scraping
+        self.outbox = Outbox()
         
+    async def process_tasks(self):
+        """
+        Procesa tareas del stream de Redis con un pool de workers concurrentes.
+
+        Solo se lee una entrada cuando hay un slot libre, de modo que las tareas
+        pendientes quedan disponibles para otras réplicas. Antes de leer
+        entradas nuevas se reclaman las que quedaron huérfanas.
+        """
+        print(f"[SCRAPER] Iniciando procesador de tareas ({self.concurrency} workers, consumidor {self.stream.consumer})...")
+        await self.stream.setup()
         try:
-            # Parse URL correctamente usando urllib.parse
-            parsed_url = urlparse(redis_url)
-            
-            redis_host = parsed_url.hostname or 'localhost'
-            redis_port = parsed_url.port or 6379
-            redis_password = parsed_url.password
-            redis_username = parsed_url.username or 'default'
-            
-            print(f"[DEBUG] Redis config: host={redis_host}, port={redis_port}, username={redis_username}")
+            # Lanzar el navegador antes de la primera tarea
+            await self.browser_pool.start()
+        except Exception as e:
+            print(f"[WARNING] No se pudo precalentar el navegador, se lanzará con la primera tarea: {e}")
+        # Cargar el catálogo de empresas antes de que lo necesite la primera tarea
+        await self.companies_catalog.get()
+        
+        background = [
+            asyncio.create_task(self._bridge_loop()),
+            asyncio.create_task(self._heartbeat_loop()),
+            asyncio.create_task(self._outbox_loop()),
+        ]
+        next_reclaim = 0
+        
+        while not self._stopping.is_set():
+            await self._slots.acquire()
+            if self._stopping.is_set():
+                self._slots.release()
+                break
             
-            # Configurar cliente Redis
-            redis_config = {
-                'host': redis_host,
-                'port': redis_port,
-                'decode_responses': True,
-                'socket_connect_timeout': 5,
-                'socket_timeout': 5,
-                'retry_on_timeout': True
-            }
+            try:
+                entries = []
+                if time.monotonic() >= next_reclaim:
+                    entries = await self.stream.reclaim(count=1)
+                    if not entries:
+                        next_reclaim = time.monotonic() + self.RECLAIM_INTERVAL
+                if not entries:
+                    # Espera bloqueante: la tarea se recibe apenas se encola
+                    entries = await self.stream.read(count=1, block_ms=self.QUEUE_BLOCK_TIMEOUT * 1000)
+            except Exception as e:
+                self._slots.release()
+                print(f"ERROR: Error leyendo el stream de tareas: {e}")
+                await self._wait_or_stop(10)
+                continue
             
-            if redis_password:
-                redis_config['password'] = redis_password
-                if redis_username != 'default':
-                    redis_config['username'] = redis_username
+            if not entries:
+                # Sin tareas dentro del timeout, volver a revisar la detención
+                self._slots.release()
+                continue
             
-            self.redis_client = redis.Redis(**redis_config)
-            print(f"[INFO] Configuración Redis: {redis_host}:{redis_port}")
+            entry_id, task_data, deliveries = entries[0]
+            if deliveries > self.stream.max_deliveries:
+                self._slots.release()
+                await self._dead_letter(entry_id, task_data)
+                continue
             
+            worker = asyncio.create_task(self._run_task(entry_id, task_data))
+            self._in_flight[worker] = (entry_id, task_data)
+            worker.add_done_callback(lambda t: self._in_flight.pop(t, None))
+        
+        await self.drain()
+        for job in background:
+            job.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+    
+    async def _bridge_loop(self):
+        """Mueve al stream las tareas que el backend encola en scraper:queue"""
+        while not self._stopping.is_set():
+            try:
+                moved = await self.stream.bridge_legacy_queue(self.QUEUE_BLOCK_TIMEOUT)
+                if moved:
+                    print(f"[INFO] {moved} tareas movidas de scraper:queue al stream")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: Error moviendo tareas al stream: {e}")
+                await self._wait_or_stop(5)
+    
+    async def _heartbeat_loop(self):
+        """Mantiene vivas las entradas en curso para que otras réplicas no las reclamen"""
+        while True:
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+            entry_ids = [entry_id for entry_id, _ in self._in_flight.values()]
+            try:
+                await self.stream.heartbeat(entry_ids)
+            except Exception as e:
+                print(f"ERROR: Error enviando heartbeat de tareas: {e}")
+    
+    async def _outbox_loop(self):
+        """Reenvía los lotes del outbox y publica la profundidad de la cola"""
+        metrics_key = f"scraper:metrics:outbox:{self.stream.consumer}"
+        while True:
+            try:
+                delivered = await self.outbox.flush(self.backend_uploader, self._sincronizar_entregados)
+                metrics = self.outbox.metrics()
+                if delivered:
+                    print(f"[OK] Outbox: {delivered} lotes reenviados al backend")
+                if metrics['depth']:
+                    print(f"[INFO] Outbox: {metrics['depth']} lotes pendientes "
+                          f"({metrics['bytes'] / 1024:.0f} KB, el más antiguo hace {metrics['oldest_age_seconds']:.0f}s)")
+                await self.redis_client.hset(metrics_key, mapping={**metrics, 'updated_at': datetime.now().isoformat()})
+                await self.redis_client.expire(metrics_key, self.OUTBOX_FLUSH_INTERVAL * 10)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR: Error procesando el outbox: {e}")
+            await asyncio.sleep(self.OUTBOX_FLUSH_INTERVAL)
+    
+    async def _sincronizar_entregados(self, sincronizacion: dict):
+        """Avanza marcas y huellas de una tarea cuyos lotes terminó de entregar el outbox"""
+        user_id = sincronizacion.get('user_id')
+        marcas = {clave: Marca.from_json(raw) for clave, raw in (sincronizacion.get('marcas') or {}).items()}
+        if self.watermarks and marcas:
+            await self.watermarks.merge(user_id, marcas)
+        await MovementDeduplicator(self.redis_client).remember(user_id, sincronizacion.get('huellas') or [])
+        print(f"[OK] Outbox: marcas y huellas del usuario {user_id} actualizadas")
+
+    async def _dead_letter(self, entry_id, task_data):
+        """Descarta una tarea que agotó sus reintentos y la marca como fallida"""
+        print(f"[WARNING] Entrada {entry_id} superó {self.stream.max_deliveries} entregas, enviando a {self.stream.dead_letter}")
+        try:
+            await self.stream.dead_letter_entry(entry_id, task_data)
+            task = json.loads(task_data)
+            await self.update_task_status(task['id'], 'failed', 'La tarea agotó sus reintentos', 0)
         except Exception as e:
-            print(f"[ERROR] Error parseando REDIS_URL: {e}")
-            # Fallback a configuración local
-            self.redis_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
-            print("[INFO] Usando configuración Redis local como fallback")
+            print(f"ERROR: No se pudo mover la entrada {entry_id} al dead letter: {e}")
+    
+    async def _wait_or_stop(self, seconds):
+        """Espera el tiempo indicado o hasta que se solicite la detención"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+    
+    def request_stop(self):
+        """Solicita la detención ordenada: no se toman tareas nuevas"""
+        if not self._stopping.is_set():
+            print("[INFO] Detención solicitada, esperando tareas en curso...")
+            self._stopping.set()
+    
+    async def drain(self):
+        """
+        Espera a que terminen las tareas en curso. Las que no terminen dentro de
+        SCRAPER_DRAIN_TIMEOUT se cancelan y se devuelven al stream.
+        """
+        if not self._in_flight:
+            return
         
-    async def process_tasks(self):
-        """Procesa tareas de la cola de Redis"""
-        print("[SCRAPER] Iniciando procesador de tareas...")
+        pending = dict(self._in_flight)
+        print(f"[INFO] Esperando {len(pending)} tareas en curso (máx. {self.drain_timeout}s)...")
+        _, not_done = await asyncio.wait(list(pending), timeout=self.drain_timeout)
         
-        while True:
+        for worker in not_done:
+            worker.cancel()
+        if not_done:
+            await asyncio.gather(*not_done, return_exceptions=True)
+        
+        for worker in not_done:
+            entry_id, task_data = pending[worker]
             try:
-                # Obtener tarea de la cola
-                task_data = self.redis_client.lpop('scraper:queue')
-                
-                if not task_data:
-                    # No hay tareas, esperar
-                    await asyncio.sleep(5)
-                    continue
-                
-                task = json.loads(task_data)
-                print(f"[INFO] Procesando tarea: {task['id']}")
-                
-                # Actualizar estado a "procesando"
-                await self.update_task_status(task['id'], 'processing', 'Iniciando scraping...', 10)
+                # Reencolar para que otro worker la retome sin esperar al reclamo
+                await self.stream.requeue(entry_id, task_data)
+                print(f"[INFO] Tarea interrumpida {entry_id} devuelta al stream")
+            except Exception as e:
+                # Queda pendiente y será reclamada tras SCRAPER_CLAIM_IDLE_MS
+                print(f"ERROR: No se pudo devolver la tarea al stream: {e}")
+    
+    async def _run_task(self, entry_id, task_data):
+        """
+        Ejecuta una tarea de forma aislada y libera su slot al terminar.
+
+        La entrada se confirma cuando la tarea termina de forma definitiva. Si el
+        envío al backend falla y los lotes no pudieron guardarse en el outbox,
+        queda pendiente para ser reclamada y reintentada.
+        """
+        task = None
+        acknowledge = True
+        try:
+            task = json.loads(task_data)
+            print(f"[INFO] Procesando tarea: {task['id']}")
+            
+            # Actualizar estado a "procesando"
+            await self.update_task_status(task['id'], 'processing', 'Iniciando scraping...', 10)
+            
+            try:
+                # Ejecutar scraping
+                result = await self.execute_scraping(task)
                 
-                try:
-                    # Ejecutar scraping
-                    result = await self.execute_scraping(task)
-                    
-                    if result['success']:
-                        # Actualizar estado a "completado"
-                        await self.update_task_status(task['id'], 'completed', 'Scraping completado', 100, result)
-                        print(f"[OK] Tarea {task['id']} completada exitosamente")
-                    else:
-                        # Actualizar estado a "fallido"
-                        error_message = result.get('error', 'Error desconocido')
-                        await self.update_task_status(task['id'], 'failed', error_message, 0)
-                        print(f"ERROR: Tarea {task['id']} falló: {error_message}")
-                        
-                except Exception as scraping_error:
-                    # Error crítico durante el scraping
-                    error_message = f"Error crítico: {str(scraping_error)}"
+                if result.get('cancelled'):
+                    await self.update_task_status(task['id'], 'cancelled', 'Tarea cancelada por el usuario', 0)
+                    print(f"[INFO] Tarea {task['id']} cancelada")
+                elif result['success'] and result.get('backend_queued', False) and not result.get('backend_synced', False):
+                    # Los lotes pendientes quedaron en el outbox: no hace falta repetir el login
+                    await self.update_task_status(
+                        task['id'], 'completed',
+                        'Scraping completado, los movimientos se enviarán cuando el backend responda', 100, result
+                    )
+                    print(f"[OK] Tarea {task['id']} completada, movimientos en el outbox")
+                elif result['success'] and not result.get('backend_synced', False):
+                    # El scraping terminó pero los movimientos no llegaron al backend
+                    acknowledge = False
+                    await self.update_task_status(
+                        task['id'], 'processing',
+                        'No se pudieron enviar los movimientos, la tarea se reintentará', 90
+                    )
+                    print(f"[WARNING] Tarea {task['id']} sin confirmar: envío al backend fallido")
+                elif result['success'] and result.get('backend_rejected'):
+                    # Un rechazo definitivo no se arregla repitiendo el scraping: se informa y se confirma
+                    await self.update_task_status(
+                        task['id'], 'completed',
+                        f"Scraping completado, el backend rechazó {result['backend_rejected']} movimientos", 100, result
+                    )
+                    print(f"[WARNING] Tarea {task['id']} completada con {result['backend_rejected']} movimientos rechazados")
+                elif result['success']:
+                    # Actualizar estado a "completado"
+                    await self.update_task_status(task['id'], 'completed', 'Scraping completado', 100, result)
+                    print(f"[OK] Tarea {task['id']} completada exitosamente")
+                else:
+                    # Actualizar estado a "fallido"
+                    error_message = result.get('error', 'Error desconocido')
                     await self.update_task_status(task['id'], 'failed', error_message, 0)
-                    print(f"ERROR: Error crítico en tarea {task['id']}: {scraping_error}")
-                    import traceback
-                    traceback.print_exc()
-                
-            except json.JSONDecodeError as json_error:
-                print(f"ERROR: Error decodificando JSON de tarea: {json_error}")
-                await asyncio.sleep(5)
-            except Exception as e:
-                print(f"ERROR: Error procesando tarea: {e}")
-                # Si tenemos el ID de la tarea, actualizar su estado
-                if 'task' in locals() and 'id' in task:
-                    try:
-                        await self.update_task_status(task['id'], 'failed', f"Error del procesador: {str(e)}", 0)
-                    except Exception as update_error:
-                        print(f"ERROR: No se pudo actualizar estado de tarea fallida: {update_error}")
-                await asyncio.sleep(10)
+                    print(f"ERROR: Tarea {task['id']} falló: {error_message}")
+                    
+            except asyncio.CancelledError:
+                raise
+            except Exception as scraping_error:
+                # Error crítico durante el scraping
+                error_message = f"Error crítico: {str(scraping_error)}"
+                await self.update_task_status(task['id'], 'failed', error_message, 0)
+                print(f"ERROR: Error crítico en tarea {task['id']}: {scraping_error}")
+                import traceback
+                traceback.print_exc()
+            
+        except json.JSONDecodeError as json_error:
+            print(f"ERROR: Error decodificando JSON de tarea: {json_error}")
+        except asyncio.CancelledError:
+            # drain() decide qué hacer con la entrada interrumpida
+            acknowledge = False
+            raise
+        except Exception as e:
+            print(f"ERROR: Error procesando tarea: {e}")
+            # Si tenemos el ID de la tarea, actualizar su estado
+            if task and 'id' in task:
+                try:
+                    await self.update_task_status(task['id'], 'failed', f"Error del procesador: {str(e)}", 0)
+                except Exception as update_error:
+                    print(f"ERROR: No se pudo actualizar estado de tarea fallida: {update_error}")
+        finally:
+            if acknowledge:
+                try:
+                    await self.stream.ack(entry_id)
+                except Exception as ack_error:
+                    print(f"ERROR: No se pudo confirmar la entrada {entry_id}: {ack_error}")
+            self._slots.release()
     
     async def execute_scraping(self, task):
         """Ejecuta el scraping usando tu scraper actual"""
         try:
             # Configurar el scraper según el entorno
-            redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
-            
-            # Parse URL correctamente usando urllib.parse
-            parsed_url = urlparse(redis_url)
-            redis_host = parsed_url.hostname or 'localhost'
-            redis_port = parsed_url.port or 6379
-            
             config = ScraperConfig(
-                redis_host=redis_host,
-                redis_port=redis_port,
-                debug_mode=True
+                debug_mode=True,
+                extraction_mode=os.getenv('SCRAPER_EXTRACTION_MODE', 'dom'),
+                account_concurrency=int(os.getenv('SCRAPER_ACCOUNT_TABS', '1'))
             )
             
-            scraper = BancoEstadoScraper(config)
+            scraper = BancoEstadoScraper(
+                config,
+                redis_client=self.redis_client,
+                browser_pool=self.browser_pool,
+                session_cache=self.session_cache,
+                companies_catalog=self.companies_catalog,
+                backend_uploader=self.backend_uploader,
+                outbox=self.outbox,
+                watermarks=self.watermarks,
+                # Un deduplicador por tarea: su conjunto en memoria es de la ejecución
+                deduplicator=MovementDeduplicator(self.redis_client),
+                # Vigila scraper:cancel:{id} mientras corre la tarea
+                cancelacion=CancellationToken(self.redis_client, task['id'])
+            )
             
             # Usar el método run del scraper que ya tiene toda la lógica
             result = await scraper.run(task['id'], task)
@@ -139,39 +353,17 @@ class ScraperIntegration:
             return {'success': False, 'error': str(e)}
     
     async def update_task_status(self, task_id, status, message, progress, result=None):
-        """Actualiza el estado de una tarea en Redis"""
+        """Actualiza el estado de una tarea en Redis y lo publica al backend"""
         max_retries = 3
         retry_delay = 1  # segundos
         
         for attempt in range(max_retries):
             try:
-                # Obtener tarea actual
-                task_data = self.redis_client.hget(f'scraper:tasks:{task_id}', 'data')
-                if task_data:
-                    task = json.loads(task_data)
-                else:
-                    task = {'id': task_id}
-                
-                # Actualizar campos
-                task.update({
-                    'status': status,
-                    'message': message,
-                    'progress': progress,
-                    'updated_at': datetime.now().isoformat()
-                })
-                
-                # Solo agregar resultado si se proporciona
-                if result is not None:
-                    task['result'] = result
-                
                 # Si hay error, agregarlo
-                if status == 'failed' and result is None:
-                    task['error'] = message
-                
-                # Guardar en Redis
-                self.redis_client.hset(f'scraper:tasks:{task_id}', 'data', json.dumps(task))
-                
-                print(f"[INFO] Tarea {task_id}: {status} - {message} ({progress}%)")
+                error = message if status == 'failed' and result is None else None
+                # Campos separados y espejo en `data`, en una sola transacción
+                if await set_task_status(self.redis_client, task_id, status, message, progress, error, result):
+                    print(f"[INFO] Tarea {task_id}: {status} - {message} ({progress}%)")
                 return  # Éxito, salir del bucle de reintentos
                 
             except redis.ConnectionError as redis_error:
@@ -194,12 +386,20 @@ async def main():
     """Función principal"""
     integration = ScraperIntegration()
     
+    # Detención ordenada ante SIGTERM (Railway) o Ctrl+C
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, integration.request_stop)
+        except NotImplementedError:
+            pass
+    
     print("[SCRAPER] Iniciando integración del scraper...")
     print("[INFO] Conectando a Redis...")
     
     try:
         # Verificar conexión a Redis
-        integration.redis_client.ping()
+        await integration.redis_client.ping()
         print("[OK] Conexión a Redis exitosa")
         
         # Procesar tareas
@@ -211,6 +411,11 @@ async def main():
         print("\n[INFO] Deteniendo procesador de tareas...")
     except Exception as e:
         print(f"ERROR: Error crítico: {e}")
+    finally:
+        await integration.browser_pool.close()
+        await integration.backend_uploader.close()
+        integration.outbox.close()
+        await close_redis()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
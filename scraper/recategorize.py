@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Recategorización offline de resultados guardados
+
+Cuando cambia companies.json, los movimientos ya sincronizados mantienen su
+categoría anterior y la única forma de refrescarlos era otro scraping. Este
+comando recorre los resultados guardados (los `results/banco_estado_*.json`
+que escribe `guardar_en_json`, o los resultados de las tareas en Redis), los
+vuelve a categorizar con el catálogo actual en un pool de procesos y envía
+al backend (`/scraper/recategorize`), por lotes, solo los movimientos cuya
+categoría nueva difiere de la automática que tenían, con ambas. El backend
+solo cambia los movimientos que siguen con esa categoría automática (no los
+que el usuario recategorizó a mano).
+
+Es reanudable: cada documento terminado queda en un checkpoint junto a la
+huella del catálogo; si se interrumpe, la siguiente ejecución sigue donde
+quedó, y si el catálogo cambió entre medio, empieza de nuevo.
+
+Uso (desde scraper/):
+    python recategorize.py                          # results/banco_estado_*.json
+    python recategorize.py --source redis           # scraper:tasks:*
+    python recategorize.py --dry-run --workers 4
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import redis.asyncio as aioredis
+
+from utils.backend_uploader import DELIVERED, REJECTED, BackendUploader, idempotency_key
+from utils.batch_categorizer import categorize_batch
+from utils.companies_catalog import CompaniesCatalog
+from utils.redis_pool import close_redis, get_redis
+from utils.task_status import load_task_result, task_key
+
+RECATEGORIZE_PATH = '/scraper/recategorize'
+PROGRESS_INTERVAL = 5
+
+# (id del documento, user_id, movimientos revisados, cambios)
+ResultadoDocumento = Tuple[str, Any, int, List[Dict[str, str]]]
+
+# Catálogo de cada proceso del pool (se recibe una sola vez al iniciar el proceso)
+_companies: List[dict] = []
+
+
+def _init_worker(companies: List[dict]) -> None:
+    global _companies
+    _companies = companies
+
+
+def monto_js(monto: Any) -> Any:
+    """
+    Monto como lo interpola JavaScript: guardar_en_json deja todos los montos
+    como float y `-4050.0` en Python es `-4050` en el backend.
+    """
+    if isinstance(monto, float) and monto.is_integer():
+        return int(monto)
+    return monto
+
+
+def unique_key(movimiento: dict) -> str:
+    """Misma clave que arma el backend en convertScraperMovement (metadata.uniqueKey)"""
+    return (f"{movimiento.get('fecha')}_{movimiento.get('descripcion')}_"
+            f"{monto_js(movimiento.get('monto'))}_{movimiento.get('cuenta')}")
+
+
+def total_movimientos(documento: dict) -> int:
+    procesados = documento.get('processed_movements') or []
+    if procesados:
+        return len(procesados)
+    return sum(len(cuenta.get('movimientos') or []) for cuenta in documento.get('cuentas') or [])
+
+
+def recategorizar(source_id: str, documento: dict) -> ResultadoDocumento:
+    """Cambios de categoría de un resultado guardado con el catálogo del proceso"""
+    # La categoría automática solo se guarda en processed_movements: los
+    # movimientos crudos de `cuentas` no la tienen
+    movimientos = [
+        movimiento for movimiento in documento.get('processed_movements') or []
+        if 'categoria_automatica' in movimiento and isinstance(movimiento.get('descripcion'), str)
+    ]
+    total = total_movimientos(documento)
+    if total and not movimientos:
+        # Marcarlo como procesado sin revisar nada ocultaría el problema
+        raise ValueError(f"tiene {total} movimientos pero ninguno con categoría automática que revisar")
+
+    resultado = categorize_batch(
+        [movimiento['descripcion'] for movimiento in movimientos],
+        [movimiento.get('monto') or 0 for movimiento in movimientos],
+        _companies,
+    )
+    # Solo los que cambian: reenviar el resto sería subir todo el historial en cada ejecución
+    cambios = [
+        {'uniqueKey': unique_key(movimiento), 'from': movimiento['categoria_automatica'], 'to': nueva}
+        for movimiento, nueva in zip(movimientos, resultado.categorias)
+        if nueva != movimiento['categoria_automatica']
+    ]
+    return source_id, documento.get('user_id'), len(movimientos), cambios
+
+
+def recategorizar_archivo(path: str) -> ResultadoDocumento:
+    """Lee el archivo dentro del proceso del pool para no pasar su contenido entre procesos"""
+    with open(path, encoding='utf-8') as f:
+        return recategorizar(path, json.load(f))
+
+
+class Checkpoint:
+    """Documentos ya procesados con una versión del catálogo"""
+
+    def __init__(self, path: str, catalog_hash: str, reset: bool = False):
+        self.path = path
+        self.catalog_hash = catalog_hash
+        self.done: Set[str] = set()
+        if reset:
+            return
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        if data.get('catalog') != catalog_hash:
+            print("[INFO] El catálogo cambió desde el último checkpoint, se empieza de nuevo")
+            return
+        self.done = set(data.get('done') or [])
+        print(f"[INFO] Reanudando: {len(self.done)} documentos ya procesados")
+
+    def mark(self, source_id: str) -> None:
+        self.done.add(source_id)
+        self.save()
+
+    def save(self) -> None:
+        """Escritura atómica: un corte a mitad no corrompe el checkpoint"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'catalog': self.catalog_hash, 'done': sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+
+class Recategorizer:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.uploader = BackendUploader()
+        self.redis_client: Optional[aioredis.Redis] = None
+        self.checkpoint: Optional[Checkpoint] = None
+        # Progreso
+        self.total = 0
+        self.procesados = 0
+        self.movimientos = 0
+        self.cambios = 0
+        self.actualizados = 0
+        self.enviados = 0
+        self.rechazados = 0
+        self.omitidos = 0
+        self.fallidos = 0
+        self._inicio = time.monotonic()
+        self._ultimo_reporte = 0.0
+
+    async def run(self) -> int:
+        catalog = CompaniesCatalog()
+        # El catálogo vigente en el backend, no la copia en disco: es el que cambió
+        if not await catalog.refresh():
+            print("[WARNING] No se pudo obtener el catálogo del backend, se usa la última copia guardada")
+        companies = await catalog.get()
+        if not companies:
+            print("ERROR: No hay catálogo de empresas disponible")
+            return 1
+        catalog_hash = hashlib.sha256(json.dumps(companies, sort_keys=True).encode()).hexdigest()[:16]
+        self.checkpoint = Checkpoint(self.args.checkpoint, catalog_hash, reset=self.args.reset)
+
+        try:
+            sources = await self.list_sources()
+            pendientes = [source for source in sources if source not in self.checkpoint.done]
+            self.total = len(pendientes)
+            print(f"[INFO] {len(sources)} documentos encontrados, {self.total} por procesar "
+                  f"({self.args.workers} procesos, {len(companies)} empresas)")
+            if not pendientes:
+                return 0
+            with ProcessPoolExecutor(max_workers=self.args.workers, initializer=_init_worker,
+                                     initargs=(companies,)) as pool:
+                ok = await self.process(pool, pendientes)
+        finally:
+            await self.uploader.close()
+            if self.redis_client is not None:
+                await close_redis()
+
+        self.report(final=True)
+        if not ok:
+            print("[WARNING] El backend no respondió; vuelve a ejecutar el comando para continuar")
+            return 1
+        if self.fallidos:
+            print(f"ERROR: {self.fallidos} documentos no se pudieron recategorizar")
+            return 1
+        return 0
+
+    async def list_sources(self) -> List[str]:
+        if self.args.source == 'files':
+            return sorted(glob.glob(self.args.glob))
+        self.redis_client = get_redis()
+        sources = []
+        async for key in self.redis_client.scan_iter(match='scraper:tasks:*', count=500):
+            if key.count(':') == 2:
+                sources.append(f"redis:{key.rsplit(':', 1)[1]}")
+        return sorted(sources)
+
+    async def load_task(self, source_id: str) -> Optional[dict]:
+        """Resultado de una tarea guardada en Redis, con el user_id de la tarea"""
+        task_id = source_id.split(':', 1)[1]
+        raw = await self.redis_client.hget(task_key(task_id), 'data')
+        if not raw:
+            return None
+        task = json.loads(raw)
+        result = task.get('result')
+        if isinstance(result, dict) and result.get('result_key'):
+            # La tarea solo guarda un resumen; el resultado completo va aparte
+            result = await load_task_result(self.redis_client, task_id)
+        if not isinstance(result, dict) or not (result.get('cuentas') or result.get('processed_movements')):
+            return None
+        return {
+            'user_id': task.get('user_id'),
+            'cuentas': result.get('cuentas') or [],
+            'processed_movements': result.get('processed_movements') or [],
+        }
+
+    async def submit(self, pool: ProcessPoolExecutor, source_id: str) -> Optional[asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        if self.args.source == 'files':
+            return loop.run_in_executor(pool, recategorizar_archivo, source_id)
+        documento = await self.load_task(source_id)
+        if documento is None:
+            return None
+        return loop.run_in_executor(pool, recategorizar, source_id, documento)
+
+    async def process(self, pool: ProcessPoolExecutor, pendientes: List[str]) -> bool:
+        """Recategoriza con una ventana acotada de documentos en vuelo y envía cada resultado"""
+        ventana = self.args.workers * 2
+        en_vuelo: Dict[asyncio.Future, str] = {}
+        siguiente = 0
+        while siguiente < len(pendientes) or en_vuelo:
+            while siguiente < len(pendientes) and len(en_vuelo) < ventana:
+                source_id = pendientes[siguiente]
+                siguiente += 1
+                future = await self.submit(pool, source_id)
+                if future is None:
+                    # Tarea sin resultado: no hay nada que recategorizar
+                    self.procesados += 1
+                    self.mark_done(source_id)
+                    continue
+                en_vuelo[future] = source_id
+
+            if not en_vuelo:
+                continue
+            terminados, _ = await asyncio.wait(list(en_vuelo), return_when=asyncio.FIRST_COMPLETED)
+            for future in terminados:
+                source_id = en_vuelo.pop(future)
+                try:
+                    resultado = future.result()
+                except Exception as e:
+                    # No se marca en el checkpoint: la próxima ejecución lo vuelve a intentar
+                    print(f"ERROR: No se pudo recategorizar {source_id}: {e}")
+                    self.procesados += 1
+                    self.fallidos += 1
+                    continue
+                if not await self.handle(resultado):
+                    for pendiente in en_vuelo:
+                        pendiente.cancel()
+                    return False
+            self.report()
+        return True
+
+    async def handle(self, resultado: ResultadoDocumento) -> bool:
+        """Envía los cambios de un documento y lo marca en el checkpoint"""
+        source_id, user_id, revisados, cambios = resultado
+        self.procesados += 1
+        self.movimientos += revisados
+        user_id = user_id if user_id is not None else self.args.user_id
+        if user_id is None:
+            # Archivos anteriores a que el resultado guardara el usuario: se reintentan con --user-id
+            print(f"[WARNING] {source_id} no indica el usuario, se omite (usa --user-id)")
+            self.omitidos += 1
+            return True
+
+        self.cambios += len(cambios)
+        rechazados = 0
+        if cambios and not self.args.dry_run:
+            for inicio in range(0, len(cambios), self.args.batch_size):
+                lote = cambios[inicio:inicio + self.args.batch_size]
+                payload = {'userId': int(user_id), 'changes': lote}
+                key = idempotency_key(f"recategorize:{source_id}", lote)
+                status, respuesta = await self.uploader.send_chunk(
+                    payload, key, f"{source_id} [{inicio // self.args.batch_size + 1}]", path=RECATEGORIZE_PATH
+                )
+                if status == REJECTED:
+                    # Los demás lotes del documento se envían igual; el documento queda pendiente
+                    rechazados += len(lote)
+                    continue
+                if status != DELIVERED:
+                    return False
+                self.enviados += len(lote)
+                self.actualizados += ((respuesta or {}).get('stats') or {}).get('actualizados', 0)
+        if rechazados:
+            # Sin checkpoint: la próxima ejecución lo reintenta
+            print(f"ERROR: El backend rechazó {rechazados} cambios de {source_id}")
+            self.rechazados += rechazados
+            self.fallidos += 1
+            return True
+        self.mark_done(source_id)
+        return True
+
+    def mark_done(self, source_id: str) -> None:
+        # Una simulación no cuenta como procesado: la ejecución real debe enviar los cambios
+        if not self.args.dry_run:
+            self.checkpoint.mark(source_id)
+
+    def report(self, final: bool = False) -> None:
+        ahora = time.monotonic()
+        if not final and ahora - self._ultimo_reporte < PROGRESS_INTERVAL:
+            return
+        self._ultimo_reporte = ahora
+        transcurrido = max(ahora - self._inicio, 1e-6)
+        porcentaje = self.procesados * 100 / self.total if self.total else 100
+        etiqueta = "[OK] Terminado" if final else "[INFO] Progreso"
+        print(f"{etiqueta}: {self.procesados}/{self.total} documentos ({porcentaje:.0f}%), "
+              f"{self.movimientos} movimientos, {self.cambios} con categoría nueva, "
+              f"{self.enviados} enviados, {self.rechazados} rechazados, {self.actualizados} actualizados en el backend, "
+              f"{self.omitidos} omitidos, {self.fallidos} fallidos "
+              f"({self.movimientos / transcurrido:.0f} movimientos/s)")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Recategoriza resultados guardados con el catálogo actual")
+    parser.add_argument('--source', choices=('files', 'redis'), default='files',
+                        help="Origen de los resultados (por defecto, archivos JSON)")
+    parser.add_argument('--glob', default='results/banco_estado_*.json',
+                        help="Patrón de archivos de resultados")
+    parser.add_argument('--user-id', type=int, default=None,
+                        help="Usuario para archivos que no lo indican")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Procesos del pool")
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help="Cambios por petición al backend")
+    parser.add_argument('--checkpoint', default='cache/recategorize_checkpoint.json',
+                        help="Archivo de checkpoint para reanudar")
+    parser.add_argument('--reset', action='store_true', help="Ignora el checkpoint existente")
+    parser.add_argument('--dry-run', action='store_true', help="Calcula los cambios sin enviarlos")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(Recategorizer(parse_args()).run()))
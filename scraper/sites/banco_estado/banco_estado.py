@@ -1,6 +1,6 @@
 import json
 import random
-import redis
+from redis.asyncio import Redis
 import os
 import re
 from datetime import datetime
@@ -17,6 +17,7 @@ if project_root not in sys.path:
 
 from scraper.utils.redis_client import get_task, store_result, update_task_status
 from scraper.utils.config import ScraperConfig
+from scraper.utils.redis_pool import get_redis
 from scraper.models.scraper_models import ScraperTask, ScraperResult, ScraperAccount, ScraperMovement
 
 @dataclass
@@ -25,14 +26,10 @@ class Credentials:
     password: str
 
 class BancoEstadoScraper:
-    def __init__(self, config: ScraperConfig):
+    def __init__(self, config: ScraperConfig, redis_client: Optional[Redis] = None):
         self.config = config
-        # Inicializar Redis con la configuración proporcionada
-        self.redis_client = redis.Redis(
-            host=self.config.redis_host, 
-            port=self.config.redis_port, 
-            decode_responses=True
-        )
+        # Cliente del pool compartido del proceso (utils.redis_pool)
+        self.redis_client = redis_client or get_redis()
 
     async def ocultar_ventana(self):
         """
@@ -45,7 +42,7 @@ class BancoEstadoScraper:
         """Ejecuta el scraper"""
         try:
             # Verificar que Redis esté conectado
-            if not self.redis_client.ping():
+            if not await self.redis_client.ping():
                 raise Exception("No se pudo conectar a Redis")
 
             # Extraer credenciales
@@ -54,13 +51,13 @@ class BancoEstadoScraper:
 
             if not rut or not password:
                 print("ERROR: Credenciales incompletas")
-                update_task_status(self.redis_client, task_id, 'failed', 'Credenciales incompletas')
+                await update_task_status(self.redis_client, task_id, 'failed', 'Credenciales incompletas')
                 return None
 
             print("[Scraper BancoEstado iniciado]")
             async with async_playwright() as p:
                 # Iniciar navegador con configuración mejorada
-                update_task_status(self.redis_client, task_id, 'processing', 'Iniciando navegador', 10)
+                await update_task_status(self.redis_client, task_id, 'processing', 'Iniciando navegador', 10)
                 # Configurar directorio para datos persistentes
                 user_data_dir = os.path.join(os.path.dirname(__file__), 'user_data')
                 os.makedirs(user_data_dir, exist_ok=True)
@@ -241,22 +238,22 @@ class BancoEstadoScraper:
 
                 try:
                     # Login con tiempos mejorados
-                    update_task_status(self.redis_client, task_id, 'processing', 'Iniciando sesión', 20)
+                    await update_task_status(self.redis_client, task_id, 'processing', 'Iniciando sesión', 20)
                     await self.login_banco_estado(page, {'rut': rut, 'password': password})
                     await page.wait_for_timeout(random.randint(400, 1200))  # Espera adicional después del login
 
                     # Obtener saldos
-                    update_task_status(self.redis_client, task_id, 'processing', 'Obteniendo saldos', 40)
+                    await update_task_status(self.redis_client, task_id, 'processing', 'Obteniendo saldos', 40)
                     cuentas = await self.extract_cuentas(page)
                     await page.wait_for_timeout(random.randint(400, 1200))
 
                     # Obtener movimientos generales
-                    update_task_status(self.redis_client, task_id, 'processing', 'Obteniendo movimientos generales', 60)
+                    await update_task_status(self.redis_client, task_id, 'processing', 'Obteniendo movimientos generales', 60)
                     movimientos_generales = await self.extract_ultimos_movimientos(page)
                     await page.wait_for_timeout(random.randint(400, 1200))
 
                     # Obtener movimientos por cuenta y actualizar las cuentas
-                    update_task_status(self.redis_client, task_id, 'processing', 'Obteniendo movimientos por cuenta', 70)
+                    await update_task_status(self.redis_client, task_id, 'processing', 'Obteniendo movimientos por cuenta', 70)
                     for i, cuenta in enumerate(cuentas):
                         movs_cuenta = await self.extract_movimientos_cuenta(page, cuenta)
                         cuentas[i] = {
@@ -266,7 +263,7 @@ class BancoEstadoScraper:
                         await page.wait_for_timeout(random.randint(400, 1200))
 
                     # Procesar resultados
-                    update_task_status(self.redis_client, task_id, 'processing', 'Procesando resultados', 80)
+                    await update_task_status(self.redis_client, task_id, 'processing', 'Procesando resultados', 80)
 
                     # Crear el resultado
                     result = {
@@ -282,19 +279,19 @@ class BancoEstadoScraper:
                     }
 
                     # Guardar resultados
-                    store_result(self.redis_client, task_id, result)
+                    await store_result(self.redis_client, task_id, result)
                     print(f"Scraping completado para RUT: {rut}")
 
                     return result
 
                 except Exception as e:
                     print(f"ERROR durante el scraping: {str(e)}")
-                    update_task_status(self.redis_client, task_id, 'failed', str(e))
+                    await update_task_status(self.redis_client, task_id, 'failed', str(e))
                     raise
 
         except Exception as e:
             print(f"ERROR durante el scraping: {str(e)}")
-            update_task_status(self.redis_client, task_id, 'failed', str(e))
+            await update_task_status(self.redis_client, task_id, 'failed', str(e))
             return None
 
     async def stop(self):
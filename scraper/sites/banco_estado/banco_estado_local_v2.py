@@ -5,7 +5,6 @@ Técnicas avanzadas de evasión anti-detección
 """
 import json
 import random
-import redis
 import os
 import re
 import sys
@@ -14,8 +13,38 @@ import time
 from datetime import datetime
 from playwright.async_api import async_playwright
 from dataclasses import dataclass
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 import aiohttp
+from redis.asyncio import Redis
+
+from utils.backend_uploader import BackendUploader, default_uploader
+from utils.cancellation import CancellationToken, TaskCancelled
+from utils.companies_catalog import CompaniesCatalog, default_catalog
+from utils.keyword_matcher import matcher_for
+from utils import movement_normalizer
+from utils.movement_dedup import ORDINAL_FIELD, MovementDeduplicator, fingerprint, numerar_apariciones
+from utils.outbox import Outbox
+from utils.timeline import Timeline, activate, span, timed
+
+from .browser_pool import BrowserPool
+from .resource_policy import ResourcePolicy
+from .session_cache import SessionCache
+from .network_capture import EXTRACTION_MODES, MODE_DOM, MODE_NETWORK, NetworkCapture
+from .table_extractor import TABLA_SELECTORS, extract_rows
+from .watermark import Marca, SyncWatermarks
+from .waits import HumanPacing, settle, wait_for_dom_quiet, wait_for_first, wait_for_page_update
+
+# Tarjetas de productos visibles en el carrusel de home
+SELECTOR_TARJETAS = "app-card-producto:visible, app-card-ahorro:visible"
+
+# Selectores que indican que el login terminó, bien o mal
+LOGIN_OUTCOME_SELECTORS = [
+    "app-carrusel-productos-wrapper",
+    "app-card-producto",
+    "app-ultimos-movimientos-home",
+    "text='ha ocurrido un error'",
+    "text=/clave incorrecta|rut incorrecto|usuario bloqueado|intentos excedidos/i",
+]
 
 @dataclass
 class Credentials:
@@ -24,12 +53,17 @@ class Credentials:
 
 @dataclass
 class ScraperConfig:
-    redis_host: str
-    redis_port: int
     debug_mode: bool = False
     geolocation: Dict[str, float] = None
+    # "dom", "network" o "auto" (red con respaldo en el DOM)
+    extraction_mode: str = MODE_DOM
+    # Pestañas simultáneas para extraer cuentas (1 = secuencial)
+    account_concurrency: int = 1
 
     def __post_init__(self):
+        if self.extraction_mode not in EXTRACTION_MODES:
+            print(f"[WARNING] Modo de extracción desconocido '{self.extraction_mode}', se usa '{MODE_DOM}'")
+            self.extraction_mode = MODE_DOM
         if self.geolocation is None:
             self.geolocation = {
                 "latitude": -33.4489,
@@ -37,13 +71,36 @@ class ScraperConfig:
             }
 
 class BancoEstadoScraper:
-    def __init__(self, config: ScraperConfig):
+    def __init__(self, config: ScraperConfig, redis_client: Optional[Redis] = None,
+                 browser_pool: Optional[BrowserPool] = None,
+                 session_cache: Optional[SessionCache] = None,
+                 companies_catalog: Optional[CompaniesCatalog] = None,
+                 backend_uploader: Optional[BackendUploader] = None,
+                 outbox: Optional[Outbox] = None,
+                 watermarks: Optional[SyncWatermarks] = None,
+                 deduplicator: Optional[MovementDeduplicator] = None,
+                 cancelacion: Optional[CancellationToken] = None):
         self.config = config
-        self.redis_client = redis.Redis(
-            host=self.config.redis_host, 
-            port=self.config.redis_port, 
-            decode_responses=True
-        )
+        # Cliente del pool compartido del proceso (utils.redis_pool); sin él solo hay estado en memoria
+        self.redis_client = redis_client
+        self.browser_pool = browser_pool
+        self.session_cache = session_cache
+        self.companies_catalog = companies_catalog or default_catalog()
+        self.backend_uploader = backend_uploader or default_uploader()
+        # Sin outbox (ejecución aislada) los lotes no enviados solo quedan en el JSON local
+        self.outbox = outbox
+        # Sin marcas (ejecución aislada o SCRAPER_INCREMENTAL=0) se sincroniza todo
+        self.watermarks = watermarks
+        self.marcas: Dict[str, Marca] = {}
+        # Sin Redis solo se descartan los repetidos dentro de la ejecución
+        self.deduplicator = deduplicator or MovementDeduplicator(redis_client)
+        # Sin token de la tarea (ejecución aislada) no hay cancelación externa
+        self.cancelacion = cancelacion or CancellationToken()
+        # Pausas humanas; las esperas de carga no dependen de esta política
+        self.pacing = HumanPacing()
+        # Acceso directo a los movimientos de cada cuenta, por dígitos del número:
+        # posición de su tarjeta en el carrusel y, si la app la expone, su ruta
+        self.accesos_cuentas: Dict[str, Dict[str, Any]] = {}
 
     async def ocultar_ventana(self):
         """
@@ -51,11 +108,13 @@ class BancoEstadoScraper:
         debido a limitaciones de la librería. Se mantiene para compatibilidad futura.
         """
         pass
+    @timed('espera_aleatoria')
     async def espera_aleatoria(self, page):
         """Espera aleatoria más realista"""
         base_time = random.randint(200, 600)  # Más lento para ser más realista
         jitter = random.randint(-50, 50)
         await page.wait_for_timeout(base_time + jitter)
+    @timed('simular_mouse')
     async def simular_movimiento_mouse_natural(self, page):
         """Simula movimientos de mouse más naturales"""
         viewport = page.viewport_size
@@ -67,6 +126,7 @@ class BancoEstadoScraper:
             await page.mouse.move(x, y, steps=random.randint(5, 10))
             await page.wait_for_timeout(random.randint(100, 300))
 
+    @timed('simular_scroll')
     async def simular_scroll_natural(self, page):
         """Simula scroll natural"""
         await page.evaluate("""
@@ -80,6 +140,7 @@ class BancoEstadoScraper:
         """)
         await page.wait_for_timeout(random.randint(500, 800))
 
+    @timed('cerrar_modal')
     async def cerrar_modal_infobar(self, page):
         """Cierra modales de infobar y sidebars"""
         try:
@@ -134,6 +195,7 @@ class BancoEstadoScraper:
         except Exception as e:
             print(f"  [WARNING] Info al intentar cerrar modales: {e}")
 
+    @timed('cerrar_sidebar')
     async def cerrar_sidebar(self, page):
         try:
             sidebar_ids = ["holidayid", "afpid", "promoid", "infoid"]
@@ -182,6 +244,7 @@ class BancoEstadoScraper:
             print(f"[INFO] Info: {str(e)}")
             return False
 
+    @timed('escribir')
     async def type_like_human(self, page, selector, text, delay=None):
         """Simula escritura humana más realista"""
         try:
@@ -226,6 +289,7 @@ class BancoEstadoScraper:
             print(f"ERROR en type_like_human: {e}")
             await page.fill(selector, text)
 
+    @timed('simular_comportamiento')
     async def simular_comportamiento_humano(self, page):
         """Simula comportamiento humano más realista"""
         for _ in range(random.randint(2, 4)):
@@ -242,6 +306,7 @@ class BancoEstadoScraper:
         """)
         await page.wait_for_timeout(random.randint(400, 1200))
 
+    @timed('mostrar_saldos')
     async def mostrar_saldos(self, page):
         try:
             await self.cerrar_sidebar(page)
@@ -454,7 +519,8 @@ class BancoEstadoScraper:
             print(f"ERROR: Error general al extraer info de tarjeta: {e}")
             return None
 
-    async def extract_cuentas(self, page):
+    @timed('extract_cuentas')
+    async def extract_cuentas(self, page, captura: Optional[NetworkCapture] = None):
         print("Extrayendo cuentas...")
         await self.cerrar_modal_infobar(page)
         
@@ -469,12 +535,22 @@ class BancoEstadoScraper:
                 print("Encontramos un carrusel alternativo")
             except Exception as e2:
                 print(f"[WARNING] No se encontró ningún carrusel: {e2}")
-                
+
+        if captura:
+            # El carrusel se dibuja con la respuesta de productos, que ya debió llegar
+            await captura.flush()
+            cuentas = captura.cuentas()
+            if cuentas or self.config.extraction_mode == MODE_NETWORK:
+                for i, cuenta in enumerate(cuentas, 1):
+                    print(f" Cuenta #{i}: {cuenta['tipo']} - {cuenta['numero']} - Saldo: ${cuenta['saldo']:,.0f} (red)")
+                return cuentas
+            print("[INFO] No se reconocieron cuentas en la red, se extraen del DOM")
+
         await self.cerrar_sidebar(page)
         await self.mostrar_saldos(page)
         tarjetas_encontradas = False
         selectores_tarjetas = [
-            "app-card-producto:visible, app-card-ahorro:visible",
+            SELECTOR_TARJETAS,
             "div[class*='card']:visible",
             "div.carousel-item:visible",
             "div.card:visible",
@@ -483,10 +559,11 @@ class BancoEstadoScraper:
         
         for selector in selectores_tarjetas:
             try:
-                await page.wait_for_selector(selector, timeout=30000)  # AUMENTADO: 15s -> 30s
-                print(f"[OK] Tarjetas encontradas con selector: {selector}")
-                tarjetas_encontradas = True
-                break
+                with span('selector', grupo='tarjetas', selector=selector):
+                    await page.wait_for_selector(selector, timeout=30000)  # AUMENTADO: 15s -> 30s
+                    print(f"[OK] Tarjetas encontradas con selector: {selector}")
+                    tarjetas_encontradas = True
+                    break
             except Exception:
                 print(f"[WARNING] No se encontraron tarjetas con selector: {selector}")
                 continue
@@ -496,14 +573,17 @@ class BancoEstadoScraper:
         
         cuentas = []
         total_cuentas = 0
+        pagina_carrusel = 0
         for selector in selectores_tarjetas:
             try:
                 cards = await page.locator(selector).all()
                 if not cards:
                     continue
-                for card in cards:
+                for indice, card in enumerate(cards):
                     cuenta_info = await self.extraer_info_tarjeta(card)
                     if cuenta_info:
+                        # Posición de la tarjeta para llegar directo a sus movimientos
+                        self.registrar_acceso(cuenta_info.get("numero"), selector, pagina_carrusel, indice)
                         cuenta_formateada = {
                             "numero": cuenta_info.get("numero", ""),
                             "tipo": cuenta_info.get("nombre", ""),
@@ -516,11 +596,13 @@ class BancoEstadoScraper:
                             cuentas.append(cuenta_formateada)
                             total_cuentas += 1
                             print(f" Cuenta #{total_cuentas}: {cuenta_formateada['tipo']} - {cuenta_formateada['numero']} - Saldo: ${cuenta_formateada['saldo']:,.0f}")
+                await self.cancelacion.check()
                 try:
                     next_button = page.locator("button[aria-label='Siguiente']")
                     if await next_button.count() > 0 and await next_button.is_visible():
                         await next_button.click()
-                        await page.wait_for_timeout(2000)  # Esperar a que carguen las nuevas tarjetas
+                        await wait_for_dom_quiet(page)  # Esperar a que se rendericen las nuevas tarjetas
+                        pagina_carrusel += 1
                     else:
                         break  # No hay más tarjetas para ver
                 except Exception as e:
@@ -594,277 +676,387 @@ class BancoEstadoScraper:
         print(f"[OK] Se extrajeron {len(cuentas)} cuentas exitosamente")
         return cuentas
 
-    async def extract_movimientos_cuenta(self, page, cuenta_info):
-        """Extrae los movimientos de una cuenta específica"""
+    def clave_cuenta(self, numero: Optional[str]) -> str:
+        """Clave de `accesos_cuentas`: solo los dígitos del número de cuenta"""
+        return re.sub(r'\D', '', numero or '')
+
+    def registrar_acceso(self, numero: Optional[str], selector: str, pagina: int, indice: int):
+        """Recuerda dónde está la tarjeta de una cuenta en el carrusel"""
+        clave = self.clave_cuenta(numero)
+        if clave:
+            acceso = self.accesos_cuentas.setdefault(clave, {})
+            acceso.update({"selector": selector, "pagina": pagina, "indice": indice})
+
+    @timed('ubicar_tarjeta')
+    async def ubicar_tarjeta(self, page, cuenta_info):
+        """
+        Retorna la tarjeta de la cuenta en el carrusel de home. Usa la posición
+        registrada por extract_cuentas (un solo parseo para confirmarla) y solo
+        si cambió recorre las tarjetas visibles.
+        """
+        await self.verificar_y_volver_home(page)
+        await wait_for_first(page, ["app-carrusel-productos-wrapper", "app-carousel-productos"], timeout=15000)
+        await self.cerrar_modal_infobar(page)
+        await self.cerrar_sidebar(page)
+
+        carrusel = page.locator("app-carousel-productos")  # Cambiado a selector original
+        if await carrusel.count() == 0:
+            carrusel = page.locator("app-carrusel-productos-wrapper")
+            if await carrusel.count() == 0:
+                raise Exception("No se encontró el carrusel de productos")
+
+        pagina = 0
+        acceso = self.accesos_cuentas.get(self.clave_cuenta(cuenta_info.get('numero')))
+        if acceso and "indice" in acceso:
+            for _ in range(acceso["pagina"]):
+                next_button = page.locator("button[aria-label='Siguiente']")
+                if await next_button.count() == 0 or not await next_button.is_visible():
+                    break
+                await next_button.click()
+                await wait_for_dom_quiet(page)
+                pagina += 1
+            tarjeta = page.locator(acceso["selector"]).nth(acceso["indice"])
+            info_tarjeta = await self.extraer_info_tarjeta(tarjeta)
+            if info_tarjeta and self.mismo_numero(info_tarjeta.get('numero'), cuenta_info.get('numero')):
+                print(f"  [OK] Tarjeta encontrada: {info_tarjeta.get('nombre')}")
+                return tarjeta
+            print("  [INFO] La tarjeta cambió de posición, se busca en el carrusel")
+
+        tarjetas = page.locator(SELECTOR_TARJETAS)
+        num_tarjetas = await tarjetas.count()
+        for i in range(num_tarjetas):
+            tarjeta = tarjetas.nth(i)
+            info_tarjeta = await self.extraer_info_tarjeta(tarjeta)
+            if not info_tarjeta:
+                continue
+            self.registrar_acceso(info_tarjeta.get('numero'), SELECTOR_TARJETAS, pagina, i)
+            if self.mismo_numero(info_tarjeta.get('numero'), cuenta_info.get('numero')):
+                print(f"  [OK] Tarjeta encontrada: {info_tarjeta.get('nombre')}")
+                return tarjeta
+        return None
+
+    @timed('abrir_movimientos')
+    async def abrir_movimientos(self, page, cuenta_info, captura: Optional[NetworkCapture] = None) -> Optional[int]:
+        """
+        Abre la página de movimientos de la cuenta con una sola navegación: por
+        la ruta directa si ya se conoce o con un click en su tarjeta. Retorna
+        la marca de la captura de red previa a la navegación, o None si no se pudo.
+        """
+        clave = self.clave_cuenta(cuenta_info.get('numero'))
+        acceso = self.accesos_cuentas.get(clave, {})
+        if acceso.get("url"):
+            print("  [INFO] Navegando directo a los movimientos de la cuenta")
+            desde = captura.mark() if captura else 0
+            await page.goto(acceso["url"], wait_until="domcontentloaded")
+            await settle(page)
+            return desde
+
+        tarjeta = await self.ubicar_tarjeta(page, cuenta_info)
+        if tarjeta is None:
+            print("  [WARNING] No se encontró la tarjeta de la cuenta")
+            return None
+        boton_movs = tarjeta.locator("button:has-text('Movimientos')")
+        if await boton_movs.count() == 0:
+            boton_movs = tarjeta.locator("button:has-text('Ver Movimientos')")
+        if await boton_movs.count() == 0:
+            print("  [WARNING] No se encontró el botón de movimientos")
+            return None
+
+        desde = captura.mark() if captura else 0
+        await boton_movs.click()
+        print(" Esperando carga de página de movimientos...")
+        await settle(page)
+        # Si la aplicación usa una ruta propia por cuenta, la próxima vez se navega directo
+        if clave and clave in re.sub(r'\D', '', page.url):
+            self.accesos_cuentas.setdefault(clave, {})["url"] = page.url
+        return desde
+
+    async def extract_movimientos_cuenta(self, page, cuenta_info, captura: Optional[NetworkCapture] = None,
+                                         propagar_errores: bool = False):
+        """
+        Extrae los movimientos de una cuenta específica. Con `captura` se usan
+        las respuestas JSON del banco y el DOM queda como respaldo (modo auto).
+        Con `propagar_errores` los fallos se lanzan en vez de retornar lo extraído
+        hasta el momento (lo usa la extracción en pestañas para reintentar).
+        """
         movimientos = []
+        marca = self.marcas.get(self.clave_cuenta(cuenta_info.get('numero')))
+        # Apariciones de cada huella en la fecha de la marca, acumuladas entre páginas
+        vistos_marca: Dict[str, int] = {}
+        # Apariciones de cada movimiento en la cuenta, para el ordinal de su huella
+        apariciones: Dict[Tuple[Any, Any, Any], int] = {}
         try:
             print(f"\n Extrayendo movimientos para cuenta: {cuenta_info.get('nombre', 'N/A')} ({cuenta_info.get('numero', 'N/A')})")
-            await self.verificar_y_volver_home(page)
-            await page.wait_for_timeout(3000)  # AUMENTADO: 2s -> 3s
+            await self.cancelacion.check()
+            desde = await self.abrir_movimientos(page, cuenta_info, captura)
+            if desde is None:
+                if propagar_errores:
+                    raise Exception("No se pudo abrir la página de movimientos")
+                return movimientos
             await self.cerrar_modal_infobar(page)
             await self.cerrar_sidebar(page)
-
-            carrusel = page.locator("app-carousel-productos")  # Cambiado a selector original
-            if await carrusel.count() == 0:
-                carrusel = page.locator("app-carrusel-productos-wrapper")
-                if await carrusel.count() == 0:
-                    raise Exception("No se encontró el carrusel de productos")
-            tarjetas = page.locator("app-card-producto:visible, app-card-ahorro:visible")
-            num_tarjetas = await tarjetas.count()
-            for i in range(num_tarjetas):
-                tarjeta = tarjetas.nth(i)
-                info_tarjeta = await self.extraer_info_tarjeta(tarjeta)
-                if info_tarjeta and info_tarjeta.get('numero') == cuenta_info.get('numero'):
-                    print(f"  [OK] Tarjeta encontrada: {info_tarjeta.get('nombre')}")
-                    boton_movs = tarjeta.locator("button:has-text('Movimientos')")
-                    if await boton_movs.count() == 0:
-                        boton_movs = tarjeta.locator("button:has-text('Ver Movimientos')")
-                    if await boton_movs.count() > 0:
-                        await boton_movs.click()
-                        print(" Esperando carga de página de movimientos...")
-                        await page.wait_for_load_state("networkidle", timeout=10000)  # AUMENTADO: 7s -> 10s
-                        await page.wait_for_timeout(4000)  # AUMENTADO: 3s -> 4s
-                        await self.cerrar_modal_infobar(page)
-                        await self.cerrar_sidebar(page)
-                        try:
-                            print(" Buscando tabla de movimientos...")
-                            # Lista de selectores para la tabla de movimientos
-                            tabla_selectors = [
-                                "app-listado-movimientos table",
-                                "div[class*='movimientos'] table",
-                                "app-movimientos table",
-                                ".tabla-movimientos",
-                                "table.ag-table",
-                                "table.movimientos-table",
-                                "div[role='grid']",
-                                "div.ag-body-viewport",
-                                "div.ag-center-cols-container"
-                            ]
-                            
-                            tabla_movs = None
-                            for selector in tabla_selectors:
-                                tabla = page.locator(selector)
-                                if await tabla.count() > 0 and await tabla.is_visible():
-                                    print(f"    [OK] Tabla encontrada con selector: {selector}")
-                                    tabla_movs = tabla
-                                    break
+            if captura:
+                # La grilla se dibuja con la respuesta XHR: cuando aparece, el JSON ya llegó
+                await wait_for_first(page, TABLA_SELECTORS + ["table"], timeout=15000)
+                await captura.flush()
+                movimientos = captura.movimientos(desde)
+                if movimientos and captura.paginado(desde):
+                    # La red solo trae las páginas que la aplicación pidió: el resto se pagina por el DOM
+                    print(f"  [INFO] La respuesta de red está paginada ({len(movimientos)} movimientos), se extraen del DOM")
+                    movimientos = []
+                elif movimientos or self.config.extraction_mode == MODE_NETWORK:
+                    print(f"  [OK] {len(movimientos)} movimientos obtenidos de la respuesta de red")
+                    numerar_apariciones(movimientos, apariciones)
+                    if marca:
+                        movimientos, conocidos = marca.filtrar(movimientos)
+                        if conocidos:
+                            print(f"  [INFO] Sincronización incremental: {len(movimientos)} nuevos, {conocidos} ya sincronizados")
+                    return movimientos
+                else:
+                    print("  [INFO] No se reconocieron movimientos en la red, se extraen del DOM")
+            try:
+                print(" Buscando tabla de movimientos...")
+                await wait_for_first(page, TABLA_SELECTORS + ["table"], timeout=15000)
+                tabla_movs = None
+                for selector in TABLA_SELECTORS:
+                    with span('selector', grupo='tabla', selector=selector):
+                        tabla = page.locator(selector)
+                        if await tabla.count() > 0 and await tabla.is_visible():
+                            print(f"    [OK] Tabla encontrada con selector: {selector}")
+                            tabla_movs = tabla
+                            break
                             
-                            if not tabla_movs:
-                                # Intentar encontrar cualquier tabla visible
-                                todas_tablas = page.locator("table")
-                                num_tablas = await todas_tablas.count()
-                                for i in range(num_tablas):
-                                    tabla = todas_tablas.nth(i)
-                                    if await tabla.is_visible():
-                                        print("    [OK] Tabla encontrada usando selector genérico")
-                                        tabla_movs = tabla
-                                        break
+                if not tabla_movs:
+                    # Intentar encontrar cualquier tabla visible
+                    todas_tablas = page.locator("table")
+                    num_tablas = await todas_tablas.count()
+                    for i in range(num_tablas):
+                        tabla = todas_tablas.nth(i)
+                        if await tabla.is_visible():
+                            print("    [OK] Tabla encontrada usando selector genérico")
+                            tabla_movs = tabla
+                            break
                             
-                            if not tabla_movs:
-                                raise Exception("No se encontró la tabla de movimientos")
+                if not tabla_movs:
+                    raise Exception("No se encontró la tabla de movimientos")
                             
-                            print("    [OK] Tabla de movimientos cargada")
-                            pagina = 1
-                            while pagina <= 10:  # Límite de 10 páginas
-                                print(f" Procesando página {pagina}")
-                                await page.wait_for_timeout(2000)  # AUMENTADO: 1s -> 2s
-                                try:
-                                    # Lista de selectores para las filas
-                                    fila_selectors = [
-                                        "tbody tr",
-                                        "div[role='row']",
-                                        ".ag-row",
-                                        "div[class*='row']"
-                                    ]
-                                    
-                                    filas = None
-                                    for selector in fila_selectors:
-                                        filas_temp = await tabla_movs.locator(selector).all()
-                                        if filas_temp:
-                                            print(f"      [OK] Filas encontradas con selector: {selector}")
-                                            filas = filas_temp
-                                            break
-                                    
-                                    if not filas:
-                                        print("      [WARNING] No se encontraron filas en la tabla")
-                                        break
-                                    
-                                    for fila in filas:
-                                        try:
-                                            # Lista de selectores para las columnas
-                                            fecha_selectors = [
-                                                "td[role='cell']:nth-child(2) p",
-                                                "td[role='cell'] div.contentText p",
-                                                "div[col-id='fecha'] p",
-                                                ".contentText p",
-                                                "p.ng-star-inserted",
-                                                "td p"
-                                            ]
-                                            desc_selectors = [
-                                                "td[role='cell']:nth-child(3) button",
-                                                "td[role='cell'] div.contentText.largoDescripcition button",
-                                                ".contentText.largoDescripcition button",
-                                                "button.msd-button--link"
-                                            ]
-                                            monto_selectors = [
-                                                "td[role='cell']:nth-child(5) p.amountsTransferClp span",
-                                                "td[role='cell'] div.contentText p.amountsTransferClp span",
-                                                ".contentText p.amountsTransferClp span",
-                                                "p.amountsTransferClp span"
-                                            ]
-                                            
-                                            fecha = None
-                                            descripcion = None
-                                            monto_str = None
-                                            es_cargo = False
-                                            
-                                            # Intentar obtener fecha
-                                            for selector in fecha_selectors:
-                                                try:
-                                                    fecha_el = fila.locator(selector)
-                                                    if await fecha_el.count() > 0:
-                                                        fecha_text = await fecha_el.text_content()
-                                                        if fecha_text and fecha_text.strip():
-                                                            fecha = fecha_text.strip()
-                                                            # Verificar si la fecha tiene el formato correcto (dd/mm/yyyy)
-                                                            if re.match(r'\d{2}/\d{2}/\d{4}', fecha):
-                                                                break
-                                                except Exception:
-                                                    continue
-                                            
-                                            # Si no se encontró la fecha, intentar extraerla del HTML
-                                            if not fecha:
-                                                try:
-                                                    html = await fila.evaluate("el => el.innerHTML")
-                                                    fecha_match = re.search(r'(\d{2}/\d{2}/\d{4})', html)
-                                                    if fecha_match:
-                                                        fecha = fecha_match.group(1)
-                                                except Exception:
-                                                    pass
-                                            
-                                            # Intentar obtener descripción
-                                            for selector in desc_selectors:
-                                                try:
-                                                    desc_el = fila.locator(selector)
-                                                    if await desc_el.count() > 0:
-                                                        descripcion = await desc_el.text_content()
-                                                        if descripcion and descripcion.strip():
-                                                            descripcion = descripcion.strip()
-                                                            break
-                                                except Exception:
-                                                    continue
-                                            
-                                            # Intentar obtener monto
-                                            for selector in monto_selectors:
-                                                try:
-                                                    monto_el = fila.locator(selector)
-                                                    if await monto_el.count() > 0:
-                                                        monto_str = await monto_el.text_content()
-                                                        if monto_str and monto_str.strip():
-                                                            # Verificar si es cargo o abono
-                                                            es_cargo = "-" in monto_str
-                                                            # Limpiar el monto
-                                                            monto_str = monto_str.replace("-", "").replace("+", "").strip()
-                                                            break
-                                                except Exception:
-                                                    continue
-                                            
-                                            if fecha and descripcion and monto_str:
-                                                monto = self.convertir_saldo_a_float(monto_str)
-                                                movimientos.append({
-                                                    'fecha': fecha,
-                                                    'descripcion': descripcion,
-                                                    'monto': -monto if es_cargo else monto
-                                                })
-                                                print(f"      [+] Movimiento: {fecha} | {descripcion} | ${monto:,.0f} {'(cargo)' if es_cargo else '(abono)'}")
-                                            else:
-                                                print(f"      [WARNING] Fila incompleta - Fecha: {fecha} Desc: {descripcion} Monto: {monto_str}")
-                                                # Intentar extraer datos del HTML directamente
-                                                try:
-                                                    html = await fila.evaluate("el => el.innerHTML")
-                                                    print(f" HTML de la fila: {html}")
-                                                except Exception:
-                                                    pass
-                                        except Exception as e:
-                                            print(f"      [WARNING] Error procesando fila: {e}")
-                                            continue
-                                except Exception as e:
-                                    print(f"      [WARNING] Error procesando tabla: {e}")
-                                    break
-                                
-                                if len(movimientos) == 0:
-                                    print("      [INFO] No hay movimientos en esta página")
-                                    break
-                                
-                                # Lista de selectores para el botón siguiente y paginación
-                                siguiente_selectors = [
-                                    "button.btn-next:not([disabled])",
-                                    "button[aria-label='Siguiente']:not([disabled])",
-                                    ".pagination-next:not([disabled])",
-                                    "button:has-text('Siguiente'):not([disabled])",
-                                    ".ag-paging-button[ref='btNext']:not(.ag-disabled)",
-                                    "button.next-page:not([disabled])",
-                                    "li.page-item:not(.disabled) a.page-link[aria-label='Siguiente']",
-                                    "[aria-label='next page']",
-                                    "button.msd-button:has-text('Siguiente')",
-                                    ".pagination button:not([disabled]):has-text('Siguiente')"
-                                ]
+                print("    [OK] Tabla de movimientos cargada")
+                pagina = 1
+                firma_anterior = None
+                while pagina <= 10:  # Límite de 10 páginas
+                    await self.cancelacion.check()
+                    print(f" Procesando página {pagina}")
+                    await wait_for_dom_quiet(page)
+                    try:
+                        # Una sola llamada al navegador trae todas las filas de la página
+                        with span('leer_pagina', pagina=pagina) as attrs_pagina:
+                            extraccion = await extract_rows(tabla_movs)
+                            attrs_pagina['filas'] = len(extraccion["filas"])
+                        filas = extraccion["filas"]
+                        if not filas:
+                            print("      [WARNING] No se encontraron filas en la tabla")
+                            break
+                        print(f"      [OK] Filas encontradas con selector: {extraccion['selector']}")
+
+                        movimientos_pagina = []
+                        for fila in filas:
+                            try:
+                                fecha = fila["fecha"]
+                                descripcion = fila["descripcion"]
+                                monto_str = fila["monto"]
+                                es_cargo = fila["es_cargo"]
+                                if fecha and descripcion and monto_str:
+                                    monto = self.convertir_saldo_a_float(monto_str)
+                                    movimientos_pagina.append({
+                                        'fecha': fecha,
+                                        'descripcion': descripcion,
+                                        'monto': -monto if es_cargo else monto
+                                    })
+                                    print(f"      [+] Movimiento: {fecha} | {descripcion} | ${monto:,.0f} {'(cargo)' if es_cargo else '(abono)'}")
+                                else:
+                                    print(f"      [WARNING] Fila incompleta - Fecha: {fecha} Desc: {descripcion} Monto: {monto_str}")
+                                    print(f" HTML de la fila: {fila['html']}")
+                            except Exception as e:
+                                print(f"      [WARNING] Error procesando fila: {e}")
+                                continue
+                    except Exception as e:
+                        print(f"      [WARNING] Error procesando tabla: {e}")
+                        break
+
+                    firma_pagina = [(m['fecha'], m['descripcion'], m['monto']) for m in movimientos_pagina]
+                    if firma_pagina and firma_pagina == firma_anterior:
+                        # El click de paginación no avanzó: la misma página leída dos veces no son movimientos nuevos
+                        print("      [WARNING] La página no cambió después de paginar, se deja de paginar")
+                        break
+                    firma_anterior = firma_pagina
+
+                    # Antes del filtro de la marca: los conocidos también cuentan para el ordinal
+                    numerar_apariciones(movimientos_pagina, apariciones)
+                    conocidos = 0
+                    if marca:
+                        movimientos_pagina, conocidos = marca.filtrar(movimientos_pagina, vistos_marca)
+                    movimientos.extend(movimientos_pagina)
                                 
-                                tiene_siguiente = False
-                                for selector in siguiente_selectors:
-                                    try:
-                                        btn = page.locator(selector)
-                                        if await btn.count() > 0:
-                                            is_visible = await btn.is_visible()
-                                            is_enabled = await btn.evaluate("el => !el.disabled")
-                                            if is_visible and is_enabled:
-                                                print(f"      [OK] Botón siguiente encontrado con selector: {selector}")
-                                                await btn.click()
-                                                await page.wait_for_timeout(2000)  # Esperar a que cargue la siguiente página
-                                                tiene_siguiente = True
-                                                break
-                                    except Exception:
-                                        continue                                
-                                if not tiene_siguiente:
-                                    try:
-                                        # Buscar elementos de paginación por número
-                                        paginas = page.locator(".pagination li, .page-item, [role='listitem']")
-                                        num_paginas = await paginas.count()
-                                        for i in range(num_paginas):
-                                            pagina_el = paginas.nth(i)
-                                            if await pagina_el.is_visible():
-                                                texto = await pagina_el.text_content()
-                                                # Si encontramos un número mayor que la página actual
-                                                if texto.isdigit() and int(texto) == pagina + 1:
-                                                    print(f"[OK] Encontrado botón de página {texto}")
-                                                    await pagina_el.click()
-                                                    await page.wait_for_timeout(2000)
-                                                    tiene_siguiente = True
-                                                    break
-                                    except Exception as e:
-                                        print(f"      [INFO] Info al buscar números de página: {e}")
+                    if len(movimientos) == 0 and not conocidos:
+                        print("      [INFO] No hay movimientos en esta página")
+                        break
+
+                    if conocidos:
+                        # Lo que sigue en la grilla es más antiguo: ya se sincronizó
+                        print(f"      [INFO] Sincronización incremental: {conocidos} movimientos ya sincronizados, no se pagina más")
+                        break
                                 
-                                if not tiene_siguiente:
-                                    print("      [INFO] No hay más páginas")
-                                    break
+                    # Lista de selectores para el botón siguiente y paginación
+                    siguiente_selectors = [
+                        "button.btn-next:not([disabled])",
+                        "button[aria-label='Siguiente']:not([disabled])",
+                        ".pagination-next:not([disabled])",
+                        "button:has-text('Siguiente'):not([disabled])",
+                        ".ag-paging-button[ref='btNext']:not(.ag-disabled)",
+                        "button.next-page:not([disabled])",
+                        "li.page-item:not(.disabled) a.page-link[aria-label='Siguiente']",
+                        "[aria-label='next page']",
+                        "button.msd-button:has-text('Siguiente')",
+                        ".pagination button:not([disabled]):has-text('Siguiente')"
+                    ]
                                 
-                                pagina += 1
-                                print(f"      [OK] Navegando a página {pagina}")
-                                await page.wait_for_timeout(1000)
-                            print(f"  [OK] Total de movimientos extraídos para esta cuenta: {len(movimientos)}")
-                            await self.verificar_y_volver_home(page)
+                    await self.cancelacion.check()
+                    tiene_siguiente = False
+                    for selector in siguiente_selectors:
+                        try:
+                            with span('selector', grupo='siguiente', selector=selector):
+                                btn = page.locator(selector)
+                                if await btn.count() > 0:
+                                    is_visible = await btn.is_visible()
+                                    is_enabled = await btn.evaluate("el => !el.disabled")
+                                    if is_visible and is_enabled:
+                                        print(f"      [OK] Botón siguiente encontrado con selector: {selector}")
+                                        await wait_for_page_update(page, btn.click)
+                                        tiene_siguiente = True
+                                        break
+                        except Exception:
+                            continue                                
+                    if not tiene_siguiente:
+                        try:
+                            # Buscar elementos de paginación por número
+                            paginas = page.locator(".pagination li, .page-item, [role='listitem']")
+                            num_paginas = await paginas.count()
+                            for i in range(num_paginas):
+                                pagina_el = paginas.nth(i)
+                                if await pagina_el.is_visible():
+                                    texto = await pagina_el.text_content()
+                                    # Si encontramos un número mayor que la página actual
+                                    if texto.isdigit() and int(texto) == pagina + 1:
+                                        print(f"[OK] Encontrado botón de página {texto}")
+                                        await wait_for_page_update(page, pagina_el.click)
+                                        tiene_siguiente = True
+                                        break
                         except Exception as e:
-                            print(f"    ERROR: Error al procesar movimientos: {e}")
-                        await self.verificar_y_volver_home(page)
+                            print(f"      [INFO] Info al buscar números de página: {e}")
+                                
+                    if not tiene_siguiente:
+                        print("      [INFO] No hay más páginas")
                         break
-                    else:
-                        print("  [WARNING] No se encontró el botón de movimientos")
+                                
+                    pagina += 1
+                    print(f"      [OK] Navegando a página {pagina}")
+                    await self.pacing.pause(page, 500, 1000)
+                print(f"  [OK] Total de movimientos extraídos para esta cuenta: {len(movimientos)}")
+            except Exception as e:
+                print(f"    ERROR: Error al procesar movimientos: {e}")
+                if propagar_errores:
+                    raise
 
             return movimientos
         except Exception as e:
             print(f"ERROR: Error extrayendo movimientos: {e}")
+            if propagar_errores:
+                raise
             return movimientos
 
+    async def extraer_movimientos_cuentas(self, context, page, cuentas: List[dict],
+                                          captura: Optional[NetworkCapture] = None):
+        """
+        Llena `movimientos` de cada cuenta. Con `account_concurrency` > 1 abre una
+        pestaña por cuenta en el mismo contexto autenticado y las extrae en
+        paralelo; las cuentas cuya pestaña falla se repiten en secuencia en `page`.
+        """
+        pendientes = list(cuentas)
+        limite = self.config.account_concurrency
+        if limite > 1 and len(cuentas) > 1:
+            semaforo = asyncio.Semaphore(limite)
+
+            async def extraer_en_pestana(cuenta) -> bool:
+                async with semaforo:
+                    pestana = await context.new_page()
+                    try:
+                        captura_pestana = None
+                        if captura:
+                            captura_pestana = NetworkCapture(pestana)
+                            captura_pestana.start()
+                        with span('cuenta', cuenta=self.clave_cuenta(cuenta.get('numero'))[-4:], pestana=True):
+                            cuenta['movimientos'] = await self.extract_movimientos_cuenta(
+                                pestana, cuenta, captura_pestana, propagar_errores=True
+                            )
+                        return True
+                    except Exception as e:
+                        print(f"[WARNING] Falló la pestaña de la cuenta {cuenta.get('numero')}: {e}")
+                        return False
+                    finally:
+                        try:
+                            await pestana.close()
+                        except Exception:
+                            pass
+
+            print(f"[INFO] Extrayendo {len(cuentas)} cuentas en paralelo (hasta {limite} pestañas)")
+            resultados = await asyncio.gather(*(extraer_en_pestana(cuenta) for cuenta in cuentas))
+            pendientes = [cuenta for cuenta, ok in zip(cuentas, resultados) if not ok]
+            if pendientes:
+                print(f"[INFO] {len(pendientes)} cuentas se reintentan en modo secuencial")
+
+        # Si se canceló durante las pestañas, sus fallos no se reintentan
+        await self.cancelacion.check()
+        for cuenta in pendientes:
+            with span('cuenta', cuenta=self.clave_cuenta(cuenta.get('numero'))[-4:]):
+                cuenta['movimientos'] = await self.extract_movimientos_cuenta(page, cuenta, captura)
+
+    @timed('cargar_marcas')
+    async def cargar_marcas(self, task_data: dict, cuentas: List[dict]):
+        """Lee las marcas de sincronización de las cuentas (salvo que se pida una sincronización completa)"""
+        self.marcas = {}
+        if not self.watermarks:
+            return
+        if (task_data.get('data') or {}).get('full_sync'):
+            print("[INFO] Sincronización completa solicitada, se ignoran las marcas")
+            return
+        claves = [clave for clave in (self.clave_cuenta(c.get('numero')) for c in cuentas) if clave]
+        self.marcas = await self.watermarks.load(task_data.get('user_id'), claves)
+        con_marca = sum(1 for marca in self.marcas.values() if marca.fecha)
+        if con_marca:
+            print(f"[INFO] Sincronización incremental: {con_marca}/{len(claves)} cuentas con marca previa")
+
+    def avanzar_marcas(self, cuentas: List[dict]) -> Dict[str, Marca]:
+        """Marcas que cambian al incorporar los movimientos a enviar (copias, sin guardar)"""
+        if not self.watermarks:
+            return {}
+        cambiadas: Dict[str, Marca] = {}
+        for cuenta in cuentas:
+            clave = self.clave_cuenta(cuenta.get('numero'))
+            if not clave:
+                continue
+            actual = self.marcas.get(clave)
+            marca = Marca(actual.fecha, actual.huellas) if actual else Marca()
+            if marca.avanzar(cuenta.get('movimientos') or []):
+                cambiadas[clave] = marca
+        return cambiadas
+
+    @timed('actualizar_marcas')
+    async def actualizar_marcas(self, task_data: dict, cambiadas: Dict[str, Marca]):
+        """Guarda las marcas avanzadas una vez que el backend confirmó todos los lotes"""
+        if self.watermarks and cambiadas:
+            await self.watermarks.save(task_data.get('user_id'), cambiadas)
+
+    @timed('volver_home')
     async def verificar_y_volver_home(self, page):
         """Verifica si estamos en la página principal y vuelve si es necesario"""
         try:
@@ -876,20 +1068,18 @@ class BancoEstadoScraper:
                 logo = page.locator("#logoBechHomeIndex")
                 if await logo.count() > 0:
                     await logo.click()
-                    await page.wait_for_load_state("networkidle")
-                    await page.wait_for_timeout(1000)
+                    await page.wait_for_selector("app-carrusel-productos-wrapper", timeout=15000)
                     print("  [OK] Volvimos a home usando el logo")
                     return True
                 inicio_button = page.locator("button[aria-label='Inicio']").first
                 if await inicio_button.count() > 0:
                     await inicio_button.click()
-                    await page.wait_for_load_state("networkidle")
-                    await page.wait_for_timeout(1000)
+                    await page.wait_for_selector("app-carrusel-productos-wrapper", timeout=15000)
                     print("  [OK] Volvimos a home usando el botón de inicio")
                     return True
                 print("  Intentando navegar directamente a home...")
-                await page.goto("https://www.bancoestado.cl/personas/home", wait_until="networkidle")
-                await page.wait_for_timeout(1000)
+                await page.goto("https://www.bancoestado.cl/personas/home", wait_until="domcontentloaded")
+                await page.wait_for_selector("app-carrusel-productos-wrapper", timeout=15000)
                 print("  [OK] Navegación directa a home exitosa")
                 return True
                 
@@ -897,7 +1087,7 @@ class BancoEstadoScraper:
                 print(f"  [WARNING] Error al intentar volver a home: {e}")
                 try:
                     await page.reload()
-                    await page.wait_for_load_state("networkidle")
+                    await settle(page)
                     print("  [OK] Página recargada como último recurso")
                     return True
                 except Exception as e2:
@@ -925,6 +1115,11 @@ class BancoEstadoScraper:
         except Exception as e:
             print(f"ERROR: Error al guardar datos: {e}")
 
+    def mismo_numero(self, a: Optional[str], b: Optional[str]) -> bool:
+        """Compara números de cuenta ignorando el formato (la red y el DOM los escriben distinto)"""
+        digitos_a = re.sub(r'\D', '', a or '')
+        return bool(digitos_a) and digitos_a == re.sub(r'\D', '', b or '')
+
     def convertir_saldo_a_float(self, saldo_str: str) -> int:
         """
         Convierte un string de saldo a número entero.
@@ -932,10 +1127,74 @@ class BancoEstadoScraper:
         """
         return self.clean_number(saldo_str)
 
+    def context_options(self) -> Dict[str, Any]:
+        """Opciones del BrowserContext de cada sesión"""
+        return {
+            "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+            "locale": "es-CL",
+            "permissions": ["geolocation"],
+            "geolocation": self.config.geolocation,
+            "timezone_id": "America/Santiago",
+            "viewport": {"width": 1920, "height": 1080}
+        }
+
+    @timed('restaurar_sesion')
+    async def restaurar_sesion(self, page) -> bool:
+        """
+        Intenta entrar al home con una sesión restaurada desde el caché.
+        Retorna True si el banco aceptó la sesión (el carrusel de productos cargó).
+        """
+        print("[INFO] Intentando reutilizar sesión en caché...")
+        try:
+            await page.goto("https://www.bancoestado.cl/personas/home", timeout=30000)
+            await page.wait_for_selector("app-carrusel-productos-wrapper", timeout=15000)
+            print("[OK] Sesión en caché aceptada, se omite el login")
+            return True
+        except Exception as e:
+            print(f"[INFO] Sesión en caché rechazada, se hará login completo: {e}")
+            return False
+
+    async def limpiar_estado_sesion(self, page):
+        """Elimina cookies y storage de una sesión rechazada antes del login completo"""
+        try:
+            await page.context.clear_cookies()
+            await page.evaluate("() => { localStorage.clear(); sessionStorage.clear(); }")
+        except Exception as e:
+            print(f"[WARNING] No se pudo limpiar el estado de la sesión: {e}")
+
+    @timed('guardar_sesion')
+    async def guardar_sesion(self, context, credentials: Credentials):
+        """Guarda el storage state de la sesión autenticada en el caché, si está activo"""
+        if not self.session_cache:
+            return
+        try:
+            await self.session_cache.save(credentials.rut, await context.storage_state())
+        except Exception as e:
+            print(f"[WARNING] No se pudo obtener el estado de la sesión: {e}")
+
     async def run(self, task_id: str, task_data: dict) -> dict:
         """
-        Método principal que ejecuta el scraping completo y procesa los movimientos
+        Método principal que ejecuta el scraping completo y procesa los movimientos.
+        Mide cada fase en un timeline que queda en el hash de la tarea.
         """
+        timeline = Timeline(task_id)
+        with activate(timeline):
+            try:
+                with span('run') as attrs:
+                    resultado = await self.ejecutar_tarea(task_id, task_data)
+                    attrs['success'] = resultado.get('success')
+                return resultado
+            finally:
+                timeline.print_report()
+                if self.redis_client is not None:
+                    await timeline.save(self.redis_client)
+
+    async def ejecutar_tarea(self, task_id: str, task_data: dict) -> dict:
+        """Login, extracción, categorización y envío de una tarea"""
+        # Sin pool compartido se usa uno propio que vive solo durante esta tarea
+        pool = self.browser_pool or BrowserPool(max_contexts=1)
+        politica_recursos = ResourcePolicy()
+        self.cancelacion.start()
         try:
             print(f"[INFO] Iniciando scraping para tarea {task_id}")            
             credentials = Credentials(
@@ -943,57 +1202,49 @@ class BancoEstadoScraper:
                 password=task_data['data']['password']
             )
             
-            async with async_playwright() as p:
-                import os
-                is_railway = os.getenv('RAILWAY_ENVIRONMENT') == 'production'                
-                if is_railway:
-                    browser_args = [
-                        '--no-sandbox',
-                        '--disable-setuid-sandbox',
-                        '--disable-dev-shm-usage',
-                        '--disable-blink-features=AutomationControlled',
-                        '--disable-web-security',
-                        '--disable-extensions',
-                        '--no-first-run',
-                        '--display=:99'
-                    ]
-                    browser = await p.chromium.launch(
-                        headless=False,  # Mantener interfaz gráfica
-                        slow_mo=50,
-                        args=browser_args
-                    )
-                else:
-                    # Configuración local (normal)
-                    browser = await p.chromium.launch(
-                        headless=False,
-                        slow_mo=50
-                    )
-                
-                # Configurar el contexto
-                context = await browser.new_context(
-                    user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-                    locale="es-CL",
-                    permissions=["geolocation"],
-                    geolocation=self.config.geolocation,
-                    timezone_id="America/Santiago",
-                    viewport={"width": 1920, "height": 1080}
-                )
-                
+            cached_state = None
+            if self.session_cache:
+                cached_state = await self.session_cache.load(credentials.rut)
+            
+            context_options = self.context_options()
+            if cached_state:
+                context_options["storage_state"] = cached_state
+            
+            await self.cancelacion.check()
+            async with pool.context(**context_options) as context:
+                # Al cancelar se cierra el contexto: corta la navegación en curso y libera el navegador
+                self.cancelacion.on_cancel(context.close)
+                await self.cancelacion.check()
                 # Configurar evasión de detección
                 await context.add_init_script("""
                     Object.defineProperty(navigator, 'webdriver', {
                         get: () => undefined
                     });
                 """)
+                await politica_recursos.attach(context)
                 
                 page = await context.new_page()
+                captura = None
+                if self.config.extraction_mode != MODE_DOM:
+                    # Escuchar desde antes del login para no perder la carga de productos
+                    captura = NetworkCapture(page)
+                    captura.start()
+                
+                sesion_restaurada = False
+                if cached_state:
+                    sesion_restaurada = await self.restaurar_sesion(page)
+                    if not sesion_restaurada:
+                        # El banco rechazó la sesión: limpiar y hacer login completo
+                        await self.session_cache.discard(credentials.rut)
+                        await self.limpiar_estado_sesion(page)
                 
                 # Realizar login
                 print("[INFO] Realizando login...")
                 try:
-                    login_exitoso = await self.login_banco_estado(page, credentials)
+                    login_exitoso = sesion_restaurada or await self.login_banco_estado(page, credentials)
                     if not login_exitoso:
-                        await browser.close()
+                        # Un login cortado por la cancelación no es un login fallido
+                        await self.cancelacion.check()
                         error_result = {
                             "success": False,
                             "error": "Login fallido",
@@ -1002,7 +1253,7 @@ class BancoEstadoScraper:
                         print(f"[ERROR] Login fallido para tarea {task_id}")
                         return error_result
                 except Exception as login_error:
-                    await browser.close()
+                    await self.cancelacion.check()
                     error_result = {
                         "success": False,
                         "error": f"Error durante login: {str(login_error)}",
@@ -1011,19 +1262,24 @@ class BancoEstadoScraper:
                     print(f"[ERROR] Error de login para tarea {task_id}: {login_error}")
                     return error_result
                 
+                if not sesion_restaurada:
+                    await self.guardar_sesion(context, credentials)
+                
                 # Extraer cuentas
                 print("[INFO] Extrayendo cuentas...")
                 try:
-                    cuentas = await self.extract_cuentas(page)
+                    cuentas = await self.extract_cuentas(page, captura)
+                    await self.cargar_marcas(task_data, cuentas)
                     
                     # Extraer movimientos por cuenta
                     print("[INFO] Extrayendo movimientos por cuenta...")
-                    for cuenta in cuentas:
-                        movimientos_cuenta = await self.extract_movimientos_cuenta(page, cuenta)
-                        cuenta['movimientos'] = movimientos_cuenta
+                    await self.extraer_movimientos_cuentas(context, page, cuentas, captura)
+                    
+                    # Guardar la sesión (con cookies renovadas) para la próxima sincronización
+                    await self.guardar_sesion(context, credentials)
                         
                 except Exception as extract_error:
-                    await browser.close()
+                    await self.cancelacion.check()
                     error_result = {
                         "success": False,
                         "error": f"Error extrayendo datos: {str(extract_error)}",
@@ -1031,47 +1287,62 @@ class BancoEstadoScraper:
                     }
                     print(f"[ERROR] Error extrayendo datos para tarea {task_id}: {extract_error}")
                     return error_result
-                
-                await browser.close()
-                
-                # Procesar y categorizar movimientos
-                print("[INFO] Procesando y categorizando movimientos...")
-                try:
-                    processed_result = await self.process_and_categorize_movements(cuentas, task_data)
-                except Exception as process_error:
-                    error_result = {
-                        "success": False,
-                        "error": f"Error procesando movimientos: {str(process_error)}",
-                        "fecha_extraccion": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    }
-                    print(f"[ERROR] Error procesando movimientos para tarea {task_id}: {process_error}")
-                    return error_result
-                
-                # Preparar resultado final
-                resultado = {
-                    "success": True,
-                    "fecha_extraccion": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "cuentas": cuentas,
-                    "total_cuentas": len(cuentas),
-                    "total_movimientos": sum(len(cuenta.get('movimientos', [])) for cuenta in cuentas),
-                    "processed_movements": processed_result.get('processed_movements', []),
-                    "categorization_stats": processed_result.get('categorization_stats', {})
+            
+            # El contexto ya se cerró: el resto no necesita navegador
+            await self.cancelacion.check()
+            # Procesar y categorizar movimientos
+            print("[INFO] Procesando y categorizando movimientos...")
+            try:
+                processed_result = await self.process_and_categorize_movements(cuentas, task_data)
+            except Exception as process_error:
+                error_result = {
+                    "success": False,
+                    "error": f"Error procesando movimientos: {str(process_error)}",
+                    "fecha_extraccion": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 }
+                print(f"[ERROR] Error procesando movimientos para tarea {task_id}: {process_error}")
+                return error_result
+            
+            # Preparar resultado final
+            resultado = {
+                "success": True,
+                # Identifican el archivo guardado (lo usa la recategorización offline)
+                "task_id": task_id,
+                "user_id": task_data.get('user_id'),
+                "fecha_extraccion": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "cuentas": cuentas,
+                "total_cuentas": len(cuentas),
+                "total_movimientos": sum(len(cuenta.get('movimientos', [])) for cuenta in cuentas),
+                "processed_movements": processed_result.get('processed_movements', []),
+                "backend_synced": processed_result.get('backend_synced', False),
+                "backend_queued": processed_result.get('backend_queued', False),
+                "backend_rejected": processed_result.get('backend_rejected', 0),
+                "categorization_stats": processed_result.get('categorization_stats', {})
+            }
+            
+            # Guardar resultado local (con el id de tarea para no pisar
+            # archivos de otras tareas que terminen en el mismo segundo)
+            os.makedirs('results', exist_ok=True)
+            self.guardar_en_json(
+                f'results/banco_estado_{datetime.now().strftime("%Y%m%d_%H%M%S")}_{task_id}.json',
+                resultado
+            )
+            
+            print(f"[OK] Scraping completado exitosamente:")
+            print(f"  - Cuentas extraídas: {len(cuentas)}")
+            print(f"  - Movimientos procesados: {sum(len(cuenta.get('movimientos', [])) for cuenta in cuentas)}")
+            print(f"  - Movimientos categorizados: {processed_result.get('categorization_stats', {}).get('categorized', 0)}")
+            
+            return resultado
                 
-                # Guardar resultado local
-                os.makedirs('results', exist_ok=True)
-                self.guardar_en_json(
-                    f'results/banco_estado_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json',
-                    resultado
-                )
-                
-                print(f"[OK] Scraping completado exitosamente:")
-                print(f"  - Cuentas extraídas: {len(cuentas)}")
-                print(f"  - Movimientos procesados: {sum(len(cuenta.get('movimientos', [])) for cuenta in cuentas)}")
-                print(f"  - Movimientos categorizados: {processed_result.get('categorization_stats', {}).get('categorized', 0)}")
-                
-                return resultado
-                
+        except TaskCancelled:
+            print(f"[INFO] Tarea {task_id} cancelada, recursos del navegador liberados")
+            return {
+                "success": False,
+                "cancelled": True,
+                "error": "Tarea cancelada por el usuario",
+                "fecha_extraccion": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
         except Exception as e:
             print(f"[ERROR] Error crítico durante el scraping para tarea {task_id}: {str(e)}")
             import traceback
@@ -1082,6 +1353,11 @@ class BancoEstadoScraper:
                 "fecha_extraccion": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
             return error_result
+        finally:
+            await self.cancelacion.stop()
+            politica_recursos.print_report()
+            if self.browser_pool is None:
+                await pool.close()
 
     def clean_number(self, value: Any) -> int:
         """
@@ -1115,31 +1391,16 @@ class BancoEstadoScraper:
             print(f"[WARNING] Error convirtiendo número '{value}': {e}")
             return 0
 
+    @timed('categorizar')
     async def process_and_categorize_movements(self, cuentas: List[dict], task_data: dict) -> dict:
         """Procesa y categoriza los movimientos"""
         print("[INFO] Procesando y categorizando movimientos...")
         try:
-            backend_url = os.getenv('BACKEND_URL', 'http://localhost:3000')
-            if 'railway.app' in backend_url and not backend_url.startswith('http'):
-                backend_url = f"https://{backend_url}"
-            elif not backend_url.startswith('http'):
-                backend_url = f"http://{backend_url}"
-            
-            companies_url = f"{backend_url}/config/companies"
-            print(f"[INFO] Obteniendo companies.json desde: {companies_url}")
-            async with aiohttp.ClientSession() as session:
-                async with session.get(companies_url) as response:
-                    if response.status == 200:
-                        response_data = await response.json()
-                        if response_data.get('success'):
-                            companies = response_data.get('data', [])
-                            print(f"[INFO] Cargadas {len(companies)} empresas para categorización desde API")
-                        else:
-                            print(f"[WARNING] Error en respuesta de API: {response_data.get('message')}")
-                            companies = []
-                    else:
-                        print(f"[WARNING] No se pudo obtener companies.json (status: {response.status}), usando lista vacía")
-                        companies = []
+            # Catálogo compartido por el proceso: solo espera la red si no hay ninguna copia
+            companies = await self.companies_catalog.get()
+            print(f"[INFO] {len(companies)} empresas disponibles para categorización")
+
+            huellas = await self.deduplicar_movimientos(task_data, cuentas)
 
             total_movimientos = 0
             total_categorizados = 0
@@ -1171,15 +1432,34 @@ class BancoEstadoScraper:
             print(f"[INFO] Total de movimientos procesados: {total_movimientos}")
             print(f"[INFO] Total de movimientos categorizados: {total_categorizados}")
             
+            # Lo que se registra al quedar sincronizada la tarea; si hay lotes que
+            # quedan en el outbox, viaja con ellos y se aplica cuando se entregan
+            marcas = self.avanzar_marcas(cuentas)
+            sincronizacion = {
+                'user_id': task_data.get('user_id'),
+                'marcas': {clave: marca.to_json() for clave, marca in marcas.items()},
+                'huellas': huellas,
+            }
+
             # Enviar movimientos al backend
-            await self.send_movements_to_backend(
+            envio = await self.send_movements_to_backend(
                 [mov for cuenta in cuentas for mov in cuenta.get('movimientos', [])],
                 task_data,
-                cuentas
+                cuentas,
+                sincronizacion
             )
             
+            # Solo con todos los lotes confirmados: si algún lote quedó en el outbox
+            # y termina descartado, la próxima ejecución debe volver a extraerlo
+            if envio['backend_synced']:
+                await self.actualizar_marcas(task_data, marcas)
+                await self.deduplicator.remember(task_data.get('user_id'), huellas)
+            
             return {
                 "success": True,
+                "backend_synced": envio['backend_synced'],
+                "backend_queued": envio['backend_queued'],
+                "backend_rejected": envio['backend_rejected'],
                 "total_movimientos": total_movimientos,
                 "categorization_stats": {
                     "categorized": total_categorizados,
@@ -1195,16 +1475,47 @@ class BancoEstadoScraper:
                 "error": error_msg
             }
     
+    @timed('deduplicar')
+    async def deduplicar_movimientos(self, task_data: dict, cuentas: List[dict]) -> List[str]:
+        """
+        Quita de cada cuenta los movimientos repetidos en la ejecución o ya
+        entregados antes. Retorna las huellas de los que se conservan.
+        """
+        pares = []
+        huellas = []
+        for cuenta in cuentas:
+            if not isinstance(cuenta.get('movimientos'), list):
+                continue
+            if any(ORDINAL_FIELD not in mov for mov in cuenta['movimientos']):
+                # Movimientos que no numeró la extracción (p. ej. cargados de un JSON): se cuentan aquí
+                numerar_apariciones(cuenta['movimientos'])
+            for mov in cuenta['movimientos']:
+                pares.append((cuenta, mov))
+                huellas.append(fingerprint(cuenta.get('numero'), mov.get('fecha'), mov.get('descripcion', '').strip(),
+                                           mov.get('monto'), self.extract_reference(mov.get('descripcion', '').strip()),
+                                           mov.pop(ORDINAL_FIELD)))
+        if not pares:
+            return []
+        conservar, repetidos, entregados = await self.deduplicator.filter(task_data.get('user_id'), huellas)
+        if repetidos or entregados:
+            print(f"[INFO] Deduplicación: {repetidos} movimientos repetidos y {entregados} ya entregados se descartan")
+            descartados = {id(mov) for (_, mov), ok in zip(pares, conservar) if not ok}
+            for cuenta in cuentas:
+                if isinstance(cuenta.get('movimientos'), list):
+                    cuenta['movimientos'] = [mov for mov in cuenta['movimientos'] if id(mov) not in descartados]
+        return [huella for huella, ok in zip(huellas, conservar) if ok]
+
     def process_single_movement(self, movimiento: dict, cuenta: dict, companies: List[dict]) -> dict:
         """
         Procesa un movimiento individual y lo categoriza
         Estructura exacta que espera el backend según IScraperMovement
         """
         descripcion = movimiento.get('descripcion', '').strip()
-        descripcion_clean = self.clean_description(descripcion)
-        tipo = self.extract_transaction_type(descripcion)
-        referencia = self.extract_reference(descripcion)
-        categoria_automatica = self.find_automatic_category_improved(descripcion_clean, companies)
+        # Limpieza, tipo y referencia en una sola pasada (patrones compilados al cargar el módulo)
+        normalizado = movement_normalizer.normalize_movement(descripcion)
+        tipo = normalizado.tipo
+        referencia = normalizado.referencia
+        categoria_automatica = self.find_automatic_category_improved(normalizado.clave, companies)
         processed_movement = {
             'fecha': movimiento.get('fecha'),                    # string - fecha ISO
             'descripcion': descripcion,                          # string - descripción del movimiento
@@ -1223,213 +1534,122 @@ class BancoEstadoScraper:
         """
         Limpia la descripción del movimiento eliminando prefijos genéricos
         """
-        import re
-        
-        prefijos_a_ignorar = [
-            'TEF A ',
-            'COMPRA WEB ',
-            'COMPRA NACIONAL ',
-            'COMPRA INTERNACIONAL ',
-            'COMPRA POS ',
-            'TRANSFERENCIA A ',
-            'TRANSFERENCIA DE ',
-            'PAGO DE ',
-            'PAGO A ',
-            'FACTU CL',
-            'FACTURACION ',
-            'CARGO POR ',
-            'ABONO DE ',
-            'GIRO EN ',
-            'DEP POR ',
-            'COMISION '
-        ]
-        
-        desc = descripcion.strip()
-        
-        # Eliminar prefijos comunes
-        for prefijo in prefijos_a_ignorar:
-            if desc.upper().startswith(prefijo.upper()):
-                desc = desc[len(prefijo):].strip()
-        
-        # Limpiar múltiples espacios
-        desc = re.sub(r'\s+', ' ', desc)
-        
-        # Eliminar sufijos comunes
-        sufijos_a_ignorar = ['CL', 'CHILE', 'LTDA', 'S.A.']
-        for sufijo in sufijos_a_ignorar:
-            if desc.upper().endswith(' ' + sufijo.upper()):
-                desc = desc[:-len(sufijo)-1].strip()
-        
-        return desc
+        return movement_normalizer.clean_description(descripcion)
     
     def extract_transaction_type(self, descripcion: str) -> str:
         """
         Extrae el tipo de transacción de la descripción
         """
-        desc_upper = descripcion.upper().strip()
-        
-        # Patrones de tipos de transacción más específicos
-        tipos = {
-            'TRANSFERENCIA_ENVIADA': ['TEF A ', 'TRANSFERENCIA A '],
-            'TRANSFERENCIA_RECIBIDA': ['DEP POR TRANSFERENCIA', 'TRANSFERENCIA RECIBIDA'],
-            'COMPRA_WEB': ['COMPRA WEB'],
-            'COMPRA_PRESENCIAL': ['COMPRA NACIONAL', 'COMPRA POS'],
-            'GIRO_ATM': ['GIRO ATM', 'GIRO EN ATM'],
-            'GIRO_TRANSFERENCIA': ['GIRO POR TRANSFERENCIA'],
-            'COMISION': ['COMISION'],
-            'INTERES': ['INTERES', 'RENDIMIENTO'],
-            'AHORRO': ['AHORRO'],
-            'PAGO_SERVICIO': ['PAGO SERVICIO', 'PAGO DE SERVICIO'],
-            'ABONO': ['ABONO'],
-            'CARGO': ['CARGO']
-        }
-        
-        for tipo, patrones in tipos.items():
-            for patron in patrones:
-                if patron in desc_upper:
-                    return tipo
-        
-        # Tipo por defecto basado en el monto
-        return 'OTROS'
+        return movement_normalizer.transaction_type(descripcion.upper())
     
     def extract_reference(self, descripcion: str) -> str:
         """
         Extrae número de referencia o código de la descripción cuando sea relevante
         """
-        import re
-        
-        # Patrones para extraer referencias
-        patterns = [
-            r'REF[:\s]*(\d+)',           # REF: 123456
-            r'NRO[:\s]*(\d+)',           # NRO: 123456  
-            r'CODIGO[:\s]*(\d+)',        # CODIGO: 123456
-            r'(\d{6,})',                 # Números de 6+ dígitos
-            r'[A-Z]{2,}\s*(\d{4,})'      # Códigos alfanuméricos
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, descripcion.upper())
-            if match:
-                return match.group(1) if match.groups() else match.group(0)
-        
-        return None
+        return movement_normalizer.extract_reference(descripcion.upper())
     
     def find_automatic_category_improved(self, descripcion: str, companies: List[dict]) -> str:
         """
         Busca automáticamente la categoría basada en companies.json (sistema que ya funciona)
         """
-        # Usar solo el sistema companies.json que ya funciona bien con la cartola
+        # Usar solo el sistema companies.json que ya funciona bien con la cartola.
+        # El autómata se construye una vez por catálogo y gana la primera empresa
+        # (en orden del catálogo) con alguna keyword en la descripción.
         if companies:
-            descripcion_normalized = descripcion.upper().replace(' ', '')
-            
-            for company in companies:
-                for keyword in company.get('keywords', []):
-                    keyword_normalized = keyword.upper().replace(' ', '')
-                    if keyword_normalized in descripcion_normalized:
-                        return company.get('category', 'Otros')
+            return matcher_for(companies).category(descripcion)
         
         # Fallback a "Otros" si no encuentra coincidencia
         return "Otros"
     
-    async def send_movements_to_backend(self, movements: List[dict], task_data: dict, cuentas: List[dict]) -> None:
+    @timed('upload')
+    async def send_movements_to_backend(self, movements: List[dict], task_data: dict,
+                                        cuentas: List[dict], sincronizacion: Optional[dict] = None) -> Dict[str, Any]:
         """
-        Envía los movimientos procesados al backend
+        Envía los movimientos procesados al backend por lotes (ver BackendUploader).
+        Retorna {'backend_synced', 'backend_queued', 'backend_rejected'}: synced si
+        el backend respondió todos los lotes; queued si los que faltaron quedaron
+        en el outbox, junto con `sincronizacion` (marcas y huellas que el outbox
+        registra al entregarlos); rejected cuenta los movimientos de lotes que el
+        backend rechazó de forma definitiva (se informan, no se reintentan).
         """
-        import aiohttp
-        import json
-        import os
-        
-        # URL del backend - detectar automáticamente el entorno
-        backend_url = os.getenv('BACKEND_URL', 'http://localhost:3000')
-        
-        # Agregar protocolo https si no está presente y es Railway
-        if 'railway.app' in backend_url and not backend_url.startswith('http'):
-            backend_url = f"https://{backend_url}"
-        
-        # Preparar datos para el backend
-        payload = {
-            'rawMovements': movements,
-            'scraperTaskId': task_data.get('id'),
-            'userId': task_data.get('user_id'),
-            'cuentas': cuentas
-        }
-        
+        print(f"[INFO] Enviando {len(movements)} movimientos al backend...")
+        print(f"[INFO] Backend URL: {self.backend_uploader.backend_url}")
         try:
-            print(f"[INFO] Enviando {len(movements)} movimientos al backend...")
-            print(f"[INFO] Backend URL: {backend_url}")
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{backend_url}/scraper/process-data",
-                    json=payload,
-                    headers={'Content-Type': 'application/json'}
-                ) as response:
-                    if response.status == 200 or response.status == 201:
-                        result = await response.json()
-                        
-                        # Mostrar estadísticas detalladas
-                        print("\n" + "="*60)
-                        print(" PROCESO DE SCRAPING COMPLETADO EXITOSAMENTE")
-                        print("="*60)
-                        
-                        if 'stats' in result:
-                            stats = result['stats']
-                            print(f" ESTADÍSTICAS DEL PROCESAMIENTO:")
-                            print(f" Total procesados: {stats.get('total_procesados', 0)}")
-                            print(f" Exitosos: {stats.get('exitosos', 0)}")
-                            print(f" Errores: {stats.get('errores', 0)}")
-                            
-                            if 'por_categoria' in stats:
-                                print(f" Distribución por categoría:")
-                                for categoria, cantidad in stats['por_categoria'].items():
-                                    print(f"    - {categoria}: {cantidad} movimientos")
-                        
-                        print(f"\n Movimientos guardados en la base de datos: {len(movements)}")
-                        print(f" Fecha de procesamiento: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                        print(f" ID de tarea: {task_data.get('id')}")
-                        print("="*60)
-                        if len(movements) > 0:
-                            print("\n EJEMPLOS DE MOVIMIENTOS PROCESADOS:")
-                            for i, mov in enumerate(movements[:5]):  # Mostrar hasta 5 ejemplos
-                                print(f"  {i+1}. {mov.get('descripcion', 'Sin descripción')}")
-                                print(f" Monto: ${mov.get('monto', 0):,.0f}")
-                                print(f" Categoría: {mov.get('categoria_automatica', 'Sin categorizar')}")
-                                print(f" Fecha: {mov.get('fecha', 'Sin fecha')}")
-                                print()
-                            
-                            if len(movements) > 5:
-                                print(f"     ... y {len(movements) - 5} movimientos más")
-                        
-                        print("\n El scraper ha finalizado correctamente!")
-                        print(" Puedes revisar tus movimientos en la aplicación.")
-                    else:
-                        print(f"[ERROR] Error al enviar movimientos al backend: {response.status}")
-                        error_text = await response.text()
-                        print(f"[ERROR] Respuesta del servidor: {error_text}")
-                        print("\nINFORMACIÓN DE RESPALDO:")
-                        print(f" Total movimientos extraídos: {len(movements)}")
-                        print(f" Guardados localmente en: results/banco_estado_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-                        print(" Los movimientos no se guardaron en la base de datos")
-                        
+            upload = await self.backend_uploader.upload(movements, task_data, cuentas)
         except Exception as e:
-            print(f"[ERROR] Error al conectar con el backend: {e}")
-            print("\n[INFO] INFORMACIÓN DE RESPALDO:")
-            print(f" Total movimientos extraídos: {len(movements)}")
-            print(f"Guardados localmente en: results/banco_estado_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-            print(" Los movimientos no se guardaron en la base de datos")
-            print(f"Verifica que el backend esté ejecutándose en {backend_url}")
-            
-            # Mostrar resumen de categorización local
-            if movements:
-                categorias = {}
-                for mov in movements:
-                    cat = mov.get('categoria_automatica', 'Sin categorizar')
-                    categorias[cat] = categorias.get(cat, 0) + 1
-                
-                print(f"\n RESUMEN DE CATEGORIZACIÓN LOCAL:")
-                for categoria, cantidad in categorias.items():
-                    print(f"  - {categoria}: {cantidad} movimientos")
+            print(f"[ERROR] Error al enviar movimientos al backend: {e}")
+            upload = {'success': False, 'chunks_sent': 0, 'chunks_total': 0, 'chunks_rejected': 0,
+                      'rejected_movements': 0, 'stats': {}, 'pending': []}
+
+        if upload['success']:
+            stats = upload['stats']
+            print("\n" + "="*60)
+            print(" PROCESO DE SCRAPING COMPLETADO EXITOSAMENTE")
+            print("="*60)
+            print(f" ESTADÍSTICAS DEL PROCESAMIENTO ({upload['chunks_total']} lotes):")
+            print(f" Total procesados: {stats.get('total_procesados', 0)}")
+            print(f" Exitosos: {stats.get('exitosos', 0)}")
+            print(f" Errores: {stats.get('errores', 0)}")
+            if stats.get('por_categoria'):
+                print(f" Distribución por categoría:")
+                for categoria, cantidad in stats['por_categoria'].items():
+                    print(f"    - {categoria}: {cantidad} movimientos")
+
+            print(f"\n Movimientos guardados en la base de datos: {len(movements) - upload['rejected_movements']}")
+            print(f" Fecha de procesamiento: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            print(f" ID de tarea: {task_data.get('id')}")
+            print("="*60)
+            if len(movements) > 0:
+                print("\n EJEMPLOS DE MOVIMIENTOS PROCESADOS:")
+                for i, mov in enumerate(movements[:5]):  # Mostrar hasta 5 ejemplos
+                    print(f"  {i+1}. {mov.get('descripcion', 'Sin descripción')}")
+                    print(f" Monto: ${mov.get('monto', 0):,.0f}")
+                    print(f" Categoría: {mov.get('categoria_automatica', 'Sin categorizar')}")
+                    print(f" Fecha: {mov.get('fecha', 'Sin fecha')}")
+                    print()
+
+                if len(movements) > 5:
+                    print(f"     ... y {len(movements) - 5} movimientos más")
+
+            if upload['chunks_rejected']:
+                print(f"\n[ERROR] El backend rechazó {upload['chunks_rejected']} lotes "
+                      f"({upload['rejected_movements']} movimientos); no se reintentan")
+            print("\n El scraper ha finalizado correctamente!")
+            print(" Puedes revisar tus movimientos en la aplicación.")
+            return {'backend_synced': True, 'backend_queued': False,
+                    'backend_rejected': upload['rejected_movements']}
+
+        queued = False
+        if self.outbox is not None and upload['pending']:
+            try:
+                self.outbox.enqueue(task_data.get('id'), upload['pending'], sincronizacion)
+                queued = True
+                print(f"[INFO] {len(upload['pending'])} lotes guardados en el outbox; se enviarán cuando el backend responda")
+            except Exception as e:
+                print(f"[ERROR] No se pudieron guardar los lotes en el outbox: {e}")
+
+        print("\n[INFO] INFORMACIÓN DE RESPALDO:")
+        print(f" Lotes enviados: {upload['chunks_sent']}/{upload['chunks_total']}")
+        print(f" Total movimientos extraídos: {len(movements)}")
+        if not queued:
+            print(" Los movimientos restantes no se guardaron en la base de datos")
+        print(f" Verifica que el backend esté ejecutándose en {self.backend_uploader.backend_url}")
+
+        # Mostrar resumen de categorización local
+        if movements:
+            categorias = {}
+            for mov in movements:
+                cat = mov.get('categoria_automatica', 'Sin categorizar')
+                categorias[cat] = categorias.get(cat, 0) + 1
 
+            print(f"\n RESUMEN DE CATEGORIZACIÓN LOCAL:")
+            for categoria, cantidad in categorias.items():
+                print(f"  - {categoria}: {cantidad} movimientos")
+
+        return {'backend_synced': False, 'backend_queued': queued,
+                'backend_rejected': upload['rejected_movements']}
+
+    @timed('login')
     async def login_banco_estado(self, page, credentials: Credentials):
         """Inicia sesión en BancoEstado"""
         import sys
@@ -1440,20 +1660,22 @@ class BancoEstadoScraper:
             sys.stdout.flush()
             
             # Navegar a la página principal (AUMENTADO: 45s -> 60s para mayor seguridad)
+            await self.cancelacion.check()
             try:
                 print("Navegando a bancoestado.cl...")
                 sys.stdout.flush()
                 await page.goto('https://www.bancoestado.cl/', timeout=60000)
                 print("Esperando carga de página...")
                 sys.stdout.flush()
-                await page.wait_for_load_state("networkidle", timeout=30000)  # AUMENTADO: 20s -> 30s
-                await page.wait_for_timeout(3000)  # AUMENTADO: 2s -> 3s
+                await settle(page, timeout_ms=30000)
+                await self.pacing.pause(page, 2000)
                 print("[OK] Navegación a página principal exitosa")
                 sys.stdout.flush()
             except Exception as nav_error:
                 print(f"[ERROR] Falla en navegación inicial: {nav_error}")
                 sys.stdout.flush()
                 return False
+            await self.cancelacion.check()
             
             # Simular comportamiento inicial de exploración
             print(" Explorando la página...")
@@ -1464,7 +1686,7 @@ class BancoEstadoScraper:
                     behavior: 'smooth'
                 });
             """)
-            await page.wait_for_timeout(3000)  # AUMENTADO: 2000ms -> 3000ms
+            await self.pacing.pause(page, 2000)
             
             # Mover el mouse a algunos elementos aleatorios
             await page.evaluate("""
@@ -1477,7 +1699,7 @@ class BancoEstadoScraper:
                 }
             """)
             await self.simular_scroll_natural(page)
-            await page.wait_for_timeout(2000)  # AUMENTADO: 1500ms -> 2000ms
+            await self.pacing.pause(page, 1500)
             # Volver arriba suavemente
             await page.evaluate("""
                 window.scrollTo({
@@ -1485,15 +1707,16 @@ class BancoEstadoScraper:
                     behavior: 'smooth'
                 });
             """)
-            await page.wait_for_timeout(1500)  # AUMENTADO: 1000ms -> 1500ms
+            await self.pacing.pause(page, 1000)
             await self.cerrar_modal_infobar(page) 
             await self.cerrar_sidebar(page)
-            await page.wait_for_timeout(2500)  # AUMENTADO: 2000ms -> 2500ms
+            await self.pacing.pause(page, 2000)
+            await self.cancelacion.check()
             print(" Buscando botón 'Banca en Línea'...")
             sys.stdout.flush()
             try:
                 await self.simular_movimiento_mouse_natural(page)
-                await page.wait_for_timeout(random.randint(1000, 2000))  # AUMENTADO: 500-1100ms -> 1000-2000ms
+                await self.pacing.pause(page, 500, 1100)
                 banca_button = None
                 banca_selectors = [
                     "a[href*='login'] span:text('Banca en Línea')",
@@ -1506,7 +1729,8 @@ class BancoEstadoScraper:
                 for i, selector in enumerate(banca_selectors):
                     try:
                         print(f"[INFO] Probando selector {i+1}: {selector}")
-                        button = await page.wait_for_selector(selector, timeout=10000, state="visible")  # AUMENTADO: 5s -> 10s
+                        with span('selector', grupo='banca', selector=selector):
+                            button = await page.wait_for_selector(selector, timeout=10000, state="visible")  # AUMENTADO: 5s -> 10s
                         if button:
                             banca_button = button
                             print(f"[OK] Botón 'Banca en Línea' encontrado con selector: {selector}")
@@ -1538,38 +1762,38 @@ class BancoEstadoScraper:
                 
                 print("[INFO] Haciendo hover y click en 'Banca en Línea'")
                 await banca_button.hover()
-                await page.wait_for_timeout(random.randint(800, 1500))  # AUMENTADO: 400-800ms -> 800-1500ms
+                await self.pacing.pause(page, 400, 800)
                 await self.simular_movimiento_mouse_natural(page)
                 await banca_button.click()
                 print("[OK] Click en 'Banca en Línea' realizado")
-                await page.wait_for_timeout(2500)  # AUMENTADO: 1200ms -> 2500ms
                 
             except Exception as e:
                 print(f"ERROR: Error al hacer click en 'Banca en Línea': {str(e)}")
                 return False
-            await page.wait_for_load_state("networkidle", timeout=10000)  # AUMENTADO: 5s -> 10s
-            await page.wait_for_timeout(2000)  # AUMENTADO: 1000ms -> 2000ms
+            await wait_for_first(page, ["#rut"], timeout=20000)
+            await self.pacing.pause(page, 1000)
             print(" Explorando página de login...")
             await self.simular_scroll_natural(page)
-            await page.wait_for_timeout(random.randint(1200, 1800))  # AUMENTADO: 710-950ms -> 1200-1800ms
+            await self.pacing.pause(page, 710, 950)
             await page.evaluate("""
                 window.scrollTo({
                     top: 0,
                     behavior: 'smooth'
                 });
             """)
-            await page.wait_for_timeout(2000)  # AUMENTADO: 1210ms -> 2000ms
+            await self.pacing.pause(page, 1210)
             # Buscar y llenar el campo RUT
+            await self.cancelacion.check()
             print(" Buscando campo RUT...")
             sys.stdout.flush()
             try:
                 await page.wait_for_selector("#rut", timeout=10000)  # AUMENTADO: 5s -> 10s
                 print("[OK] Campo RUT encontrado")
                 sys.stdout.flush()
-                await page.wait_for_timeout(500)  # AUMENTADO: 200ms -> 500ms
+                await self.pacing.pause(page, 200)
                 await page.click("#rut")
                 await page.evaluate("document.getElementById('rut').removeAttribute('readonly')")
-                await page.wait_for_timeout(500)  # AUMENTADO: 210ms -> 500ms
+                await self.pacing.pause(page, 210)
                 
                 # Ingresar RUT simulando escritura humana
                 print(" Ingresando RUT...")
@@ -1578,7 +1802,7 @@ class BancoEstadoScraper:
                 print(f"[INFO] RUT procesado: {rut}")
                 sys.stdout.flush()
                 await self.type_like_human(page, "#rut", rut, delay=300)  # AUMENTADO: 200ms -> 300ms
-                await page.wait_for_timeout(random.randint(800, 1000))  # AUMENTADO: 500-600ms -> 800-1200ms
+                await self.pacing.pause(page, 500, 600)
                 print("[OK] RUT ingresado exitosamente")
                 sys.stdout.flush()
                 
@@ -1594,19 +1818,20 @@ class BancoEstadoScraper:
                     setTimeout(() => input.setSelectionRange(start, start), 200);
                 }
             """, rut)
-            await page.wait_for_timeout(random.randint(800, 1200))  # AUMENTADO: 500-600ms -> 800-1200ms
+            await self.pacing.pause(page, 500, 600)
             
             # Buscar y llenar el campo de contraseña
+            await self.cancelacion.check()
             print(" Buscando campo de contraseña...")
             try:
                 await page.click("#pass")
                 print("[OK] Campo de contraseña encontrado")
                 await page.evaluate("document.getElementById('pass').removeAttribute('readonly')")
-                await page.wait_for_timeout(1500)  # AUMENTADO: 1000ms -> 1500ms
+                await self.pacing.pause(page, 1000)
                 
                 print(" Ingresando contraseña...")
                 await self.type_like_human(page, "#pass", credentials.password, delay=300)  # AUMENTADO: 200ms -> 300ms
-                await page.wait_for_timeout(random.randint(1000, 1500))  # AUMENTADO: 500-950ms -> 1000-1500ms
+                await self.pacing.pause(page, 500, 950)
                 print("[OK] Contraseña ingresada exitosamente")
                 
             except Exception as pass_error:
@@ -1620,10 +1845,11 @@ class BancoEstadoScraper:
                     setTimeout(() => input.setSelectionRange(length, length), 200);
                 }
             """)
-            await page.wait_for_timeout(random.randint(1000, 1800))  # AUMENTADO: 600-1100ms -> 1000-1800ms
+            await self.pacing.pause(page, 600, 1100)
             await self.simular_comportamiento_humano(page)
             await self.espera_aleatoria(page)
-            await page.wait_for_timeout(1000)  # AUMENTADO: 500ms -> 1000ms
+            await self.pacing.pause(page, 500)
+            await self.cancelacion.check()
             print(" Iniciando proceso de login...")
             sys.stdout.flush()
             try:
@@ -1642,12 +1868,13 @@ class BancoEstadoScraper:
                 sys.stdout.flush()
                 for i, selector in enumerate(ingresar_selectors):
                     try:
-                        print(f"[INFO] Probando selector {i+1}: {selector}")
-                        button = await page.wait_for_selector(selector, timeout=10000, state="visible")  # AUMENTADO: 10s -> 15s
-                        if button:
-                            login_button = button
-                            print(f"[OK] Botón 'Ingresar' encontrado con selector: {selector}")
-                            break
+                        with span('selector', grupo='ingresar', selector=selector):
+                            print(f"[INFO] Probando selector {i+1}: {selector}")
+                            button = await page.wait_for_selector(selector, timeout=10000, state="visible")  # AUMENTADO: 10s -> 15s
+                            if button:
+                                login_button = button
+                                print(f"[OK] Botón 'Ingresar' encontrado con selector: {selector}")
+                                break
                     except Exception as selector_error:
                         print(f"[INFO] Selector {i+1} falló: {selector_error}")
                         continue
@@ -1671,11 +1898,11 @@ class BancoEstadoScraper:
                     
                     raise Exception("No se pudo encontrar el botón 'Ingresar'")
                 await login_button.wait_for_element_state("enabled")
-                await page.wait_for_timeout(2000)  # AUMENTADO: 1250ms -> 2000ms
+                await self.pacing.pause(page, 1250)
                 await self.simular_movimiento_mouse_natural(page)
-                await page.wait_for_timeout(random.randint(1000, 1500))  # AUMENTADO: 600-900ms -> 1000-1500ms
+                await self.pacing.pause(page, 600, 900)
                 await login_button.hover()
-                await page.wait_for_timeout(random.randint(1000, 1500))  # AUMENTADO: 600-900ms -> 1000-1500ms
+                await self.pacing.pause(page, 600, 900)
                 success = False
                 try:
                     await login_button.click(delay=random.randint(300, 600))  # AUMENTADO: 200-400ms -> 300-600ms
@@ -1684,7 +1911,7 @@ class BancoEstadoScraper:
                     print(f"Intento 1 fallido: {e}")
                 if not success:
                     try:
-                        await page.wait_for_timeout(2500)  # AUMENTADO: 1100ms -> 2000ms
+                        await page.wait_for_timeout(1100)
                         await page.evaluate("""
                             (button) => {
                                 button.click();
@@ -1696,7 +1923,7 @@ class BancoEstadoScraper:
                         print(f"Intento 2 fallido: {e}")
                 if not success:
                     try:
-                        await page.wait_for_timeout(1500)  # AUMENTADO: 700ms -> 1500ms
+                        await page.wait_for_timeout(700)
                         await page.evaluate("""
                             (button) => {
                                 const clickEvent = new MouseEvent('click', {
@@ -1726,20 +1953,20 @@ class BancoEstadoScraper:
                 
                 print("[INFO] Click exitoso, esperando navegación...")
                 sys.stdout.flush()
-                await page.wait_for_timeout(6000)  # AUMENTADO: 3s -> 5s
-                await page.wait_for_load_state("networkidle", timeout=16000)  # AUMENTADO: 15s -> 25s
-                await page.wait_for_timeout(6000)  # AUMENTADO: 6s -> 8s
+                # Resuelve apenas aparece el dashboard o un mensaje de error
+                resultado_login = await wait_for_first(page, LOGIN_OUTCOME_SELECTORS, timeout=45000)
+                if resultado_login is None:
+                    print("[WARNING] No apareció el dashboard ni un error tras el login")
+                await settle(page)
                 print("[OK] Navegación completada")
                 sys.stdout.flush()
             except Exception as e:
                 print(f"ERROR: Error al intentar hacer click en el botón: {str(e)}")
                 raise
-            await page.wait_for_timeout(7000)  # AUMENTADO: 5s -> 7s
             modal_error = page.locator("text='ha ocurrido un error'")
             if await modal_error.count() > 0:
                 print("[WARNING] Modal de error detectado tras login")
                 raise Exception("ERROR: Error visible en pantalla después de iniciar sesión")
-            await page.wait_for_timeout(7000)  # AUMENTADO: 7020ms -> 9000ms
             content = await page.content()
             errores = [
                 "clave incorrecta",
@@ -1752,11 +1979,12 @@ class BancoEstadoScraper:
             if any(e in content.lower() for e in errores):
                 error_msg = next((e for e in errores if e in content.lower()), "Error general al iniciar sesión")
                 raise Exception(f"ERROR: {error_msg.capitalize()}")
+            await self.cancelacion.check()
             current_url = page.url
             print(f"URL actual: {current_url}")
             print("Explorando dashboard...")
             await self.simular_scroll_natural(page)
-            await page.wait_for_timeout(random.randint(2000, 3350))  # AUMENTADO: 1500-2200ms -> 2000-3000ms
+            await self.pacing.pause(page, 1500, 2200)
             print(" Verificando si el login fue exitoso...")
             sys.stdout.flush()
             try:
@@ -1768,17 +1996,14 @@ class BancoEstadoScraper:
                 login_success = False
                 print(f"[INFO] Verificando login con {len(success_selectors)} selectores")
                 sys.stdout.flush()
-                for i, selector in enumerate(success_selectors):
-                    try:
-                        print(f"[INFO] Buscando selector {i+1}: {selector}")
-                        await page.wait_for_selector(selector, timeout=20000)  # AUMENTADO: 10s -> 15s
-                        print(f"[OK] Login confirmado: Elemento {selector} encontrado")
-                        login_success = True
-                        break
-                    except Exception as selector_error:
-                        print(f"[INFO] Selector {i+1} no encontrado: {selector_error}")
-                        continue
-                        
+                # Se esperan en paralelo: basta con que aparezca cualquiera
+                selector = await wait_for_first(page, success_selectors, state="attached", timeout=20000)
+                if selector:
+                    print(f"[OK] Login confirmado: Elemento {selector} encontrado")
+                    login_success = True
+                else:
+                    print("[INFO] Ningún selector de login exitoso encontrado")
+
                 if not login_success:
                     print(f"[INFO] Verificando login por URL: {current_url}")
                     if any(x in current_url.lower() for x in ["personas/home", "personas/inicio", "#home", "dashboard"]):
@@ -1809,14 +2034,14 @@ class BancoEstadoScraper:
                     
                 print("[OK] Login exitoso verificado")
                 await self.simular_scroll_natural(page)
-                await page.wait_for_timeout(random.randint(1000, 5000))  # AUMENTADO: 500-1000ms -> 1000-2000ms
+                await self.pacing.pause(page, 500, 1000)
                 await page.evaluate("""
                     window.scrollTo({
                         top: 0,
                         behavior: 'smooth'
                     });
                 """)
-                await page.wait_for_timeout(7000)  # AUMENTADO: 4s -> 6s
+                await settle(page)
                 return True
                 
             except Exception as e:
@@ -1830,8 +2055,6 @@ async def main():
     try:
         # Configuración del scraper
         config = ScraperConfig(
-            redis_host='localhost',
-            redis_port=6379,
             debug_mode=True,
             geolocation={
                 "latitude": -33.4489,
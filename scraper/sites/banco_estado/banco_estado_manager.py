@@ -1,14 +1,13 @@
 import os
 import sys
 import json
-import time
-import redis
+import redis.asyncio as redis
 import logging
 import traceback
 from pathlib import Path
 import importlib.util
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 # Agregar el directorio raíz del proyecto al path de Python
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
@@ -18,6 +17,9 @@ if project_root not in sys.path:
 from scraper.models.scraper_models import ScraperTask, ScraperResult
 from scraper.utils.data_processor import DataProcessor
 from scraper.utils.redis_client import update_task_status, store_result
+# Mismos módulos que importa el scraper (`utils.…`, ver scraper/__init__.py)
+from utils.cancellation import CancellationToken
+from utils.redis_pool import close_redis, get_redis
 
 # Importar directamente el módulo para evitar conflictos de nombres
 import scraper.sites.banco_estado.banco_estado_local_v2 as banco_estado_local_v2
@@ -30,37 +32,25 @@ logging.basicConfig(
 logger = logging.getLogger('banco-estado-scraper')
 
 class BancoEstadoScraperManager:
-    def __init__(self):
+    # Segundos que BLPOP espera por una tarea antes de volver a revisar should_stop
+    QUEUE_BLOCK_TIMEOUT = 5
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None):
+        logger.debug("Configurando cliente Redis asíncrono...")
+        # Pool compartido del proceso; el socket_timeout debe superar la espera de BLPOP
+        self.redis_client = redis_client or get_redis(socket_timeout=self.QUEUE_BLOCK_TIMEOUT + 5)
+        self.should_stop = False
+
+    async def connect(self) -> None:
+        """Verifica la conexión con Redis"""
         try:
             logger.debug("Iniciando conexión con Redis...")
-            self.redis_client = redis.Redis(
-                host=os.getenv('REDIS_HOST', 'localhost'),
-                port=int(os.getenv('REDIS_PORT', 6379)),
-                decode_responses=True
-            )
-            # Verificar conexión con Redis
-            self.redis_client.ping()
+            await self.redis_client.ping()
             logger.debug("Conexión con Redis establecida")
         except Exception as e:
             logger.error(f"Error al conectar con Redis: {e}")
             raise
 
-        self.should_stop = False
-
-    def check_for_cancellation(self, task_id: str) -> bool:
-        """Verifica si hay una señal de cancelación para la tarea actual"""
-        try:
-            control_data = self.redis_client.rpop('scraper:control')
-            if control_data:
-                control = json.loads(control_data)
-                if control.get('action') == 'cancel' and control.get('id') == task_id:
-                    logger.info(f"Tarea {task_id} cancelada")
-                    update_task_status(self.redis_client, task_id, 'cancelled', 'Tarea cancelada por el usuario')
-                    return True
-        except Exception as e:
-            logger.error(f"Error al verificar cancelación: {e}")
-        return False
-
     async def process_task(self, task_data: str) -> None:
         """Procesa una tarea de scraping"""
         try:
@@ -73,28 +63,34 @@ class BancoEstadoScraperManager:
                 raise ValueError("Credenciales incompletas")
 
             logger.info(f"Procesando tarea {task.id} para RUT: {rut}")
-            update_task_status(self.redis_client, task.id, 'processing', 'Iniciando proceso de scraping', 0)
+            await update_task_status(self.redis_client, task.id, 'processing', 'Iniciando proceso de scraping', 0)
             
             # Crear configuración del scraper
             config = banco_estado_local_v2.ScraperConfig(
-                redis_host=os.getenv('REDIS_HOST', 'localhost'),
-                redis_port=int(os.getenv('REDIS_PORT', 6379)),
                 debug_mode=True
             )
             
             logger.info(f"Configuración del scraper creada exitosamente")
             
             # Actualizar progreso
-            update_task_status(self.redis_client, task.id, 'processing', 'Configurando scraper...', 10)
+            await update_task_status(self.redis_client, task.id, 'processing', 'Configurando scraper...', 10)
             
-            scraper = banco_estado_local_v2.BancoEstadoScraper(config)
+            # La cancelación llega por scraper:cancel:{id}, propia de esta tarea
+            scraper = banco_estado_local_v2.BancoEstadoScraper(
+                config,
+                redis_client=self.redis_client,
+                cancelacion=CancellationToken(self.redis_client, task.id)
+            )
             
             # Actualizar progreso
-            update_task_status(self.redis_client, task.id, 'processing', 'Ejecutando scraping...', 20)
+            await update_task_status(self.redis_client, task.id, 'processing', 'Ejecutando scraping...', 20)
             
             result = await scraper.run(task.id, task_dict)
             
-            if result and result.get('success'):
+            if result and result.get('cancelled'):
+                logger.info(f"Tarea {task.id} cancelada")
+                await update_task_status(self.redis_client, task.id, 'cancelled', 'Tarea cancelada por el usuario')
+            elif result and result.get('success'):
                 # Mostrar estadísticas en el log
                 logger.info(f"Scraping completado exitosamente:")
                 logger.info(f"  - Cuentas: {result.get('total_cuentas', 0)}")
@@ -106,10 +102,10 @@ class BancoEstadoScraperManager:
                     logger.info(f"  - Sin categorizar: {stats.get('uncategorized', 0)}")
                 
                 # Guardar el resultado en Redis
-                store_result(self.redis_client, task.id, result)
+                await store_result(self.redis_client, task.id, result)
                 
                 # Actualizar estado final
-                update_task_status(
+                await update_task_status(
                     self.redis_client,
                     task.id,
                     'completed',
@@ -122,7 +118,7 @@ class BancoEstadoScraperManager:
                 error_message = result.get('error', 'Error desconocido') if result else "El scraper no retornó resultados"
                 logger.error(f"Scraping falló: {error_message}")
                 
-                update_task_status(
+                await update_task_status(
                     self.redis_client,
                     task.id,
                     'failed',
@@ -133,7 +129,7 @@ class BancoEstadoScraperManager:
 
         except Exception as e:
             logger.error(f"Error en el scraping: {str(e)}\n{traceback.format_exc()}")
-            update_task_status(
+            await update_task_status(
                 self.redis_client,
                 task.id,
                 'failed',
@@ -145,11 +141,12 @@ class BancoEstadoScraperManager:
     async def run(self) -> None:
         """Ejecuta el loop principal del scraper manager"""
         logger.info("Iniciando gestor de scraping de BancoEstado")
+        await self.connect()
         
         while not self.should_stop:
             try:
                 # Obtener tarea de la cola
-                task_data = self.redis_client.blpop('scraper:queue', timeout=1)
+                task_data = await self.redis_client.blpop('scraper:queue', timeout=self.QUEUE_BLOCK_TIMEOUT)
                 
                 if task_data:
                     _, task_json = task_data
@@ -158,14 +155,16 @@ class BancoEstadoScraperManager:
                     
                     # Crear la tarea en Redis
                     task_key = f"scraper:tasks:{task.id}"
-                    self.redis_client.hset(task_key, 'data', task_json)
+                    await self.redis_client.hset(task_key, 'data', task_json)
                     
                     logger.info(f"Nueva tarea recibida: {task_json}")
                     await self.process_task(task_json)
                 
             except Exception as e:
                 logger.error(f"Error en el loop principal: {e}")
-                time.sleep(1)
+                await asyncio.sleep(1)
+
+        await close_redis()
 
 def main():
     try:
@@ -0,0 +1,185 @@
+"""
+Pool de navegadores Chromium compartido entre tareas
+
+Mantiene un navegador abierto durante la vida del proceso y entrega a cada
+tarea un BrowserContext nuevo y aislado (cookies, storage y caché propios).
+El navegador se recicla tras un número de usos, cuando crece demasiado en
+memoria o cuando se desconecta.
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from playwright.async_api import async_playwright, Browser, BrowserContext
+
+
+def default_launch_options() -> Dict:
+    """Opciones de lanzamiento según el entorno (Railway o local)"""
+    if os.getenv('RAILWAY_ENVIRONMENT') == 'production':
+        return {
+            'headless': False,  # Mantener interfaz gráfica
+            'slow_mo': 50,
+            'args': [
+                '--no-sandbox',
+                '--disable-setuid-sandbox',
+                '--disable-dev-shm-usage',
+                '--disable-blink-features=AutomationControlled',
+                '--disable-web-security',
+                '--disable-extensions',
+                '--no-first-run',
+                '--display=:99'
+            ]
+        }
+    # Configuración local (normal)
+    return {'headless': False, 'slow_mo': 50}
+
+
+def child_processes_rss_mb(root_pid: Optional[int] = None) -> float:
+    """
+    Memoria residente (MB) de todos los procesos descendientes de `root_pid`.
+    Incluye el driver de Playwright y los procesos de Chromium. Solo Linux;
+    en otros sistemas retorna 0.
+    """
+    root_pid = root_pid or os.getpid()
+    try:
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # El nombre del proceso va entre paréntesis y puede contener espacios
+                    stat = f.read().rsplit(')', 1)[1].split()
+                children.setdefault(int(stat[1]), []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+
+        total_kb = 0
+        pending = list(children.get(root_pid, []))
+        while pending:
+            pid = pending.pop()
+            pending.extend(children.get(pid, []))
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total_kb += int(line.split()[1])
+                            break
+            except (OSError, ValueError):
+                continue
+        return total_kb / 1024
+    except OSError:
+        return 0.0
+
+
+class BrowserPool:
+    """Navegador de larga vida que entrega contextos aislados con un tope de concurrencia"""
+
+    def __init__(self, max_contexts: int = 2, max_uses: Optional[int] = None,
+                 max_memory_mb: Optional[float] = None, launch_options: Optional[Dict] = None):
+        self.max_contexts = max_contexts
+        # Contextos entregados por un mismo navegador antes de reciclarlo
+        self.max_uses = max_uses or int(os.getenv('SCRAPER_BROWSER_MAX_USES', '25'))
+        # Memoria total de los procesos del navegador que dispara el reciclaje
+        self.max_memory_mb = max_memory_mb or float(os.getenv('SCRAPER_BROWSER_MAX_MEMORY_MB', '1500'))
+        self.launch_options = launch_options or default_launch_options()
+
+        self._slots = asyncio.Semaphore(max_contexts)
+        self._lock = asyncio.Lock()
+        self._playwright = None
+        self._browser: Optional[Browser] = None
+        self._uses = 0
+        # Contextos abiertos por navegador; los retirados se cierran al quedar sin contextos
+        self._leases: Dict[Browser, int] = {}
+        self._retired = set()
+
+    async def start(self) -> None:
+        """Inicia Playwright y el primer navegador"""
+        async with self._lock:
+            await self._ensure_browser()
+
+    async def close(self) -> None:
+        """Cierra todos los navegadores y detiene Playwright"""
+        async with self._lock:
+            for browser in list(self._leases):
+                await self._close_browser(browser)
+            self._leases.clear()
+            self._retired.clear()
+            self._browser = None
+            if self._playwright:
+                await self._playwright.stop()
+                self._playwright = None
+
+    @asynccontextmanager
+    async def context(self, **context_options) -> BrowserContext:
+        """Entrega un BrowserContext nuevo; se cierra al salir del bloque"""
+        async with self._slots:
+            async with self._lock:
+                browser = await self._ensure_browser()
+                self._uses += 1
+                self._leases[browser] = self._leases.get(browser, 0) + 1
+
+            context = None
+            try:
+                context = await browser.new_context(**context_options)
+                yield context
+            finally:
+                if context:
+                    try:
+                        await context.close()
+                    except Exception as e:
+                        print(f"[WARNING] Error cerrando contexto del navegador: {e}")
+                async with self._lock:
+                    if browser in self._leases:
+                        self._leases[browser] -= 1
+                        if browser in self._retired and self._leases[browser] <= 0:
+                            await self._close_browser(browser)
+
+    def is_healthy(self) -> bool:
+        """El navegador actual sigue conectado"""
+        return self._browser is not None and self._browser.is_connected()
+
+    def needs_recycle(self) -> bool:
+        """El navegador actual superó su límite de usos o de memoria"""
+        if self._uses >= self.max_uses:
+            print(f"[INFO] Navegador reciclado tras {self._uses} usos")
+            return True
+        if self._retired:
+            # Mientras un navegador retirado siga abierto la medición incluiría su memoria
+            return False
+        memory_mb = child_processes_rss_mb()
+        if memory_mb > self.max_memory_mb:
+            print(f"[INFO] Navegador reciclado por memoria ({memory_mb:.0f} MB > {self.max_memory_mb:.0f} MB)")
+            return True
+        return False
+
+    async def _ensure_browser(self) -> Browser:
+        """Retorna un navegador sano, lanzando uno nuevo si hace falta (requiere el lock)"""
+        if self._browser is not None and (not self.is_healthy() or self.needs_recycle()):
+            self._retire(self._browser)
+            self._browser = None
+
+        if self._browser is None:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            print("[INFO] Lanzando navegador del pool...")
+            self._browser = await self._playwright.chromium.launch(**self.launch_options)
+            self._leases[self._browser] = 0
+            self._uses = 0
+        return self._browser
+
+    def _retire(self, browser: Browser) -> None:
+        """Marca un navegador para cerrarse cuando no tenga contextos abiertos"""
+        self._retired.add(browser)
+        if self._leases.get(browser, 0) <= 0:
+            asyncio.create_task(self._close_browser(browser))
+
+    async def _close_browser(self, browser: Browser) -> None:
+        self._retired.discard(browser)
+        self._leases.pop(browser, None)
+        try:
+            if browser.is_connected():
+                await browser.close()
+        except Exception as e:
+            print(f"[WARNING] Error cerrando navegador: {e}")
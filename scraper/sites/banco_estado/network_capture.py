@@ -0,0 +1,288 @@
+"""
+Captura de las respuestas JSON del sitio de BancoEstado
+
+El carrusel de productos y la grilla de movimientos se llenan con llamadas
+XHR de la aplicación Angular. En vez de leer el DOM fila por fila, se
+escuchan esas respuestas y se interpretan directamente, con montos exactos.
+Solo se captura lo que la aplicación pidió: si la respuesta de movimientos
+viene paginada (total de registros o de páginas mayor a lo recibido, o un
+campo de página siguiente), el scraper pagina por el DOM. Como la API del
+banco no está documentada, el reconocimiento es heurístico (por nombres de
+campos); si no se reconoce nada, el scraper vuelve a la extracción por DOM.
+Por eso el modo por defecto sigue siendo el DOM.
+"""
+import asyncio
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .waits import is_api_response
+
+# Modos de extracción (ScraperConfig.extraction_mode)
+MODE_DOM = "dom"          # Solo DOM (comportamiento original)
+MODE_NETWORK = "network"  # Solo respuestas de red (salvo respuestas paginadas)
+MODE_AUTO = "auto"        # Red primero y DOM si no se capturó nada
+EXTRACTION_MODES = (MODE_DOM, MODE_NETWORK, MODE_AUTO)
+
+# Nombres de campos conocidos (en minúsculas y sin guiones bajos)
+FECHA_KEYS = ("fecha", "fechamovimiento", "fechacontable", "fechaoperacion", "fechatransaccion", "date", "transactiondate")
+DESC_KEYS = ("descripcion", "glosa", "detalle", "descripcionmovimiento", "description", "concepto")
+MONTO_KEYS = ("monto", "importe", "montomovimiento", "amount", "valor")
+CARGO_KEYS = ("cargo", "cargos", "montocargo", "debito", "debit")
+ABONO_KEYS = ("abono", "abonos", "montoabono", "credito", "credit")
+TIPO_KEYS = ("tipo", "tipomovimiento", "naturaleza", "signo", "type", "indicadorcargoabono")
+NUMERO_KEYS = ("numero", "numerocuenta", "nrocuenta", "numeroproducto", "accountnumber", "cuenta")
+SALDO_KEYS = ("saldo", "saldodisponible", "saldocontable", "balance", "availablebalance")
+NOMBRE_KEYS = ("nombre", "nombreproducto", "tipocuenta", "descripcionproducto", "producto", "glosaproducto", "productname")
+# Campos de paginación de la respuesta
+PAGINA_KEYS = ("pagina", "paginaactual", "numeropagina", "page", "pagenumber", "currentpage")
+TOTAL_PAGINAS_KEYS = ("totalpaginas", "cantidadpaginas", "totalpages", "pagecount")
+TOTAL_REGISTROS_KEYS = ("totalregistros", "cantidadregistros", "totalmovimientos", "totalelements",
+                        "totalitems", "totalcount", "total")
+SIGUIENTE_KEYS = ("siguiente", "paginasiguiente", "haymas", "haysiguiente", "hasnext", "hasmore",
+                  "next", "nextpage", "nextpagetoken")
+ULTIMA_KEYS = ("ultimapagina", "esultima", "last")
+
+FECHA_ISO = re.compile(r'^(\d{4})-(\d{2})-(\d{2})')
+FECHA_CL = re.compile(r'\d{2}/\d{2}/\d{4}')
+
+
+def _normalizar_clave(key: str) -> str:
+    return key.replace("_", "").replace("-", "").lower()
+
+
+def _buscar(item: Dict[str, Any], keys: Tuple[str, ...]) -> Optional[Any]:
+    """Primer valor no vacío cuyo nombre de campo está en `keys` (en ese orden)"""
+    normalizado = {_normalizar_clave(k): v for k, v in item.items()}
+    for key in keys:
+        value = normalizado.get(key)
+        if value not in (None, "", []):
+            return value
+    return None
+
+
+def _a_entero(value: Any) -> Optional[int]:
+    """Convierte un monto numérico o de texto ('$ -1.234', '1234.00') a entero"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(round(value))
+    if isinstance(value, str):
+        texto = value.strip()
+        negativo = texto.startswith("-") or "-$" in texto or "$-" in texto.replace(" ", "")
+        # Los decimales (',00' o '.00' al final) no se consideran en CLP
+        texto = re.sub(r'[.,]\d{1,2}$', '', texto)
+        digitos = re.sub(r'\D', '', texto)
+        if not digitos:
+            return None
+        return -int(digitos) if negativo else int(digitos)
+    return None
+
+
+def _a_fecha(value: Any) -> Optional[str]:
+    """Normaliza la fecha al formato dd/mm/yyyy que produce la extracción por DOM"""
+    if not isinstance(value, str):
+        return None
+    match = FECHA_CL.search(value)
+    if match:
+        return match.group(0)
+    match = FECHA_ISO.match(value.strip())
+    if match:
+        return f"{match.group(3)}/{match.group(2)}/{match.group(1)}"
+    return None
+
+
+def _es_cargo(item: Dict[str, Any]) -> bool:
+    tipo = _buscar(item, TIPO_KEYS)
+    if not isinstance(tipo, str):
+        return False
+    tipo = tipo.strip().lower()
+    return tipo in ("c", "d", "-", "cargo", "debito", "débito", "debit") or tipo.startswith("cargo")
+
+
+def _listas_de_objetos(payload: Any) -> Iterator[List[Dict[str, Any]]]:
+    """Recorre el JSON y entrega cada lista de objetos que contenga"""
+    if isinstance(payload, list):
+        if payload and all(isinstance(x, dict) for x in payload):
+            yield payload
+        for x in payload:
+            yield from _listas_de_objetos(x)
+    elif isinstance(payload, dict):
+        for value in payload.values():
+            yield from _listas_de_objetos(value)
+
+
+def _objetos_envoltorio(payload: Any) -> Iterator[Dict[str, Any]]:
+    """Objetos del JSON fuera de las listas (donde viaja la paginación, no los movimientos)"""
+    if isinstance(payload, dict):
+        yield payload
+        for value in payload.values():
+            yield from _objetos_envoltorio(value)
+
+
+def hay_mas_paginas(payload: Any, recibidos: int) -> bool:
+    """
+    True si la respuesta indica que faltan páginas: un campo de página
+    siguiente, una página actual menor al total de páginas o un total de
+    registros mayor a los `recibidos`. Ante la duda conviene True (se pagina
+    por el DOM) antes que perder movimientos.
+    """
+    for item in _objetos_envoltorio(payload):
+        siguiente = _buscar(item, SIGUIENTE_KEYS)
+        if siguiente is True or (not isinstance(siguiente, bool) and siguiente is not None):
+            return True
+        if _buscar(item, ULTIMA_KEYS) is False:
+            return True
+        total_paginas = _a_entero(_buscar(item, TOTAL_PAGINAS_KEYS))
+        if total_paginas and total_paginas > 1:
+            pagina = _a_entero(_buscar(item, PAGINA_KEYS))
+            # Página 0 o 1 indistintamente: la numeración puede partir de cualquiera de las dos
+            if pagina is None or pagina < total_paginas:
+                return True
+        total = _a_entero(_buscar(item, TOTAL_REGISTROS_KEYS))
+        if total and total > recibidos:
+            return True
+    return False
+
+
+def parse_movimiento(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Movimiento en el formato de la extracción por DOM, o None si no lo parece"""
+    fecha = _a_fecha(_buscar(item, FECHA_KEYS))
+    descripcion = _buscar(item, DESC_KEYS)
+    if not fecha or not isinstance(descripcion, str) or not descripcion.strip():
+        return None
+
+    monto = _a_entero(_buscar(item, MONTO_KEYS))
+    if monto is not None:
+        if monto > 0 and _es_cargo(item):
+            monto = -monto
+    else:
+        # Formato con columnas separadas de cargo y abono
+        cargo = _a_entero(_buscar(item, CARGO_KEYS)) or 0
+        abono = _a_entero(_buscar(item, ABONO_KEYS)) or 0
+        if not cargo and not abono:
+            return None
+        monto = abono - abs(cargo)
+
+    return {
+        'fecha': fecha,
+        'descripcion': descripcion.strip(),
+        'monto': monto
+    }
+
+
+def parse_cuenta(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Cuenta en el formato de extract_cuentas, o None si no lo parece"""
+    numero = _buscar(item, NUMERO_KEYS)
+    saldo = _a_entero(_buscar(item, SALDO_KEYS))
+    if isinstance(numero, (int, float)) and not isinstance(numero, bool):
+        numero = str(int(numero))
+    if not isinstance(numero, str) or not re.search(r'\d{4,}', numero) or saldo is None:
+        return None
+    nombre = _buscar(item, NOMBRE_KEYS)
+    return {
+        "numero": numero.strip(),
+        "tipo": nombre.strip() if isinstance(nombre, str) else "",
+        "saldo": saldo,
+        "moneda": "CLP",
+        "titular": "",
+        "estado": "activa"
+    }
+
+
+def parse_movimientos(payload: Any) -> List[Dict[str, Any]]:
+    """Movimientos de la lista más grande del JSON que parezca de movimientos"""
+    mejor: List[Dict[str, Any]] = []
+    for lista in _listas_de_objetos(payload):
+        movimientos = [m for m in (parse_movimiento(item) for item in lista) if m]
+        # Se exige que la mayoría de los objetos calce para descartar listas ajenas
+        if len(movimientos) * 2 >= len(lista) and len(movimientos) > len(mejor):
+            mejor = movimientos
+    return mejor
+
+
+def parse_cuentas(payload: Any) -> List[Dict[str, Any]]:
+    """Cuentas de todas las listas del JSON que parezcan listas de productos"""
+    cuentas: List[Dict[str, Any]] = []
+    for lista in _listas_de_objetos(payload):
+        encontradas = [c for c in (parse_cuenta(item) for item in lista) if c]
+        if len(encontradas) * 2 >= len(lista):
+            for cuenta in encontradas:
+                if not any(c["numero"] == cuenta["numero"] for c in cuentas):
+                    cuentas.append(cuenta)
+    return cuentas
+
+
+class NetworkCapture:
+    """Guarda las respuestas JSON de una página para interpretarlas después"""
+
+    def __init__(self, page):
+        self.page = page
+        # (secuencia, url, payload); la secuencia se asigna al recibir la respuesta
+        self._payloads: List[Tuple[int, str, Any]] = []
+        self._seq = 0
+        self._pending = set()
+
+    def start(self) -> None:
+        self.page.on("response", self._on_response)
+
+    def stop(self) -> None:
+        self.page.remove_listener("response", self._on_response)
+
+    def mark(self) -> int:
+        """Posición actual; sirve para leer solo lo que llegue después de una acción"""
+        return self._seq
+
+    async def flush(self) -> None:
+        """Espera a que terminen de leerse los cuerpos de las respuestas ya recibidas"""
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    def cuentas(self, since: int = 0) -> List[Dict[str, Any]]:
+        cuentas: List[Dict[str, Any]] = []
+        for _, payload in self._ultimas(since):
+            for cuenta in parse_cuentas(payload):
+                if not any(c["numero"] == cuenta["numero"] for c in cuentas):
+                    cuentas.append(cuenta)
+        return cuentas
+
+    def movimientos(self, since: int = 0) -> List[Dict[str, Any]]:
+        movimientos: List[Dict[str, Any]] = []
+        for _, payload in self._ultimas(since):
+            movimientos.extend(parse_movimientos(payload))
+        return movimientos
+
+    def paginado(self, since: int = 0) -> bool:
+        """True si alguna respuesta de movimientos desde `since` no trae todas las páginas"""
+        for _, payload in self._ultimas(since):
+            encontrados = parse_movimientos(payload)
+            if encontrados and hay_mas_paginas(payload, len(encontrados)):
+                return True
+        return False
+
+    def _ultimas(self, since: int) -> List[Tuple[str, Any]]:
+        """Respuestas desde `since`, dejando solo la última por URL (la app suele repetir llamadas)"""
+        por_url: Dict[str, Any] = {}
+        for seq, url, payload in sorted(self._payloads, key=lambda p: p[0]):
+            if seq <= since:
+                continue
+            por_url.pop(url, None)
+            por_url[url] = payload
+        return list(por_url.items())
+
+    def _on_response(self, response) -> None:
+        if not is_api_response(response) or response.status != 200:
+            return
+        if "json" not in response.headers.get("content-type", ""):
+            return
+        self._seq += 1
+        task = asyncio.ensure_future(self._store(self._seq, response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _store(self, seq: int, response) -> None:
+        try:
+            payload = await response.json()
+        except Exception:
+            # Respuesta sin cuerpo o la página navegó antes de leerlo
+            return
+        self._payloads.append((seq, response.url, payload))
@@ -0,0 +1,174 @@
+"""
+Política de recursos para las sesiones de scraping
+
+El portal de BancoEstado descarga imágenes, fuentes, videos y scripts de
+analítica que el scraper no necesita, y la página de inicio se vuelve a
+cargar entre cuenta y cuenta. Esta política intercepta las peticiones del
+contexto con `context.route`:
+- bloquea imágenes, media y fuentes,
+- responde vacío a los trackers de terceros (para que la app no falle),
+- deja pasar siempre lo que el login y los chequeos anti-bot necesitan.
+
+Modos (SCRAPER_RESOURCE_POLICY):
+- "measure": no bloquea nada; solo mide cuántas peticiones y bytes se
+  habrían ahorrado (por defecto).
+- "trackers": solo responde vacío a los trackers de terceros.
+- "block": aplica la política completa; hay que activarlo explícitamente
+  después de medir, porque un recurso bloqueado de más puede romper el login.
+- "off": sin interceptar.
+
+Nota: interceptar con `route` desactiva la caché HTTP del contexto; por eso
+el modo "measure" no intercepta, solo escucha las peticiones terminadas.
+"""
+import asyncio
+import os
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+MODE_BLOCK = "block"
+MODE_MEASURE = "measure"
+MODE_TRACKERS = "trackers"
+MODE_OFF = "off"
+
+# Tipos de recurso que no aportan nada a la extracción
+BLOCKED_TYPES = ("image", "media", "font")
+
+# Analítica y publicidad de terceros
+TRACKER_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googleadservices.com",
+    "googlesyndication.com",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "clarity.ms",
+    "bing.com",
+    "tiktok.com",
+    "linkedin.com",
+    "licdn.com",
+    "criteo.com",
+    "taboola.com",
+    "adnxs.com",
+    "youtube.com",
+    "ytimg.com",
+)
+
+# Siempre permitidos: captchas y detección de bots que validan el login
+ALLOWED_HOSTS = (
+    "google.com/recaptcha",
+    "gstatic.com/recaptcha",
+    "recaptcha.net",
+    "hcaptcha.com",
+    "akamaihd.net",
+    "akstat.io",
+)
+
+
+class ResourcePolicy:
+    """Bloqueo de recursos por contexto con estadísticas de ahorro"""
+
+    def __init__(self, mode: Optional[str] = None, allow: Optional[Tuple[str, ...]] = None):
+        self.mode = (mode or os.getenv('SCRAPER_RESOURCE_POLICY', MODE_MEASURE)).lower()
+        if self.mode not in (MODE_BLOCK, MODE_TRACKERS, MODE_MEASURE, MODE_OFF):
+            print(f"[WARNING] Política de recursos desconocida '{self.mode}', se usa '{MODE_MEASURE}'")
+            self.mode = MODE_MEASURE
+        extra = tuple(h.strip() for h in os.getenv('SCRAPER_RESOURCE_ALLOW', '').split(',') if h.strip())
+        self.allow = ALLOWED_HOSTS + (allow or ()) + extra
+
+        # Por categoría: [peticiones, bytes]
+        self.blocked: Dict[str, list] = {}
+        self.loaded = [0, 0]
+        self._pending = set()
+
+    def classify(self, request) -> Optional[str]:
+        """Categoría por la que se bloquearía la petición, o None si debe pasar"""
+        url = request.url
+        parsed = urlparse(url)
+        host_path = f"{parsed.hostname or ''}{parsed.path}"
+        if parsed.scheme not in ("http", "https"):
+            return None
+        if any(allowed in host_path for allowed in self.allow):
+            return None
+        host = parsed.hostname or ''
+        if any(host == tracker or host.endswith(f".{tracker}") for tracker in TRACKER_HOSTS):
+            return "tracker"
+        if self.mode != MODE_TRACKERS and request.resource_type in BLOCKED_TYPES:
+            return request.resource_type
+        return None
+
+    async def attach(self, context) -> None:
+        """Instala la política en un BrowserContext recién creado"""
+        if self.mode == MODE_OFF:
+            return
+        if self.mode in (MODE_BLOCK, MODE_TRACKERS):
+            await context.route("**/*", self._route)
+        context.on("requestfinished", self._on_request_finished)
+
+    async def _route(self, route) -> None:
+        request = route.request
+        categoria = self.classify(request)
+        if categoria is None:
+            await route.continue_()
+            return
+        self._count(categoria, 0)
+        if categoria == "tracker" and request.resource_type in ("script", "xhr", "fetch"):
+            # Un script vacío evita errores de la app al no encontrar el tracker
+            content_type = "application/javascript" if request.resource_type == "script" else "application/json"
+            await route.fulfill(status=200, content_type=content_type, body="")
+        else:
+            await route.abort()
+
+    def _on_request_finished(self, request) -> None:
+        task = asyncio.ensure_future(self._measure(request))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _measure(self, request) -> None:
+        try:
+            sizes = await request.sizes()
+            size = sizes.get("responseBodySize", 0) + sizes.get("responseHeadersSize", 0)
+        except Exception:
+            size = 0
+        categoria = self.classify(request) if self.mode == MODE_MEASURE else None
+        if categoria:
+            self._count(categoria, size)
+        else:
+            self.loaded[0] += 1
+            self.loaded[1] += size
+
+    def _count(self, categoria: str, size: int) -> None:
+        stats = self.blocked.setdefault(categoria, [0, 0])
+        stats[0] += 1
+        stats[1] += size
+
+    def report(self) -> Dict:
+        """Resumen de la sesión: peticiones cargadas y bloqueadas (o bloqueables) por categoría"""
+        return {
+            "mode": self.mode,
+            "loaded_requests": self.loaded[0],
+            "loaded_bytes": self.loaded[1],
+            "blocked": {
+                categoria: {"requests": stats[0], "bytes": stats[1]}
+                for categoria, stats in self.blocked.items()
+            },
+        }
+
+    def print_report(self) -> None:
+        if self.mode == MODE_OFF:
+            return
+        blocked_requests = sum(stats[0] for stats in self.blocked.values())
+        if self.mode == MODE_MEASURE:
+            blocked_bytes = sum(stats[1] for stats in self.blocked.values())
+            print(f"[INFO] Recursos: {self.loaded[0] + blocked_requests} peticiones, "
+                  f"se podrían ahorrar {blocked_requests} ({blocked_bytes / 1024:.0f} KB de "
+                  f"{(self.loaded[1] + blocked_bytes) / 1024:.0f} KB)")
+        else:
+            print(f"[INFO] Recursos: {self.loaded[0]} peticiones cargadas ({self.loaded[1] / 1024:.0f} KB), "
+                  f"{blocked_requests} bloqueadas")
+        for categoria, stats in sorted(self.blocked.items()):
+            detalle = f"{stats[0]} peticiones"
+            if self.mode == MODE_MEASURE:
+                detalle += f", {stats[1] / 1024:.0f} KB"
+            print(f"  - {categoria}: {detalle}")
@@ -0,0 +1,77 @@
+"""
+Caché cifrado de sesiones de BancoEstado
+
+Guarda el storage state de Playwright (cookies y localStorage) de una sesión
+autenticada para que una resincronización dentro de la ventana de sesión del
+banco pueda saltarse el login completo. Es la versión compartida entre
+réplicas de la idea de `launch_persistent_context(user_data_dir)` que usa
+banco_estado_render.py: el estado vive en Redis, cifrado con Fernet y con TTL,
+bajo una clave derivada del RUT con HMAC (el RUT nunca se guarda en claro).
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+from typing import Any, Dict, Optional
+
+from cryptography.fernet import Fernet, InvalidToken
+from redis.asyncio import Redis
+
+
+class SessionCache:
+    """Storage state de Playwright por usuario, cifrado y con expiración"""
+
+    def __init__(self, redis_client: Redis, secret: str, ttl_seconds: int = 600,
+                 prefix: str = 'scraper:session'):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._secret = secret.encode()
+        fernet_key = base64.urlsafe_b64encode(hashlib.sha256(self._secret).digest())
+        self._fernet = Fernet(fernet_key)
+
+    @classmethod
+    def from_env(cls, redis_client: Redis) -> Optional['SessionCache']:
+        """Crea el caché si SCRAPER_SESSION_KEY está definido; si no, queda desactivado"""
+        secret = os.getenv('SCRAPER_SESSION_KEY')
+        if not secret:
+            return None
+        ttl_seconds = int(os.getenv('SCRAPER_SESSION_TTL', '600'))
+        return cls(redis_client, secret, ttl_seconds)
+
+    def _key(self, rut: str) -> str:
+        rut_normalizado = rut.replace('.', '').replace('-', '').strip().lower()
+        digest = hmac.new(self._secret, rut_normalizado.encode(), hashlib.sha256).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    async def load(self, rut: str) -> Optional[Dict[str, Any]]:
+        """Retorna el storage state guardado o None si no existe, expiró o no se puede descifrar"""
+        try:
+            token = await self.redis.get(self._key(rut))
+            if not token:
+                return None
+            data = self._fernet.decrypt(token.encode(), ttl=self.ttl_seconds)
+            return json.loads(data)
+        except InvalidToken:
+            print("[WARNING] Sesión en caché inválida o expirada, se descarta")
+            await self.discard(rut)
+            return None
+        except Exception as e:
+            print(f"[WARNING] No se pudo leer la sesión en caché: {e}")
+            return None
+
+    async def save(self, rut: str, storage_state: Dict[str, Any]) -> None:
+        """Guarda el storage state cifrado con el TTL configurado"""
+        try:
+            token = self._fernet.encrypt(json.dumps(storage_state).encode()).decode()
+            await self.redis.set(self._key(rut), token, ex=self.ttl_seconds)
+        except Exception as e:
+            print(f"[WARNING] No se pudo guardar la sesión en caché: {e}")
+
+    async def discard(self, rut: str) -> None:
+        """Elimina la sesión guardada (por ejemplo, cuando el banco la rechazó)"""
+        try:
+            await self.redis.delete(self._key(rut))
+        except Exception as e:
+            print(f"[WARNING] No se pudo eliminar la sesión en caché: {e}")
@@ -0,0 +1,133 @@
+"""
+Extracción masiva de filas de la tabla de movimientos
+
+Antes cada fila se leía con decenas de llamadas `locator.count()` y
+`text_content()` (una ida y vuelta al navegador por selector probado). Aquí
+todos los selectores de respaldo se prueban dentro del navegador y una sola
+llamada `evaluate` retorna todas las filas de la página ya estructuradas.
+"""
+from typing import Any, Dict
+
+# Selectores de respaldo, en orden de preferencia (los mismos de siempre)
+TABLA_SELECTORS = [
+    "app-listado-movimientos table",
+    "div[class*='movimientos'] table",
+    "app-movimientos table",
+    ".tabla-movimientos",
+    "table.ag-table",
+    "table.movimientos-table",
+    "div[role='grid']",
+    "div.ag-body-viewport",
+    "div.ag-center-cols-container"
+]
+FILA_SELECTORS = [
+    "tbody tr",
+    "div[role='row']",
+    ".ag-row",
+    "div[class*='row']"
+]
+FECHA_SELECTORS = [
+    "td[role='cell']:nth-child(2) p",
+    "td[role='cell'] div.contentText p",
+    "div[col-id='fecha'] p",
+    ".contentText p",
+    "p.ng-star-inserted",
+    "td p"
+]
+DESC_SELECTORS = [
+    "td[role='cell']:nth-child(3) button",
+    "td[role='cell'] div.contentText.largoDescripcition button",
+    ".contentText.largoDescripcition button",
+    "button.msd-button--link"
+]
+MONTO_SELECTORS = [
+    "td[role='cell']:nth-child(5) p.amountsTransferClp span",
+    "td[role='cell'] div.contentText p.amountsTransferClp span",
+    ".contentText p.amountsTransferClp span",
+    "p.amountsTransferClp span"
+]
+
+# Se ejecuta sobre el elemento de la tabla. Replica la semántica de los
+# locators de Playwright: un selector solo sirve si coincide con exactamente
+# un elemento (con más de uno `text_content()` fallaba por modo estricto).
+EXTRACT_ROWS_SCRIPT = """
+(tabla, [filaSelectors, fechaSelectors, descSelectors, montoSelectors]) => {
+    const textoUnico = (fila, selector) => {
+        try {
+            const elementos = fila.querySelectorAll(selector);
+            return elementos.length === 1 ? elementos[0].textContent : null;
+        } catch (e) {
+            return null;
+        }
+    };
+
+    let filas = [];
+    let filaSelector = null;
+    for (const selector of filaSelectors) {
+        filas = Array.from(tabla.querySelectorAll(selector));
+        if (filas.length) {
+            filaSelector = selector;
+            break;
+        }
+    }
+
+    const resultado = filas.map(fila => {
+        let fecha = null;
+        for (const selector of fechaSelectors) {
+            const texto = textoUnico(fila, selector);
+            if (texto && texto.trim()) {
+                fecha = texto.trim();
+                if (/\\d{2}\\/\\d{2}\\/\\d{4}/.test(fecha)) break;
+            }
+        }
+        if (!fecha) {
+            const match = fila.innerHTML.match(/(\\d{2}\\/\\d{2}\\/\\d{4})/);
+            if (match) fecha = match[1];
+        }
+
+        let descripcion = null;
+        for (const selector of descSelectors) {
+            const texto = textoUnico(fila, selector);
+            if (texto && texto.trim()) {
+                descripcion = texto.trim();
+                break;
+            }
+        }
+
+        let monto = null;
+        let esCargo = false;
+        for (const selector of montoSelectors) {
+            const texto = textoUnico(fila, selector);
+            if (texto && texto.trim()) {
+                esCargo = texto.includes('-');
+                monto = texto.replace(/-/g, '').replace(/\\+/g, '').trim();
+                break;
+            }
+        }
+
+        const completa = Boolean(fecha && descripcion && monto);
+        return {
+            fecha: fecha,
+            descripcion: descripcion,
+            monto: monto,
+            es_cargo: esCargo,
+            html: completa ? null : fila.innerHTML
+        };
+    });
+    return {selector: filaSelector, filas: resultado};
+}
+"""
+
+
+async def extract_rows(tabla) -> Dict[str, Any]:
+    """
+    Extrae todas las filas visibles de la tabla en una sola llamada.
+    Retorna {'selector': selector de filas usado o None, 'filas': [...]},
+    donde cada fila trae fecha, descripcion, monto (texto sin signo),
+    es_cargo y, si quedó incompleta, su HTML para diagnóstico.
+    """
+    return await tabla.evaluate(
+        EXTRACT_ROWS_SCRIPT,
+        [FILA_SELECTORS, FECHA_SELECTORS, DESC_SELECTORS, MONTO_SELECTORS]
+    )
+
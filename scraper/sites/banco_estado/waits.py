@@ -0,0 +1,195 @@
+"""
+Esperas basadas en eventos para el scraper de BancoEstado
+
+Separa dos cosas que antes se mezclaban en `wait_for_timeout` fijos:
+- Esperas de disponibilidad: se resuelven apenas la página está lista
+  (selector visible, respuesta XHR recibida o DOM sin mutaciones).
+- Pausas humanas: jitter deliberado para no parecer un bot, controlado por
+  una política configurable e independiente de la velocidad del sitio.
+"""
+import asyncio
+import os
+import random
+from typing import Optional, Sequence
+
+from utils.timeline import span
+
+# Resuelve cuando el DOM pasa `quietMs` sin mutaciones o al llegar a `timeoutMs`.
+# Retorna true si el DOM quedó quieto y false si se agotó el tiempo.
+DOM_QUIET_SCRIPT = """
+([quietMs, timeoutMs]) => new Promise(resolve => {
+    let timer = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(done, quietMs, true);
+    });
+    const done = (quiet) => {
+        observer.disconnect();
+        clearTimeout(timer);
+        clearTimeout(deadline);
+        resolve(quiet);
+    };
+    const deadline = setTimeout(done, timeoutMs, false);
+    observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    timer = setTimeout(done, quietMs, true);
+})
+"""
+
+
+# Como DOM_QUIET_SCRIPT, pero el plazo de quietud empieza con la primera mutación:
+# true si el DOM cambió y luego quedó quieto, false si no cambió antes de `timeoutMs`.
+DOM_CHANGE_SCRIPT = """
+([quietMs, timeoutMs]) => new Promise(resolve => {
+    let timer = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(done, quietMs, true);
+    });
+    const done = (changed) => {
+        observer.disconnect();
+        clearTimeout(timer);
+        clearTimeout(deadline);
+        resolve(changed);
+    };
+    const deadline = setTimeout(done, timeoutMs, false);
+    observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+})
+"""
+
+
+class HumanPacing:
+    """
+    Política de pausas humanas. `scale` multiplica todas las pausas:
+    1.0 es el ritmo normal, valores menores aceleran y 0 las desactiva.
+    Se configura con SCRAPER_HUMAN_PACING.
+    """
+
+    def __init__(self, scale: Optional[float] = None):
+        if scale is None:
+            scale = float(os.getenv('SCRAPER_HUMAN_PACING', '1.0'))
+        self.scale = max(0.0, scale)
+
+    async def pause(self, page, min_ms: int, max_ms: Optional[int] = None) -> None:
+        """Pausa aleatoria entre `min_ms` y `max_ms` (escalada por la política)"""
+        if self.scale == 0:
+            return
+        duration = int((random.randint(min_ms, max_ms) if max_ms else min_ms) * self.scale)
+        with span('pausa', ms=duration):
+            await page.wait_for_timeout(duration)
+
+
+async def wait_for_dom_quiet(page, quiet_ms: int = 500, timeout_ms: int = 10000) -> bool:
+    """Espera a que el DOM deje de cambiar (por ejemplo, tras un render de Angular)"""
+    with span('dom_quieto') as attrs:
+        try:
+            attrs['quieto'] = await page.evaluate(DOM_QUIET_SCRIPT, [quiet_ms, timeout_ms])
+        except Exception:
+            # La página navegó durante la espera: el nuevo documento se espera con settle()
+            attrs['quieto'] = False
+        return attrs['quieto']
+
+
+async def settle(page, quiet_ms: int = 500, timeout_ms: int = 15000) -> None:
+    """Espera a que el documento cargue y su DOM quede estable"""
+    with span('settle'):
+        try:
+            await page.wait_for_load_state("domcontentloaded", timeout=timeout_ms)
+        except Exception:
+            pass
+        await wait_for_dom_quiet(page, quiet_ms, timeout_ms)
+
+
+async def wait_for_first(page, selectors: Sequence[str], state: str = "visible",
+                         timeout: int = 10000) -> Optional[str]:
+    """
+    Espera en paralelo a varios selectores y retorna el primero que alcanza
+    `state`, o None si ninguno lo hace antes del timeout. A diferencia de
+    probarlos en secuencia, el costo es el del selector más rápido.
+    """
+    waiters = {
+        asyncio.ensure_future(page.wait_for_selector(selector, state=state, timeout=timeout)): selector
+        for selector in selectors
+    }
+    pending = set(waiters)
+    try:
+        # El atributo `selector` indica cuál de los candidatos ganó (ninguno si se agotó el tiempo)
+        with span('esperar_selectores', candidatos=len(selectors)) as attrs:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for waiter in done:
+                    if not waiter.cancelled() and waiter.exception() is None:
+                        attrs['selector'] = waiters[waiter]
+                        return waiters[waiter]
+            attrs['selector'] = None
+            return None
+    finally:
+        for waiter in pending:
+            waiter.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def wait_for_page_update(page, action, quiet_ms: int = 500, timeout: int = 10000) -> str:
+    """
+    Ejecuta `action` (corrutina sin argumentos) y espera a que la página se
+    actualice, lo que ocurra primero:
+    - las llamadas XHR/fetch que disparó terminaron (paginación en el servidor),
+    - el DOM cambió y quedó quieto sin ninguna llamada en curso (paginación en
+      el cliente, que no hace peticiones).
+    Retorna "respuesta", "dom" o "timeout".
+    """
+    en_curso = set()
+    terminadas = asyncio.Event()
+
+    def on_request(request):
+        if request.resource_type in ("xhr", "fetch"):
+            en_curso.add(request)
+
+    def on_done(request):
+        if request in en_curso:
+            en_curso.discard(request)
+            if not en_curso:
+                terminadas.set()
+
+    page.on("request", on_request)
+    page.on("requestfinished", on_done)
+    page.on("requestfailed", on_done)
+    loop = asyncio.get_running_loop()
+    fin = loop.time() + timeout / 1000
+    with span('actualizar_pagina') as attrs:
+        attrs['via'] = "timeout"
+        try:
+            await action()
+            respuesta = asyncio.ensure_future(terminadas.wait())
+            dom = asyncio.ensure_future(page.evaluate(DOM_CHANGE_SCRIPT, [quiet_ms, timeout]))
+            try:
+                done, _ = await asyncio.wait({respuesta, dom}, timeout=max(0, fin - loop.time()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if respuesta in done:
+                    attrs['via'] = "respuesta"
+                elif dom in done and not dom.exception() and dom.result():
+                    # El DOM quieto no basta si hay una llamada en curso: la página aún no llega
+                    if en_curso:
+                        await asyncio.wait_for(respuesta, max(0, fin - loop.time()))
+                        attrs['via'] = "respuesta"
+                    else:
+                        attrs['via'] = "dom"
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                for waiter in (respuesta, dom):
+                    waiter.cancel()
+                await asyncio.gather(respuesta, dom, return_exceptions=True)
+        finally:
+            page.remove_listener("request", on_request)
+            page.remove_listener("requestfinished", on_done)
+            page.remove_listener("requestfailed", on_done)
+    if attrs['via'] == "respuesta":
+        # Los datos llegaron; falta que la app los dibuje
+        await wait_for_dom_quiet(page, quiet_ms)
+    return attrs['via']
+
+
+def is_api_response(response) -> bool:
+    """Respuesta de una llamada XHR/fetch (datos, no recursos estáticos)"""
+    return response.request.resource_type in ("xhr", "fetch")
@@ -0,0 +1,172 @@
+"""
+Marcas de sincronización incremental por cuenta
+
+Cada cuenta guarda en Redis hasta dónde se sincronizó: la fecha del
+movimiento más reciente enviado y las huellas de los movimientos de esa
+fecha (con cuántas veces aparece cada una, porque dos compras iguales el
+mismo día son dos movimientos). En la siguiente sincronización:
+- un movimiento con fecha anterior a la marca ya es conocido,
+- uno de la misma fecha es conocido si su huella ya estaba (hasta su cantidad),
+- apenas una página de la grilla trae movimientos conocidos se deja de paginar.
+
+La grilla del banco lista los movimientos del más reciente al más antiguo;
+la detención temprana depende de ese orden.
+
+La marca solo se actualiza después de que el backend confirmó todos los
+lotes: un envío fallido no los salta, y si quedaron lotes en el outbox la
+marca viaja con ellos y se guarda cuando el outbox los entrega.
+"""
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+FECHA_CL = re.compile(r'(\d{2})/(\d{2})/(\d{4})')
+
+
+def fecha_ordenable(fecha: Any) -> Optional[Tuple[int, int, int]]:
+    """(año, mes, día) de una fecha dd/mm/yyyy, o None si no se reconoce"""
+    match = FECHA_CL.search(fecha) if isinstance(fecha, str) else None
+    if not match:
+        return None
+    return int(match.group(3)), int(match.group(2)), int(match.group(1))
+
+
+def huella(movimiento: Dict[str, Any]) -> str:
+    """Huella de un movimiento tal como se extrajo: fecha, descripción y monto"""
+    contenido = f"{movimiento.get('fecha')}|{' '.join(str(movimiento.get('descripcion', '')).split())}|{movimiento.get('monto')}"
+    return hashlib.sha1(contenido.encode('utf-8')).hexdigest()[:16]
+
+
+class Marca:
+    """Marca de una cuenta: fecha más reciente y huellas (con cantidad) de esa fecha"""
+
+    def __init__(self, fecha: Optional[str] = None, huellas: Optional[Dict[str, int]] = None):
+        self.fecha = fecha
+        self.huellas: Dict[str, int] = dict(huellas or {})
+
+    def filtrar(self, movimientos: List[Dict[str, Any]],
+                vistos: Optional[Dict[str, int]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Separa los movimientos nuevos. Retorna (nuevos, cantidad de conocidos).
+        `vistos` acumula las apariciones de cada huella de la fecha de la marca
+        entre páginas de la misma cuenta.
+        """
+        limite = fecha_ordenable(self.fecha)
+        if limite is None:
+            return list(movimientos), 0
+        vistos = {} if vistos is None else vistos
+        nuevos = []
+        conocidos = 0
+        for movimiento in movimientos:
+            fecha = fecha_ordenable(movimiento.get('fecha'))
+            if fecha is None or fecha > limite:
+                nuevos.append(movimiento)
+                continue
+            if fecha < limite:
+                conocidos += 1
+                continue
+            clave = huella(movimiento)
+            vistos[clave] = vistos.get(clave, 0) + 1
+            if vistos[clave] <= self.huellas.get(clave, 0):
+                conocidos += 1
+            else:
+                nuevos.append(movimiento)
+        return nuevos, conocidos
+
+    def avanzar(self, nuevos: List[Dict[str, Any]]) -> bool:
+        """Incorpora los movimientos nuevos. Retorna True si la marca cambió"""
+        fechas = [(f, m) for m in nuevos for f in [fecha_ordenable(m.get('fecha'))] if f]
+        if not fechas:
+            return False
+        mas_reciente = max(f for f, _ in fechas)
+        actual = fecha_ordenable(self.fecha)
+        if actual is not None and mas_reciente < actual:
+            return False
+        if actual is None or mas_reciente > actual:
+            # Todo lo de una fecha posterior a la marca es nuevo: se parte de cero
+            self.fecha = next(m.get('fecha') for f, m in fechas if f == mas_reciente)
+            self.huellas = {}
+        for fecha, movimiento in fechas:
+            if fecha == mas_reciente:
+                clave = huella(movimiento)
+                self.huellas[clave] = self.huellas.get(clave, 0) + 1
+        return True
+
+    def combinar(self, otra: 'Marca') -> 'Marca':
+        """La más avanzada de las dos; con la misma fecha, la mayor cantidad de cada huella"""
+        propia, ajena = fecha_ordenable(self.fecha), fecha_ordenable(otra.fecha)
+        if ajena is None or (propia is not None and propia > ajena):
+            return self
+        if propia is None or ajena > propia:
+            return otra
+        huellas = dict(self.huellas)
+        for clave, cantidad in otra.huellas.items():
+            huellas[clave] = max(huellas.get(clave, 0), cantidad)
+        return Marca(self.fecha, huellas)
+
+    def to_json(self) -> str:
+        return json.dumps({'fecha': self.fecha, 'huellas': self.huellas,
+                           'updated_at': datetime.now().isoformat()})
+
+    @classmethod
+    def from_json(cls, raw: Optional[str]) -> 'Marca':
+        if not raw:
+            return cls()
+        data = json.loads(raw)
+        return cls(data.get('fecha'), data.get('huellas'))
+
+
+class SyncWatermarks:
+    """Marcas de sincronización guardadas en Redis por usuario y cuenta"""
+
+    def __init__(self, redis_client: Redis, ttl_seconds: Optional[int] = None,
+                 prefix: str = 'scraper:watermark'):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds or int(os.getenv('SCRAPER_WATERMARK_TTL', str(90 * 24 * 3600)))
+        self.prefix = prefix
+
+    @classmethod
+    def from_env(cls, redis_client: Redis) -> Optional['SyncWatermarks']:
+        """Crea las marcas salvo que SCRAPER_INCREMENTAL=0 (sincronización completa siempre)"""
+        if os.getenv('SCRAPER_INCREMENTAL', '1') == '0':
+            return None
+        return cls(redis_client)
+
+    def _key(self, user_id: Any, clave_cuenta: str) -> str:
+        return f"{self.prefix}:{user_id}:{clave_cuenta}"
+
+    async def load(self, user_id: Any, claves_cuentas: List[str]) -> Dict[str, Marca]:
+        """Marcas de las cuentas indicadas (una marca vacía si no hay registro)"""
+        if not claves_cuentas:
+            return {}
+        try:
+            raws = await self.redis.mget([self._key(user_id, clave) for clave in claves_cuentas])
+            return {clave: Marca.from_json(raw) for clave, raw in zip(claves_cuentas, raws)}
+        except Exception as e:
+            print(f"[WARNING] No se pudieron leer las marcas de sincronización, se hace sincronización completa: {e}")
+            return {}
+
+    async def merge(self, user_id: Any, marcas: Dict[str, Marca]) -> None:
+        """
+        Guarda marcas calculadas antes (lotes entregados desde el outbox) sin
+        retroceder las que otra sincronización ya haya avanzado
+        """
+        actuales = await self.load(user_id, list(marcas))
+        await self.save(user_id, {
+            clave: marca.combinar(actuales[clave]) if clave in actuales else marca
+            for clave, marca in marcas.items()
+        })
+
+    async def save(self, user_id: Any, marcas: Dict[str, Marca]) -> None:
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for clave, marca in marcas.items():
+                    pipe.set(self._key(user_id, clave), marca.to_json(), ex=self.ttl_seconds)
+                await pipe.execute()
+        except Exception as e:
+            print(f"[WARNING] No se pudieron guardar las marcas de sincronización: {e}")
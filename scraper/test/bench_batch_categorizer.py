@@ -0,0 +1,80 @@
+"""
+Micro-benchmark de la categorización por lotes
+
+Compara el camino movimiento a movimiento (lo que hace
+`process_single_movement`: normalizar la descripción y buscarla en el
+autómata de keywords) con utils.batch_categorizer.categorize_batch, y
+verifica que ambos den el mismo resultado. Usa el catálogo del backend
+(backend/src/config/companies.json).
+
+Uso (desde scraper/):
+    python test/bench_batch_categorizer.py [cantidad]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+# Agregar el directorio raíz del scraper al path de Python
+scraper_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(scraper_root)
+
+from bench_movement_normalizer import generar
+from utils.batch_categorizer import categorize_batch
+from utils.keyword_matcher import matcher_for
+from utils.movement_normalizer import normalize_movement
+
+COMPANIES_PATH = os.path.join(scraper_root, '..', 'backend', 'src', 'config', 'companies.json')
+
+
+def por_movimiento(descripciones, montos, companies):
+    """Un movimiento a la vez, como process_single_movement"""
+    matcher = matcher_for(companies)
+    categorias, tipos, referencias, movement_types = [], [], [], []
+    for descripcion, monto in zip(descripciones, montos):
+        normalizado = normalize_movement(descripcion.strip())
+        categorias.append(matcher.category(normalizado.clave))
+        tipos.append(normalizado.tipo)
+        referencias.append(normalizado.referencia)
+        movement_types.append('expense' if monto < 0 else 'income')
+    return categorias, tipos, referencias, movement_types
+
+
+def por_lote(descripciones, montos, companies):
+    return tuple(categorize_batch(descripciones, montos, companies))
+
+
+def medir(funcion, descripciones, montos, companies, repeticiones: int = 3) -> float:
+    """Mejor tiempo por movimiento, en microsegundos"""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(descripciones, montos, companies)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor / len(descripciones) * 1e6
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with open(COMPANIES_PATH, encoding='utf-8') as archivo:
+        companies = json.load(archivo)
+    descripciones = generar(cantidad)
+    aleatorio = random.Random(7)
+    montos = [aleatorio.choice((-1, 1)) * aleatorio.randint(500, 500000) for _ in range(cantidad)]
+
+    if por_movimiento(descripciones, montos, companies) != por_lote(descripciones, montos, companies):
+        print("ERROR: la categorización por lotes no coincide con la de a un movimiento")
+        sys.exit(1)
+    print(f"[OK] Mismos resultados en {cantidad} movimientos "
+          f"({len(set(d.strip() for d in descripciones))} descripciones distintas)")
+
+    costo_anterior = medir(por_movimiento, descripciones, montos, companies)
+    costo_nuevo = medir(por_lote, descripciones, montos, companies)
+    print(f"Por movimiento: {costo_anterior:.2f} µs/movimiento")
+    print(f"Por lote:       {costo_nuevo:.2f} µs/movimiento")
+    print(f"Mejora:         {costo_anterior / costo_nuevo:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Micro-benchmark de la normalización de movimientos
+
+Compara el costo por movimiento de la implementación anterior (tres métodos
+que reconstruían listas y patrones en cada llamada) con
+utils.movement_normalizer, y verifica que ambas den el mismo resultado.
+
+Uso (desde scraper/):
+    python test/bench_movement_normalizer.py [cantidad]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+# Agregar el directorio raíz del scraper al path de Python
+scraper_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(scraper_root)
+
+from utils.movement_normalizer import normalize_movement
+
+
+# --- Implementación anterior (copiada de BancoEstadoScraper) ---
+
+def clean_description_anterior(descripcion: str) -> str:
+    import re
+
+    prefijos_a_ignorar = [
+        'TEF A ', 'COMPRA WEB ', 'COMPRA NACIONAL ', 'COMPRA INTERNACIONAL ', 'COMPRA POS ',
+        'TRANSFERENCIA A ', 'TRANSFERENCIA DE ', 'PAGO DE ', 'PAGO A ', 'FACTU CL',
+        'FACTURACION ', 'CARGO POR ', 'ABONO DE ', 'GIRO EN ', 'DEP POR ', 'COMISION '
+    ]
+    desc = descripcion.strip()
+    for prefijo in prefijos_a_ignorar:
+        if desc.upper().startswith(prefijo.upper()):
+            desc = desc[len(prefijo):].strip()
+    desc = re.sub(r'\s+', ' ', desc)
+    sufijos_a_ignorar = ['CL', 'CHILE', 'LTDA', 'S.A.']
+    for sufijo in sufijos_a_ignorar:
+        if desc.upper().endswith(' ' + sufijo.upper()):
+            desc = desc[:-len(sufijo)-1].strip()
+    return desc
+
+
+def extract_transaction_type_anterior(descripcion: str) -> str:
+    desc_upper = descripcion.upper().strip()
+    tipos = {
+        'TRANSFERENCIA_ENVIADA': ['TEF A ', 'TRANSFERENCIA A '],
+        'TRANSFERENCIA_RECIBIDA': ['DEP POR TRANSFERENCIA', 'TRANSFERENCIA RECIBIDA'],
+        'COMPRA_WEB': ['COMPRA WEB'],
+        'COMPRA_PRESENCIAL': ['COMPRA NACIONAL', 'COMPRA POS'],
+        'GIRO_ATM': ['GIRO ATM', 'GIRO EN ATM'],
+        'GIRO_TRANSFERENCIA': ['GIRO POR TRANSFERENCIA'],
+        'COMISION': ['COMISION'],
+        'INTERES': ['INTERES', 'RENDIMIENTO'],
+        'AHORRO': ['AHORRO'],
+        'PAGO_SERVICIO': ['PAGO SERVICIO', 'PAGO DE SERVICIO'],
+        'ABONO': ['ABONO'],
+        'CARGO': ['CARGO']
+    }
+    for tipo, patrones in tipos.items():
+        for patron in patrones:
+            if patron in desc_upper:
+                return tipo
+    return 'OTROS'
+
+
+def extract_reference_anterior(descripcion: str) -> str:
+    import re
+
+    patterns = [
+        r'REF[:\s]*(\d+)',
+        r'NRO[:\s]*(\d+)',
+        r'CODIGO[:\s]*(\d+)',
+        r'(\d{6,})',
+        r'[A-Z]{2,}\s*(\d{4,})'
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, descripcion.upper())
+        if match:
+            return match.group(1) if match.groups() else match.group(0)
+    return None
+
+
+# --- Datos de prueba ---
+
+PLANTILLAS = [
+    'COMPRA WEB {comercio} CL',
+    'COMPRA NACIONAL {comercio}  SANTIAGO',
+    'TEF A {persona} REF: {numero}',
+    'DEP POR TRANSFERENCIA DE {persona}',
+    'PAGO DE SERVICIO {comercio} NRO {numero}',
+    'GIRO EN ATM {comercio}',
+    'COMISION MANTENCION',
+    'CARGO POR {comercio} S.A.',
+    'Compra pos {comercio} Ltda',
+    '  ABONO DE {persona}   ',
+    'FACTU CL{comercio} CHILE',
+    'INTERES GANADO',
+]
+COMERCIOS = ['LIDER', 'JUMBO', 'UBER EATS', 'NETFLIX.COM', 'COPEC', 'ENEL', 'FALABELLA', 'SPOTIFY', 'RAPPI', 'ENTEL']
+PERSONAS = ['JUAN PEREZ', 'MARIA SOTO', 'PEDRO ROJAS', 'ANA DIAZ']
+
+
+def generar(cantidad: int):
+    aleatorio = random.Random(42)
+    return [
+        aleatorio.choice(PLANTILLAS).format(
+            comercio=aleatorio.choice(COMERCIOS),
+            persona=aleatorio.choice(PERSONAS),
+            numero=aleatorio.randint(1000, 99999999),
+        ).strip()
+        for _ in range(cantidad)
+    ]
+
+
+def anterior(descripcion: str):
+    return (clean_description_anterior(descripcion),
+            extract_transaction_type_anterior(descripcion),
+            extract_reference_anterior(descripcion))
+
+
+def nueva(descripcion: str):
+    normalizado = normalize_movement(descripcion)
+    return normalizado.descripcion_limpia, normalizado.tipo, normalizado.referencia
+
+
+def medir(funcion, descripciones, repeticiones: int = 3) -> float:
+    """Mejor tiempo por movimiento, en microsegundos"""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for descripcion in descripciones:
+            funcion(descripcion)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor / len(descripciones) * 1e6
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    descripciones = generar(cantidad)
+
+    diferencias = [d for d in descripciones if anterior(d) != nueva(d)]
+    if diferencias:
+        print(f"ERROR: {len(diferencias)} descripciones con resultado distinto, p. ej. {diferencias[0]!r}")
+        print(f"  anterior: {anterior(diferencias[0])}")
+        print(f"  nueva:    {nueva(diferencias[0])}")
+        sys.exit(1)
+    print(f"[OK] Mismos resultados en {cantidad} movimientos")
+
+    costo_anterior = medir(anterior, descripciones)
+    costo_nuevo = medir(nueva, descripciones)
+    print(f"Anterior: {costo_anterior:.2f} µs/movimiento")
+    print(f"Nueva:    {costo_nuevo:.2f} µs/movimiento (incluye la clave normalizada)")
+    print(f"Mejora:   {costo_anterior / costo_nuevo:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
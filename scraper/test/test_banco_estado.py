@@ -14,8 +14,6 @@ from playwright.async_api import async_playwright
 async def test_scraper():
     # Configuración del scraper
     config = ScraperConfig(
-        redis_host='localhost',
-        redis_port=6379,
         debug_mode=True,
         geolocation={
             "latitude": -33.4489,
@@ -0,0 +1,101 @@
+"""
+Pruebas de la deduplicación de movimientos junto a la marca de sincronización
+
+Uso (desde scraper/):
+    python -m pytest test/test_movement_dedup.py
+"""
+import asyncio
+import os
+import sys
+
+# Agregar el directorio raíz del scraper al path de Python
+scraper_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(scraper_root)
+
+from sites.banco_estado.banco_estado_local_v2 import BancoEstadoScraper, ScraperConfig
+from sites.banco_estado.watermark import Marca
+from utils.movement_dedup import MovementDeduplicator, numerar_apariciones
+
+
+class RedisEnMemoria:
+    """Lo mínimo de redis.asyncio que usa MovementDeduplicator (sorted sets en un pipeline)"""
+
+    def __init__(self):
+        self.zsets = {}
+
+    def pipeline(self, transaction=False):
+        return PipelineEnMemoria(self)
+
+
+class PipelineEnMemoria:
+    def __init__(self, redis):
+        self.redis = redis
+        self.comandos = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def zscore(self, key, member):
+        self.comandos.append(lambda: self.redis.zsets.get(key, {}).get(member))
+
+    def zadd(self, key, mapping):
+        self.comandos.append(lambda: self.redis.zsets.setdefault(key, {}).update(mapping))
+
+    def zremrangebyscore(self, key, minimo, maximo):
+        self.comandos.append(lambda: None)
+
+    def expire(self, key, segundos):
+        self.comandos.append(lambda: None)
+
+    async def execute(self):
+        return [comando() for comando in self.comandos]
+
+
+def movimiento_repetido():
+    return {'fecha': '05/07/2025', 'descripcion': 'COMPRA NACIONAL METRO', 'monto': -800}
+
+
+async def sincronizar(redis, marca, pagina):
+    """Una ejecución: numera la página, aplica la marca y deduplica como lo hace el scraper"""
+    scraper = BancoEstadoScraper(ScraperConfig(), deduplicator=MovementDeduplicator(redis))
+    numerar_apariciones(pagina, {})
+    nuevos, _ = marca.filtrar(pagina, {})
+    cuentas = [{'numero': '12345678', 'movimientos': nuevos}]
+    huellas = await scraper.deduplicar_movimientos({'user_id': 1}, cuentas)
+    await scraper.deduplicator.remember(1, huellas)
+    marca.avanzar(cuentas[0]['movimientos'])
+    return cuentas[0]['movimientos']
+
+
+def test_identico_nuevo_despues_de_n_entregados():
+    """Dos movimientos idénticos ya entregados y llega un tercero el mismo día: se envía solo el tercero"""
+    async def escenario():
+        redis = RedisEnMemoria()
+        marca = Marca()
+        primera = await sincronizar(redis, marca, [movimiento_repetido(), movimiento_repetido()])
+        assert len(primera) == 2
+        segunda = await sincronizar(redis, marca, [movimiento_repetido() for _ in range(3)])
+        assert len(segunda) == 1
+        tercera = await sincronizar(redis, marca, [movimiento_repetido() for _ in range(3)])
+        assert tercera == []
+
+    asyncio.run(escenario())
+
+
+def test_identicos_en_paginas_distintas():
+    """El ordinal se cuenta en toda la cuenta: dos páginas con el mismo movimiento son dos movimientos"""
+    apariciones = {}
+    pagina_1, pagina_2 = [movimiento_repetido()], [movimiento_repetido()]
+    numerar_apariciones(pagina_1, apariciones)
+    numerar_apariciones(pagina_2, apariciones)
+    assert pagina_1[0]['orden_aparicion'] == 0
+    assert pagina_2[0]['orden_aparicion'] == 1
+
+
+if __name__ == '__main__':
+    test_identico_nuevo_despues_de_n_entregados()
+    test_identicos_en_paginas_distintas()
+    print("[OK] Pruebas de deduplicación")
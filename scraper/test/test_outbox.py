@@ -0,0 +1,99 @@
+"""
+Pruebas del outbox: la sincronización de una tarea se aplica al entregar su último lote
+
+Uso (desde scraper/):
+    python -m pytest test/test_outbox.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# Agregar el directorio raíz del scraper al path de Python
+scraper_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(scraper_root)
+
+from sites.banco_estado.watermark import Marca
+from utils.backend_uploader import DELIVERED, RETRY
+from utils.outbox import Outbox
+
+
+class UploaderFalso:
+    """Responde a cada lote con el estado que indique `respuestas` (DELIVERED por defecto)"""
+
+    def __init__(self, respuestas=None):
+        self.respuestas = list(respuestas or [])
+
+    async def send_chunk(self, payload, key, label, max_attempts=None, path=None):
+        return (self.respuestas.pop(0) if self.respuestas else DELIVERED), {}
+
+
+def lotes(cantidad):
+    return [({'rawMovements': [{'n': i}], 'chunkIndex': i}, f"clave-{i}") for i in range(cantidad)]
+
+
+def sincronizacion():
+    marca = Marca('05/07/2025', {'abc': 2})
+    return {'user_id': 1, 'marcas': {'12345678': marca.to_json()}, 'huellas': ['h1', 'h2']}
+
+
+def test_sincroniza_al_entregar_el_ultimo_lote():
+    async def escenario():
+        with tempfile.TemporaryDirectory() as directorio:
+            outbox = Outbox(os.path.join(directorio, 'outbox.sqlite3'))
+            aplicadas = []
+
+            async def on_synced(sync):
+                aplicadas.append(sync)
+
+            outbox.enqueue('tarea-1', lotes(2), sincronizacion())
+            # El segundo lote sigue sin respuesta: la tarea aún no está sincronizada
+            assert await outbox.flush(UploaderFalso([DELIVERED, RETRY]), on_synced) == 1
+            assert aplicadas == []
+
+            outbox._db.execute("UPDATE outbox SET next_attempt_at = 0")
+            assert await outbox.flush(UploaderFalso(), on_synced) == 1
+            assert len(aplicadas) == 1
+            assert aplicadas[0]['huellas'] == ['h1', 'h2']
+            assert Marca.from_json(aplicadas[0]['marcas']['12345678']).huellas == {'abc': 2}
+
+            # Se aplica una sola vez
+            await outbox.flush(UploaderFalso(), on_synced)
+            assert len(aplicadas) == 1
+            outbox.close()
+
+    asyncio.run(escenario())
+
+
+def test_lotes_descartados_pierden_la_sincronizacion():
+    async def escenario():
+        with tempfile.TemporaryDirectory() as directorio:
+            outbox = Outbox(os.path.join(directorio, 'outbox.sqlite3'), max_entries=2)
+            aplicadas = []
+
+            async def on_synced(sync):
+                aplicadas.append(sync)
+
+            outbox.enqueue('tarea-1', lotes(2), sincronizacion())
+            outbox.enqueue('tarea-2', [({'rawMovements': [], 'chunkIndex': 0}, 'otra-clave')])
+            await outbox.flush(UploaderFalso(), on_synced)
+            assert outbox.evicted == 1
+            assert aplicadas == []
+            outbox.close()
+
+    asyncio.run(escenario())
+
+
+def test_marca_combinada_no_retrocede():
+    reciente = Marca('06/07/2025', {'x': 1})
+    antigua = Marca('05/07/2025', {'y': 3})
+    assert antigua.combinar(reciente) is reciente
+    assert reciente.combinar(antigua) is reciente
+    assert Marca('06/07/2025', {'x': 2}).combinar(reciente).huellas == {'x': 2}
+
+
+if __name__ == '__main__':
+    test_sincroniza_al_entregar_el_ultimo_lote()
+    test_lotes_descartados_pierden_la_sincronizacion()
+    test_marca_combinada_no_retrocede()
+    print("[OK] Pruebas del outbox")
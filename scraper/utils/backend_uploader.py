@@ -0,0 +1,226 @@
+"""
+Envío de movimientos al backend por lotes, comprimidos y con reintentos
+
+Antes todos los movimientos (y otra vez dentro de cada cuenta) viajaban en
+un único POST a `/scraper/process-data`, sin reintentos: cualquier error
+perdía la sincronización. Aquí:
+- los movimientos se dividen en lotes acotados por cantidad y por tamaño
+  (express.json() del backend acepta 100kb por defecto, medido descomprimido),
+- cada lote lleva las cuentas que referencia, sin los movimientos anidados,
+- el cuerpo va con gzip (body-parser lo descomprime),
+- los errores transitorios se reintentan con backoff exponencial y jitter,
+- cada lote lleva un Idempotency-Key estable para que un reintento no
+  duplique movimientos,
+- cada lote lleva su índice y el total (chunkIndex/chunkTotal): el backend
+  informa el progreso por lote y el estado final lo fija el scraper,
+- la sesión HTTP es una sola y se comparte entre tareas.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from utils.config import backend_base_url
+
+# Estados que confirman la recepción. 207: el backend guardó el lote aunque
+# algunos movimientos fallaron; reintentarlo solo duplicaría los guardados.
+DELIVERED_STATUSES = (200, 201, 207)
+# Estados transitorios que vale la pena reintentar
+RETRYABLE_STATUSES = (408, 409, 425, 429, 500, 502, 503, 504)
+
+# Resultado del envío de un lote
+DELIVERED = 'delivered'
+RETRY = 'retry'
+REJECTED = 'rejected'
+
+
+def idempotency_key(task_id: Any, chunk: List[dict]) -> str:
+    """Clave estable para un lote: mismos movimientos de la misma tarea, misma clave"""
+    digest = hashlib.sha256()
+    digest.update(str(task_id).encode())
+    digest.update(json.dumps(chunk, sort_keys=True, ensure_ascii=False, default=str).encode())
+    return f"scraper-{digest.hexdigest()[:32]}"
+
+
+class BackendUploader:
+    """Cliente de `/scraper/process-data` con lotes, gzip y reintentos"""
+
+    def __init__(self, backend_url: Optional[str] = None, chunk_size: Optional[int] = None,
+                 max_chunk_bytes: Optional[int] = None, max_attempts: Optional[int] = None,
+                 base_delay: float = 1.0, max_delay: float = 30.0, timeout: float = 120.0):
+        self.backend_url = backend_url or backend_base_url()
+        self.chunk_size = chunk_size or int(os.getenv('SCRAPER_UPLOAD_CHUNK_SIZE', '200'))
+        self.max_chunk_bytes = max_chunk_bytes or int(os.getenv('SCRAPER_UPLOAD_MAX_BYTES', '90000'))
+        self.max_attempts = max_attempts or int(os.getenv('SCRAPER_UPLOAD_MAX_ATTEMPTS', '5'))
+        self.gzip = os.getenv('SCRAPER_UPLOAD_GZIP', '1') == '1'
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def url(self) -> str:
+        return f"{self.backend_url}/scraper/process-data"
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Sesión compartida (se crea dentro del event loop la primera vez)"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def build_chunks(self, movements: List[dict], cuentas: List[dict]) -> List[Tuple[List[dict], List[dict]]]:
+        """
+        Divide en lotes (movimientos, cuentas). El primer lote lleva todas las
+        cuentas para que el backend cree y actualice también las que no tienen
+        movimientos; los siguientes solo las que sus movimientos referencian.
+        """
+        cuentas_planas = [{k: v for k, v in cuenta.items() if k != 'movimientos'} for cuenta in cuentas]
+        base_bytes = len(json.dumps(cuentas_planas, ensure_ascii=False, default=str)) + 512
+
+        chunks: List[List[dict]] = []
+        actual: List[dict] = []
+        actual_bytes = base_bytes
+        for movement in movements:
+            size = len(json.dumps(movement, ensure_ascii=False, default=str)) + 1
+            if actual and (len(actual) >= self.chunk_size or actual_bytes + size > self.max_chunk_bytes):
+                chunks.append(actual)
+                actual, actual_bytes = [], base_bytes
+            actual.append(movement)
+            actual_bytes += size
+        if actual or not chunks:
+            chunks.append(actual)
+
+        resultado = []
+        for index, chunk in enumerate(chunks):
+            if index == 0:
+                resultado.append((chunk, cuentas_planas))
+                continue
+            numeros = {movement.get('cuenta') for movement in chunk}
+            resultado.append((chunk, [c for c in cuentas_planas if c.get('numero') in numeros]))
+        return resultado
+
+    async def upload(self, movements: List[dict], task_data: dict, cuentas: List[dict]) -> Dict[str, Any]:
+        """
+        Envía todos los lotes. Retorna {'success', 'chunks_total', 'chunks_sent',
+        'chunks_rejected', 'rejected_movements', 'stats', 'pending'}: success si
+        todos los lotes tuvieron respuesta definitiva (entregados o rechazados), stats suma
+        las estadísticas que devuelve el backend y pending son los lotes
+        (payload, Idempotency-Key) que quedaron sin enviar por un error
+        transitorio, para guardarlos en el outbox. Un lote rechazado de forma
+        definitiva no se reintenta ni detiene el envío de los demás.
+        """
+        chunks = self.build_chunks(movements, cuentas)
+        stats: Dict[str, Any] = {'total_procesados': 0, 'exitosos': 0, 'errores': 0, 'por_categoria': {}}
+        payloads = []
+        for index, (chunk, chunk_cuentas) in enumerate(chunks):
+            payload = {
+                'rawMovements': chunk,
+                'scraperTaskId': task_data.get('id'),
+                'userId': task_data.get('user_id'),
+                'cuentas': chunk_cuentas,
+                # Con chunkIndex/chunkTotal el backend solo informa progreso:
+                # el estado final de la tarea lo fija el scraper
+                'chunkIndex': index,
+                'chunkTotal': len(chunks)
+            }
+            payloads.append((payload, idempotency_key(task_data.get('id'), chunk)))
+
+        sent = 0
+        rejected = 0
+        rejected_movements = 0
+        pending: List[Tuple[dict, str]] = []
+        for index, (payload, key) in enumerate(payloads):
+            status, result = await self.send_chunk(payload, key, f"{index + 1}/{len(payloads)}")
+            if status == REJECTED:
+                # Reintentarlo no lo arregla; los lotes siguientes son independientes
+                rejected += 1
+                rejected_movements += len(payload['rawMovements'])
+                continue
+            if status != DELIVERED:
+                # Si el backend no responde, los lotes siguientes tampoco llegarían
+                pending = payloads[index:]
+                break
+            sent += 1
+            self._merge_stats(stats, result.get('stats', {}) if isinstance(result, dict) else {})
+        return {
+            'success': sent + rejected == len(payloads),
+            'chunks_total': len(payloads),
+            'chunks_sent': sent,
+            'chunks_rejected': rejected,
+            'rejected_movements': rejected_movements,
+            'stats': stats,
+            'pending': pending,
+        }
+
+    async def send_chunk(self, payload: dict, key: str, label: str,
+                         max_attempts: Optional[int] = None, path: Optional[str] = None) -> Tuple[str, Any]:
+        """
+        Envía un lote con reintentos. Retorna (DELIVERED, respuesta), (RETRY, None)
+        si se agotaron los intentos por errores transitorios, o (REJECTED, None)
+        si el backend lo rechazó de forma definitiva. `path` cambia el endpoint
+        (por defecto `/scraper/process-data`).
+        """
+        max_attempts = max_attempts or self.max_attempts
+        url = f"{self.backend_url}{path}" if path else self.url
+        cantidad = len(payload.get('rawMovements', payload.get('changes', [])))
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Idempotency-Key': key}
+        if self.gzip:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+
+        for attempt in range(1, max_attempts + 1):
+            try:
+                session = await self.session()
+                async with session.post(url, data=body, headers=headers) as response:
+                    if response.status in DELIVERED_STATUSES:
+                        try:
+                            result = await response.json(content_type=None)
+                        except Exception:
+                            result = {}
+                        print(f"[OK] Lote {label} enviado ({cantidad} movimientos, status {response.status})")
+                        return DELIVERED, result
+                    error_text = await response.text()
+                    print(f"[ERROR] Lote {label} rechazado por el backend ({response.status}): {error_text[:500]}")
+                    if response.status not in RETRYABLE_STATUSES:
+                        return REJECTED, None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"[ERROR] Error de conexión enviando lote {label}: {e}")
+
+            if attempt < max_attempts:
+                # Backoff exponencial con jitter completo
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                print(f"[INFO] Reintentando lote {label} en {delay:.1f}s (intento {attempt + 1}/{max_attempts})")
+                await asyncio.sleep(delay)
+        return RETRY, None
+
+    @staticmethod
+    def _merge_stats(total: Dict[str, Any], stats: Dict[str, Any]) -> None:
+        for key in ('total_procesados', 'exitosos', 'errores'):
+            total[key] += stats.get(key, 0) or 0
+        for categoria, cantidad in (stats.get('por_categoria') or {}).items():
+            total['por_categoria'][categoria] = total['por_categoria'].get(categoria, 0) + cantidad
+
+
+_default_uploader: Optional[BackendUploader] = None
+
+
+def default_uploader() -> BackendUploader:
+    """Cliente compartido del proceso"""
+    global _default_uploader
+    if _default_uploader is None:
+        _default_uploader = BackendUploader()
+    return _default_uploader
@@ -0,0 +1,62 @@
+"""
+Categorización por lotes para importaciones históricas y recategorizaciones
+
+`process_single_movement` trabaja un diccionario a la vez. Para volúmenes
+grandes (años de historia, o todos los usuarios después de un cambio en
+companies.json) esta API recibe columnas (descripciones y montos) y entrega
+columnas de resultados.
+
+En vez de vectorizar con numpy (que el scraper no usa), se aprovecha que
+las descripciones bancarias se repiten muchísimo: cada descripción distinta
+se normaliza una sola vez y cada clave distinta se busca una sola vez en el
+autómata de keywords; el resto son lecturas de diccionario. Los resultados
+son exactamente los de `process_single_movement`.
+"""
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from utils.keyword_matcher import matcher_for
+from utils.movement_normalizer import normalize_movement
+
+
+class BatchResult(NamedTuple):
+    categorias: List[str]
+    tipos: List[str]
+    referencias: List[Optional[str]]
+    movement_types: List[str]
+
+
+def categorize_batch(descripciones: Sequence[str], montos: Sequence[Any],
+                     companies: List[dict]) -> BatchResult:
+    """
+    Categoría automática, tipo, referencia y movement_type de cada movimiento.
+    `descripciones` y `montos` son columnas del mismo largo.
+    """
+    if len(descripciones) != len(montos):
+        raise ValueError("descripciones y montos deben tener el mismo largo")
+
+    matcher = matcher_for(companies) if companies else None
+
+    # Índice de cada movimiento en la tabla de descripciones distintas
+    distintas: Dict[str, int] = {}
+    indices = [distintas.setdefault(descripcion.strip(), len(distintas)) for descripcion in descripciones]
+
+    categoria_por_clave: Dict[str, str] = {}
+    categorias_u: List[str] = []
+    tipos_u: List[str] = []
+    referencias_u: List[Optional[str]] = []
+    for descripcion in distintas:
+        normalizado = normalize_movement(descripcion)
+        categoria = categoria_por_clave.get(normalizado.clave)
+        if categoria is None:
+            categoria = matcher.category(normalizado.clave) if matcher else "Otros"
+            categoria_por_clave[normalizado.clave] = categoria
+        categorias_u.append(categoria)
+        tipos_u.append(normalizado.tipo)
+        referencias_u.append(normalizado.referencia)
+
+    return BatchResult(
+        categorias=[categorias_u[i] for i in indices],
+        tipos=[tipos_u[i] for i in indices],
+        referencias=[referencias_u[i] for i in indices],
+        movement_types=['expense' if monto < 0 else 'income' for monto in montos],
+    )
@@ -0,0 +1,111 @@
+"""
+Cancelación cooperativa de tareas
+
+Antes el backend agregaba `{"action": "cancel", "id": ...}` a la lista
+compartida `scraper:control` y el gestor la consumía con rpop: con varias
+tareas o workers, uno sacaba y descartaba la cancelación de otro, y además
+nadie la revisaba durante el scraping.
+
+Ahora cada tarea tiene su propia clave `scraper:cancel:{id}` (con TTL) que
+nadie consume. Un `CancellationToken` por tarea la consulta en segundo plano
+cada `SCRAPER_CANCEL_POLL` segundos; al verla ejecuta sus callbacks (el
+scraper cierra ahí su contexto de navegador, lo que corta de inmediato
+cualquier espera de Playwright en curso) y el scraper llama a `check()` en
+cada paso de navegación y paginación, que lanza `TaskCancelled`.
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, List, Optional
+
+from redis.asyncio import Redis
+
+# Segundos entre consultas a Redis mientras la tarea corre
+CANCEL_POLL_INTERVAL = float(os.getenv('SCRAPER_CANCEL_POLL', '1'))
+# La señal sobrevive lo suficiente para una tarea que todavía está en cola
+CANCEL_TTL = int(os.getenv('SCRAPER_CANCEL_TTL', '3600'))
+
+
+def cancel_key(task_id: Any) -> str:
+    return f"scraper:cancel:{task_id}"
+
+
+class TaskCancelled(BaseException):
+    """
+    La tarea fue cancelada. Hereda de BaseException (como
+    asyncio.CancelledError) para atravesar los `except Exception` con los que
+    cada paso del scraper tolera fallos de la página.
+    """
+
+    def __init__(self, task_id: Any = None):
+        super().__init__(f"Tarea {task_id} cancelada")
+        self.task_id = task_id
+
+
+async def request_cancel(redis_client: Redis, task_id: Any, ttl: int = CANCEL_TTL) -> None:
+    """Marca una tarea como cancelada"""
+    await redis_client.set(cancel_key(task_id), '1', ex=ttl)
+
+
+class CancellationToken:
+    def __init__(self, redis_client: Optional[Redis] = None, task_id: Any = None,
+                 poll_interval: Optional[float] = None):
+        # Sin Redis (ejecución aislada) solo se cancela con cancel()
+        self.redis_client = redis_client
+        self.task_id = task_id
+        self.poll_interval = poll_interval if poll_interval is not None else CANCEL_POLL_INTERVAL
+        self._cancelled = False
+        self._callbacks: List[Callable[[], Awaitable[Any]]] = []
+        self._watcher: Optional[asyncio.Task] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def on_cancel(self, callback: Callable[[], Awaitable[Any]]) -> None:
+        """Registra una corrutina que libera recursos al cancelar (p. ej. context.close)"""
+        self._callbacks.append(callback)
+
+    def start(self) -> None:
+        """Empieza a vigilar la clave de cancelación de la tarea"""
+        if self.redis_client is not None and self.task_id is not None and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        """Deja de vigilar y olvida los callbacks (los recursos ya se liberaron)"""
+        self._callbacks.clear()
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def cancel(self) -> None:
+        """Cancela la tarea localmente y libera sus recursos"""
+        if self._cancelled:
+            return
+        self._cancelled = True
+        print(f"[INFO] Cancelando tarea {self.task_id}")
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                print(f"[WARNING] Error liberando recursos de la tarea cancelada: {e}")
+
+    async def check(self) -> None:
+        """Punto de cancelación: lanza TaskCancelled si la tarea fue cancelada"""
+        if self._cancelled:
+            raise TaskCancelled(self.task_id)
+
+    async def _watch(self) -> None:
+        # Primero consulta y después espera: una tarea cancelada en cola no llega a abrir el banco
+        while not self._cancelled:
+            try:
+                if await self.redis_client.exists(cancel_key(self.task_id)):
+                    await self.cancel()
+                    return
+            except Exception as e:
+                print(f"[WARNING] No se pudo consultar la cancelación de la tarea {self.task_id}: {e}")
+            await asyncio.sleep(self.poll_interval)
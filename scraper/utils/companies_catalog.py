@@ -0,0 +1,156 @@
+"""
+Catálogo de empresas para la categorización, compartido por todo el proceso
+
+Antes cada tarea descargaba `/config/companies` completo y, si la llamada
+fallaba, categorizaba todo como "Otros". El catálogo ahora:
+- vive en memoria y se comparte entre tareas concurrentes,
+- se revalida con ETag/If-None-Match cuando vence su TTL, en segundo plano
+  (las tareas siguen usando la copia actual mientras tanto),
+- guarda en disco la última versión válida para arrancar sin backend.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from utils.config import backend_base_url
+
+# Tras un fallo sin ninguna copia disponible, no reintentar antes de esto
+COLD_RETRY_SECONDS = 30
+
+
+class CompaniesCatalog:
+    """Copia local de /config/companies con revalidación por ETag"""
+
+    def __init__(self, backend_url: Optional[str] = None, ttl_seconds: Optional[int] = None,
+                 cache_path: Optional[str] = None):
+        self.backend_url = backend_url or backend_base_url()
+        self.ttl_seconds = ttl_seconds or int(os.getenv('COMPANIES_CACHE_TTL', '300'))
+        self.cache_path = cache_path or os.getenv('COMPANIES_CACHE_PATH', 'cache/companies.json')
+
+        self._companies: Optional[List[Dict[str, Any]]] = None
+        self._etag: Optional[str] = None
+        self._fetched_at = 0.0
+        self._failed_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._disk_checked = False
+
+    @property
+    def url(self) -> str:
+        return f"{self.backend_url}/config/companies"
+
+    async def get(self) -> List[Dict[str, Any]]:
+        """
+        Empresas para categorizar. Solo espera la descarga cuando no hay
+        ninguna copia (ni en memoria ni en disco); si la copia venció, la
+        retorna igual y la revalida en segundo plano.
+        """
+        if self._companies is None and not self._disk_checked:
+            self._load_from_disk()
+
+        if self._companies is None:
+            if time.monotonic() - self._failed_at >= COLD_RETRY_SECONDS:
+                await asyncio.shield(self._start_refresh())
+            if self._companies is None:
+                print("[WARNING] Catálogo de empresas no disponible, se usa lista vacía")
+                return []
+        elif self.is_stale():
+            self._start_refresh()
+        return self._companies
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._fetched_at >= self.ttl_seconds
+
+    async def refresh(self) -> bool:
+        """Revalida el catálogo contra el backend. Retorna True si quedó vigente"""
+        headers = {}
+        if self._etag and self._companies is not None:
+            headers['If-None-Match'] = self._etag
+        try:
+            timeout = aiohttp.ClientTimeout(total=15)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(self.url, headers=headers) as response:
+                    if response.status == 304:
+                        self._fetched_at = time.monotonic()
+                        return True
+                    if response.status != 200:
+                        print(f"[WARNING] No se pudo obtener companies.json (status: {response.status})")
+                        return self._fail()
+                    response_data = await response.json()
+                    etag = response.headers.get('ETag')
+        except Exception as e:
+            print(f"[WARNING] Error obteniendo companies.json desde {self.url}: {e}")
+            return self._fail()
+
+        if not isinstance(response_data, dict):
+            response_data = {}
+        companies = response_data.get('data') if response_data.get('success') else None
+        if not isinstance(companies, list):
+            print(f"[WARNING] Error en respuesta de API: {response_data.get('message')}")
+            return self._fail()
+
+        # Una lista nueva: quien cachee por catálogo (p. ej. el autómata de keywords) se reconstruye
+        self._companies = companies
+        self._etag = etag
+        self._fetched_at = time.monotonic()
+        print(f"[INFO] Catálogo de empresas actualizado: {len(companies)} empresas")
+        self._save_to_disk()
+        return True
+
+    def _start_refresh(self) -> asyncio.Task:
+        """Lanza una revalidación, o retorna la que ya está en curso"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self.refresh())
+        return self._refresh_task
+
+    def _fail(self) -> bool:
+        self._failed_at = time.monotonic()
+        if self._companies is not None:
+            # Se sigue usando la copia actual; no reintentar hasta el próximo TTL
+            self._fetched_at = time.monotonic()
+        return False
+
+    def _load_from_disk(self) -> None:
+        self._disk_checked = True
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+            companies = cached.get('companies')
+            if isinstance(companies, list):
+                self._companies = companies
+                self._etag = cached.get('etag')
+                # Vencida a propósito: se usa de inmediato y se revalida en segundo plano
+                self._fetched_at = 0.0
+                print(f"[INFO] Catálogo de empresas cargado desde {self.cache_path} ({len(companies)} empresas)")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[WARNING] No se pudo leer el catálogo guardado: {e}")
+
+    def _save_to_disk(self) -> None:
+        """Escritura atómica de la última versión válida"""
+        try:
+            directory = os.path.dirname(self.cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'etag': self._etag, 'saved_at': time.time(), 'companies': self._companies},
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"[WARNING] No se pudo guardar el catálogo en disco: {e}")
+
+
+_default_catalog: Optional[CompaniesCatalog] = None
+
+
+def default_catalog() -> CompaniesCatalog:
+    """Catálogo compartido del proceso"""
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = CompaniesCatalog()
+    return _default_catalog
@@ -10,4 +10,14 @@ class ScraperConfig:
     """Configuración base para los scrapers"""
     redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379")
     task_id: Optional[str] = None
-    debug: bool = bool(os.getenv("DEBUG", "0") == "1")
\ No newline at end of file
+    debug: bool = bool(os.getenv("DEBUG", "0") == "1")
+
+
+def backend_base_url() -> str:
+    """URL base del backend (BACKEND_URL), agregando el esquema si no viene"""
+    backend_url = os.getenv('BACKEND_URL', 'http://localhost:3000')
+    if 'railway.app' in backend_url and not backend_url.startswith('http'):
+        return f"https://{backend_url}"
+    if not backend_url.startswith('http'):
+        return f"http://{backend_url}"
+    return backend_url.rstrip('/')
@@ -0,0 +1,109 @@
+"""
+Búsqueda de keywords de empresas con un autómata Aho-Corasick
+
+Reemplaza el doble ciclo empresas × keywords de la categorización: el
+autómata se construye una vez por catálogo de empresas y encuentra todas las
+keywords presentes en una sola pasada sobre la descripción normalizada.
+
+Desempate: gana la empresa que aparece primero en el catálogo (y, dentro de
+ella, cualquier keyword). Es exactamente el resultado del ciclo original, que
+retornaba la primera empresa con alguna keyword contenida en la descripción.
+"""
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+def normalize(texto: str) -> str:
+    """Normalización usada para comparar keywords y descripciones"""
+    return texto.upper().replace(' ', '')
+
+
+class KeywordMatcher:
+    """Autómata de keywords de un catálogo de empresas (una foto del catálogo)"""
+
+    def __init__(self, companies: List[dict]):
+        self.companies = companies
+        # Estados del autómata: transiciones, enlace de falla y mejor prioridad
+        # (índice de empresa más bajo) de las keywords que terminan en el estado
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[Optional[int]] = [None]
+        # Una keyword vacía está contenida en cualquier descripción
+        self._empty: Optional[int] = None
+
+        for priority, company in enumerate(companies):
+            for keyword in company.get('keywords', []):
+                self._add(normalize(keyword), priority)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, priority: int) -> None:
+        if not pattern:
+            if self._empty is None:
+                self._empty = priority
+            return
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(None)
+            state = nxt
+        if self._best[state] is None or priority < self._best[state]:
+            self._best[state] = priority
+
+    def _build_failure_links(self) -> None:
+        """BFS estándar; cada estado hereda la mejor prioridad de su enlace de falla"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                inherited = self._best[self._fail[nxt]]
+                if inherited is not None and (self._best[nxt] is None or inherited < self._best[nxt]):
+                    self._best[nxt] = inherited
+
+    def find(self, descripcion: str) -> Optional[dict]:
+        """Empresa de mayor prioridad con alguna keyword en la descripción, o None"""
+        best = self._empty
+        if best == 0:
+            return self.companies[0]
+        goto, fail, best_at = self._goto, self._fail, self._best
+        state = 0
+        for char in normalize(descripcion):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            hit = best_at[state]
+            if hit is not None and (best is None or hit < best):
+                best = hit
+                if best == 0:
+                    break
+        return self.companies[best] if best is not None else None
+
+    def category(self, descripcion: str, default: str = "Otros") -> str:
+        company = self.find(descripcion)
+        return company.get('category', 'Otros') if company else default
+
+
+# Último autómata construido, junto a la lista de empresas que lo originó
+_cache: Tuple[Optional[List[dict]], Optional[KeywordMatcher]] = (None, None)
+
+
+def matcher_for(companies: List[dict]) -> KeywordMatcher:
+    """
+    Autómata para `companies`, reutilizado mientras se pase la misma lista.
+    Un catálogo nuevo (otra lista) construye un autómata nuevo.
+    """
+    global _cache
+    cached_companies, matcher = _cache
+    if cached_companies is not companies or matcher is None:
+        matcher = KeywordMatcher(companies)
+        _cache = (companies, matcher)
+    return matcher
@@ -0,0 +1,120 @@
+"""
+Deduplicación de movimientos por huella de contenido
+
+Una página de la grilla que se vuelve a dibujar o un click de paginación
+reintentado entregan filas repetidas, y antes todas se enviaban al backend.
+Cada movimiento se identifica con una huella estable de cuenta, fecha,
+descripción normalizada, monto, referencia y su número de aparición entre
+los iguales de la cuenta en toda la extracción (contado antes de descartar
+lo que la marca de sincronización ya conoce): dos compras idénticas el
+mismo día son dos movimientos aunque la grilla las deje en páginas
+distintas. Una página que se lee dos veces porque la paginación no avanzó
+se descarta en la extracción.
+
+La etapa descarta:
+- repetidos dentro de la ejecución (conjunto en memoria acotado),
+- movimientos ya entregados en ejecuciones anteriores, con un sorted set
+  por usuario en Redis cuyos miembros vencen después de SCRAPER_DEDUP_TTL.
+Las huellas se registran en Redis solo después de que el backend confirmó
+todos los lotes (no cuando alguno quedó en el outbox).
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+# Campo temporal con el número de aparición del movimiento entre los iguales de su cuenta
+ORDINAL_FIELD = 'orden_aparicion'
+
+
+def numerar_apariciones(movimientos: List[Dict[str, Any]],
+                        apariciones: Optional[Dict[Tuple[Any, Any, Any], int]] = None) -> None:
+    """
+    Guarda en ORDINAL_FIELD el número de aparición de cada movimiento entre
+    los iguales (fecha, descripción y monto). `apariciones` acumula entre las
+    páginas de una misma cuenta. Se numera antes del filtro de la marca de
+    sincronización: si un día que ya tenía dos movimientos idénticos trae un
+    tercero, ese recibe el ordinal 2 y no la huella ya entregada del 0.
+    """
+    apariciones = {} if apariciones is None else apariciones
+    for movimiento in movimientos:
+        clave = (movimiento.get('fecha'), ' '.join(str(movimiento.get('descripcion', '')).split()).upper(),
+                 movimiento.get('monto'))
+        movimiento[ORDINAL_FIELD] = apariciones.get(clave, 0)
+        apariciones[clave] = movimiento[ORDINAL_FIELD] + 1
+
+
+def fingerprint(cuenta: Any, fecha: Any, descripcion: Any, monto: Any, referencia: Any, ordinal: int = 0) -> str:
+    """Huella estable de un movimiento"""
+    digitos_cuenta = ''.join(ch for ch in str(cuenta or '') if ch.isdigit())
+    descripcion_normalizada = ' '.join(str(descripcion or '').split()).upper()
+    contenido = '|'.join(str(x) for x in (digitos_cuenta, fecha, descripcion_normalizada, monto, referencia or '', ordinal))
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:32]
+
+
+class MovementDeduplicator:
+    """Filtro de movimientos repetidos dentro de una ejecución y entre ejecuciones"""
+
+    def __init__(self, redis_client: Optional[Redis] = None, ttl_seconds: Optional[int] = None,
+                 max_in_memory: Optional[int] = None, prefix: str = 'scraper:dedup'):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds or int(os.getenv('SCRAPER_DEDUP_TTL', str(90 * 24 * 3600)))
+        self.max_in_memory = max_in_memory or int(os.getenv('SCRAPER_DEDUP_MAX', '50000'))
+        self.prefix = prefix
+        self._vistos: 'OrderedDict[str, None]' = OrderedDict()
+
+    def _key(self, user_id: Any) -> str:
+        return f"{self.prefix}:{user_id}"
+
+    def _visto(self, huella: str) -> bool:
+        """Marca la huella como vista en esta ejecución. Retorna True si ya lo estaba"""
+        if huella in self._vistos:
+            return True
+        self._vistos[huella] = None
+        if len(self._vistos) > self.max_in_memory:
+            self._vistos.popitem(last=False)
+        return False
+
+    async def filter(self, user_id: Any, huellas: List[str]) -> Tuple[List[bool], int, int]:
+        """
+        Decide qué movimientos conservar. Retorna (conservar por posición,
+        repetidos en la ejecución, ya entregados antes).
+        """
+        conservar = [not self._visto(huella) for huella in huellas]
+        repetidos = conservar.count(False)
+
+        entregados = 0
+        candidatas = [i for i, ok in enumerate(conservar) if ok]
+        if self.redis is not None and candidatas:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for i in candidatas:
+                        pipe.zscore(self._key(user_id), huellas[i])
+                    scores = await pipe.execute()
+                limite = time.time() - self.ttl_seconds
+                for i, score in zip(candidatas, scores):
+                    if score is not None and float(score) >= limite:
+                        conservar[i] = False
+                        entregados += 1
+            except Exception as e:
+                print(f"[WARNING] No se pudo consultar la deduplicación en Redis: {e}")
+        return conservar, repetidos, entregados
+
+    async def remember(self, user_id: Any, huellas: Iterable[str]) -> None:
+        """Registra como entregadas las huellas y poda las vencidas"""
+        huellas = list(huellas)
+        if self.redis is None or not huellas:
+            return
+        ahora = time.time()
+        key = self._key(user_id)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zadd(key, {huella: ahora for huella in huellas})
+                pipe.zremrangebyscore(key, '-inf', ahora - self.ttl_seconds)
+                pipe.expire(key, self.ttl_seconds)
+                await pipe.execute()
+        except Exception as e:
+            print(f"[WARNING] No se pudieron registrar las huellas de movimientos: {e}")
@@ -0,0 +1,135 @@
+"""
+Normalización de descripciones de movimientos en una sola pasada
+
+Reemplaza a `clean_description`, `extract_transaction_type` y
+`extract_reference` del scraper, que reimportaban `re`, reconstruían sus
+listas de prefijos, sufijos y patrones en cada llamada y pasaban la
+descripción a mayúsculas varias veces. Aquí todo se compila una vez al
+cargar el módulo y `normalize_movement` entrega los cuatro resultados con
+una sola conversión a mayúsculas. La semántica es exactamente la de las
+funciones originales (ver test/bench_movement_normalizer.py).
+"""
+import re
+from typing import NamedTuple, Optional
+
+from utils.keyword_matcher import normalize
+
+# Prefijos genéricos, en el orden en que se prueban (cada uno una vez)
+PREFIJOS = (
+    'TEF A ',
+    'COMPRA WEB ',
+    'COMPRA NACIONAL ',
+    'COMPRA INTERNACIONAL ',
+    'COMPRA POS ',
+    'TRANSFERENCIA A ',
+    'TRANSFERENCIA DE ',
+    'PAGO DE ',
+    'PAGO A ',
+    'FACTU CL',
+    'FACTURACION ',
+    'CARGO POR ',
+    'ABONO DE ',
+    'GIRO EN ',
+    'DEP POR ',
+    'COMISION ',
+)
+
+# Sufijos (precedidos de un espacio) que se eliminan al final
+SUFIJOS = tuple(' ' + sufijo for sufijo in ('CL', 'CHILE', 'LTDA', 'S.A.'))
+
+# Tipos de transacción; gana el primero con algún patrón contenido
+TIPOS = (
+    ('TRANSFERENCIA_ENVIADA', ('TEF A ', 'TRANSFERENCIA A ')),
+    ('TRANSFERENCIA_RECIBIDA', ('DEP POR TRANSFERENCIA', 'TRANSFERENCIA RECIBIDA')),
+    ('COMPRA_WEB', ('COMPRA WEB',)),
+    ('COMPRA_PRESENCIAL', ('COMPRA NACIONAL', 'COMPRA POS')),
+    ('GIRO_ATM', ('GIRO ATM', 'GIRO EN ATM')),
+    ('GIRO_TRANSFERENCIA', ('GIRO POR TRANSFERENCIA',)),
+    ('COMISION', ('COMISION',)),
+    ('INTERES', ('INTERES', 'RENDIMIENTO')),
+    ('AHORRO', ('AHORRO',)),
+    ('PAGO_SERVICIO', ('PAGO SERVICIO', 'PAGO DE SERVICIO')),
+    ('ABONO', ('ABONO',)),
+    ('CARGO', ('CARGO',)),
+)
+TIPO_POR_DEFECTO = 'OTROS'
+
+# Patrones de referencia, en orden de prioridad
+REFERENCIAS = tuple(re.compile(pattern) for pattern in (
+    r'REF[:\s]*(\d+)',           # REF: 123456
+    r'NRO[:\s]*(\d+)',           # NRO: 123456
+    r'CODIGO[:\s]*(\d+)',        # CODIGO: 123456
+    r'(\d{6,})',                 # Números de 6+ dígitos
+    r'[A-Z]{2,}\s*(\d{4,})',     # Códigos alfanuméricos
+))
+
+ESPACIOS = re.compile(r'\s+')
+# Todas las referencias llevan dígitos: sin dígitos no hay nada que buscar
+DIGITO = re.compile(r'\d')
+
+
+class NormalizedMovement(NamedTuple):
+    descripcion_limpia: str
+    tipo: str
+    referencia: Optional[str]
+    # Descripción limpia tal como la compara el autómata de keywords
+    clave: str
+
+
+def clean_description(descripcion: str, descripcion_upper: Optional[str] = None) -> str:
+    """Descripción sin prefijos ni sufijos genéricos y con espacios simples"""
+    desc = descripcion.strip()
+    if descripcion_upper is not None and len(desc) == len(descripcion):
+        desc_upper = descripcion_upper
+    else:
+        desc_upper = desc.upper()
+
+    # La mayoría de las descripciones no tiene prefijo: un solo chequeo en C las descarta
+    if desc_upper.startswith(PREFIJOS):
+        for prefijo in PREFIJOS:
+            if desc_upper.startswith(prefijo):
+                desc = desc[len(prefijo):].strip()
+                desc_upper = desc.upper()
+
+    desc = ESPACIOS.sub(' ', desc)
+    desc_upper = desc.upper()
+
+    if desc_upper.endswith(SUFIJOS):
+        for sufijo in SUFIJOS:
+            if desc_upper.endswith(sufijo):
+                desc = desc[:-len(sufijo)].strip()
+                desc_upper = desc.upper()
+    return desc
+
+
+def transaction_type(descripcion_upper: str) -> str:
+    """Tipo de transacción a partir de la descripción en mayúsculas"""
+    desc = descripcion_upper.strip()
+    for tipo, patrones in TIPOS:
+        for patron in patrones:
+            if patron in desc:
+                return tipo
+    return TIPO_POR_DEFECTO
+
+
+def extract_reference(descripcion_upper: str) -> Optional[str]:
+    """Número de referencia o código, a partir de la descripción en mayúsculas"""
+    if not DIGITO.search(descripcion_upper):
+        return None
+    for pattern in REFERENCIAS:
+        match = pattern.search(descripcion_upper)
+        if match:
+            return match.group(1)
+    return None
+
+
+def normalize_movement(descripcion: str) -> NormalizedMovement:
+    """Descripción limpia, tipo, referencia y clave normalizada de un movimiento"""
+    descripcion_upper = descripcion.upper()
+    limpia = clean_description(descripcion, descripcion_upper)
+    return NormalizedMovement(
+        descripcion_limpia=limpia,
+        tipo=transaction_type(descripcion_upper),
+        referencia=extract_reference(descripcion_upper),
+        clave=normalize(limpia),
+    )
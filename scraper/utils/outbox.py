@@ -0,0 +1,197 @@
+"""
+Outbox en disco para los lotes de movimientos que no llegaron al backend
+
+Si el backend no responde después de los reintentos, los lotes pendientes
+se guardan en una base SQLite local (con su Idempotency-Key) en vez de
+dejar la tarea sin confirmar: reintentarla significaba otro login completo
+en el banco. Un flusher en segundo plano los reenvía cuando el backend
+vuelve; la clave de idempotencia evita duplicados si un lote llegó a
+guardarse sin que alcanzara a verse la respuesta.
+
+Junto con los lotes de una tarea se guarda lo que la tarea registra al
+quedar sincronizada (marcas de sincronización y huellas de movimientos):
+`flush` lo aplica cuando entrega el último lote pendiente de esa tarea. Si
+no, los movimientos entregados desde el outbox se volverían a extraer y
+enviar en la siguiente ejecución.
+
+El outbox está acotado (SCRAPER_OUTBOX_MAX_ENTRIES, SCRAPER_OUTBOX_MAX_MB):
+al superar el límite se descartan los lotes más antiguos y se cuentan en
+las métricas. Una tarea con lotes descartados pierde su sincronización,
+para que la siguiente ejecución vuelva a extraer esos movimientos.
+"""
+import gzip
+import json
+import os
+import random
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.backend_uploader import DELIVERED, REJECTED, BackendUploader
+
+# Espera máxima entre reintentos de un mismo lote
+MAX_BACKOFF_SECONDS = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    payload BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT
+)
+"""
+
+# Qué registrar cuando se entreguen todos los lotes de una tarea (JSON)
+SYNC_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox_sync (
+    task_id TEXT PRIMARY KEY,
+    sync TEXT NOT NULL
+)
+"""
+
+
+class Outbox:
+    """Cola persistente de lotes pendientes de enviar al backend"""
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None,
+                 max_mb: Optional[float] = None):
+        self.path = path or os.getenv('SCRAPER_OUTBOX_PATH', 'cache/outbox.sqlite3')
+        self.max_entries = max_entries or int(os.getenv('SCRAPER_OUTBOX_MAX_ENTRIES', '5000'))
+        self.max_bytes = int((max_mb or float(os.getenv('SCRAPER_OUTBOX_MAX_MB', '100'))) * 1024 * 1024)
+        self.evicted = 0
+        self.delivered = 0
+        self.rejected = 0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(SCHEMA)
+        self._db.execute(SYNC_SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def enqueue(self, task_id: Any, pending: List[Tuple[dict, str]], sync: Optional[dict] = None) -> int:
+        """
+        Guarda los lotes (payload, Idempotency-Key) y, si viene, lo que hay que
+        registrar cuando se entreguen (ver `flush`). Retorna cuántos quedaron en cola
+        """
+        now = time.time()
+        rows = [
+            (str(task_id), key, gzip.compress(json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')), now, now)
+            for payload, key in pending
+        ]
+        with self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO outbox (task_id, idempotency_key, payload, created_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            if sync:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO outbox_sync (task_id, sync) VALUES (?, ?)",
+                    (str(task_id), json.dumps(sync, ensure_ascii=False, default=str)),
+                )
+        self._enforce_limits()
+        return len(rows)
+
+    async def flush(self, uploader: BackendUploader,
+                    on_synced: Optional[Callable[[dict], Awaitable[None]]] = None, limit: int = 50) -> int:
+        """
+        Reenvía los lotes vencidos, del más antiguo al más nuevo, con un solo
+        intento cada uno. Se detiene en el primer error transitorio: si el
+        backend sigue caído, no tiene sentido probar el resto. Cuando una tarea
+        ya no tiene lotes pendientes, llama a `on_synced` con lo que guardó
+        `enqueue` (un lote rechazado cuenta como respondido, igual que en el
+        envío directo). Retorna cuántos lotes se entregaron.
+        """
+        rows = self._db.execute(
+            "SELECT id, task_id, idempotency_key, payload, attempts FROM outbox "
+            "WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+            (time.time(), limit),
+        ).fetchall()
+
+        entregados = 0
+        respondidas = set()
+        for row_id, task_id, key, blob, attempts in rows:
+            payload = json.loads(gzip.decompress(blob).decode('utf-8'))
+            status, _ = await uploader.send_chunk(payload, key, f"outbox #{row_id} (tarea {task_id})", max_attempts=1)
+            if status == DELIVERED:
+                self._db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                self.delivered += 1
+                entregados += 1
+                respondidas.add(task_id)
+                continue
+            if status == REJECTED:
+                # Un rechazo definitivo no se arregla reintentando
+                print(f"[WARNING] Lote {key} de la tarea {task_id} rechazado por el backend, se descarta del outbox")
+                self._db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                self.rejected += 1
+                respondidas.add(task_id)
+                continue
+            delay = min(MAX_BACKOFF_SECONDS, 15 * 2 ** attempts)
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (time.time() + random.uniform(delay / 2, delay), 'backend no disponible', row_id),
+            )
+            break
+
+        for task_id in respondidas:
+            await self._sync_if_done(task_id, on_synced)
+        return entregados
+
+    async def _sync_if_done(self, task_id: str,
+                            on_synced: Optional[Callable[[dict], Awaitable[None]]]) -> None:
+        """Aplica la sincronización de una tarea si ya no le quedan lotes en cola"""
+        if self._db.execute("SELECT 1 FROM outbox WHERE task_id = ? LIMIT 1", (task_id,)).fetchone():
+            return
+        row = self._db.execute("SELECT sync FROM outbox_sync WHERE task_id = ?", (task_id,)).fetchone()
+        if not row:
+            return
+        if on_synced is not None:
+            await on_synced(json.loads(row[0]))
+        self._db.execute("DELETE FROM outbox_sync WHERE task_id = ?", (task_id,))
+
+    def metrics(self) -> Dict[str, Any]:
+        """Profundidad de la cola, tamaño y antigüedad del lote más viejo"""
+        depth, size, oldest = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0), MIN(created_at) FROM outbox"
+        ).fetchone()
+        return {
+            'depth': depth,
+            'bytes': size,
+            'oldest_age_seconds': round(time.time() - oldest, 1) if oldest else 0,
+            'evicted': self.evicted,
+            'delivered': self.delivered,
+            'rejected': self.rejected,
+        }
+
+    def _enforce_limits(self) -> None:
+        depth, size = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM outbox"
+        ).fetchone()
+        if depth <= self.max_entries and size <= self.max_bytes:
+            return
+        evicted = 0
+        tareas = set()
+        rows = self._db.execute("SELECT id, task_id, LENGTH(payload) FROM outbox ORDER BY id").fetchall()
+        with self._db:
+            for row_id, task_id, row_size in rows:
+                if depth <= self.max_entries and size <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                depth -= 1
+                size -= row_size
+                evicted += 1
+                tareas.add(task_id)
+            # Sin todos sus lotes, la tarea no quedó sincronizada
+            self._db.executemany("DELETE FROM outbox_sync WHERE task_id = ?", [(t,) for t in tareas])
+        self.evicted += evicted
+        print(f"[WARNING] Outbox lleno: se descartaron {evicted} lotes antiguos")
@@ -1,72 +1,50 @@
 """
 Cliente de Redis para los scrapers
 """
-import json
-import redis
-from datetime import datetime
+from redis.asyncio import Redis
 from typing import Optional, Dict, Any
 
 from scraper.models.scraper_models import ScraperTask, ScraperResult
+from utils.task_status import set_task_status, task_from_hash
 
-def get_task(redis_client: redis.Redis, task_id: str) -> Optional[ScraperTask]:
+async def get_task(redis_client: Redis, task_id: str) -> Optional[ScraperTask]:
     """Obtiene una tarea de Redis"""
     try:
         task_key = f"scraper:tasks:{task_id}"
-        task_data = redis_client.hget(task_key, 'data')
-        if task_data:
-            task_dict = json.loads(task_data)
-            return ScraperTask(**task_dict)
+        # Los campos de estado del hash están más al día que el espejo `data`
+        campos = await redis_client.hgetall(task_key)
+        if campos.get('data'):
+            return ScraperTask(**task_from_hash(campos))
         return None
     except Exception as e:
         print(f"ERROR: Error al obtener tarea {task_id}: {str(e)}")
         return None
 
-def store_result(redis_client: redis.Redis, task_id: str, result: Dict[str, Any]) -> bool:
+async def store_result(redis_client: Redis, task_id: str, result: Dict[str, Any]) -> bool:
     """Almacena el resultado de una tarea en Redis"""
     try:
-        task_key = f"scraper:tasks:{task_id}"
-        task_data = redis_client.hget(task_key, 'data')
-        if task_data:
-            task_dict = json.loads(task_data)
-            task_dict['status'] = 'completed'
-            task_dict['progress'] = 100
-            task_dict['message'] = 'Scraping completado exitosamente'
-            task_dict['result'] = result
-            task_dict['updated_at'] = datetime.now().isoformat()
-            
-            success = redis_client.hset(task_key, 'data', json.dumps(task_dict))
+        success = await set_task_status(
+            redis_client, task_id, 'completed', 'Scraping completado exitosamente', 100,
+            result=result, create=False
+        )
+        if success:
             print(f"[OK] Resultados guardados en Redis para tarea {task_id}")
-            return success
-        print(f"[WARNING] No se encontró la tarea {task_id} en Redis")
-        return False
+        return success
     except Exception as e:
         print(f"ERROR: Error guardando resultados en Redis: {str(e)}")
         return False
 
-def update_task_status(redis_client: redis.Redis, task_id: str, status: str, 
-                      message: Optional[str] = None, progress: Optional[float] = None,
-                      error: Optional[str] = None) -> bool:
-    """Actualiza el estado de una tarea en Redis"""
+async def update_task_status(redis_client: Redis, task_id: str, status: str, 
+                            message: Optional[str] = None, progress: Optional[float] = None,
+                            error: Optional[str] = None) -> bool:
+    """Actualiza el estado de una tarea en Redis (campos separados, atómico y publicado)"""
     try:
-        task_key = f"scraper:tasks:{task_id}"
-        task_data = redis_client.hget(task_key, 'data')
-        if task_data:
-            task_dict = json.loads(task_data)
-            task = ScraperTask(**task_dict)
-            task.status = status
-            if message:
-                task.message = message
-            if progress is not None:
-                task.progress = progress
-            if error:
-                task.error = error
-            task.updated_at = datetime.now().isoformat()
-            
-            success = redis_client.hset(task_key, 'data', json.dumps(task.__dict__))
+        success = await set_task_status(
+            redis_client, task_id, status, message or None, progress, error or None, create=False
+        )
+        if success:
             print(f"Estado de tarea actualizado: {task_id} -> {status} ({message if message else 'sin mensaje'}) - Progreso: {progress}%")
-            return success
-        print(f"[WARNING] No se encontró la tarea {task_id} en Redis")
-        return False
+        return success
     except Exception as e:
         print(f"ERROR: Error actualizando estado de tarea {task_id}: {str(e)}")
-        return False 
\ No newline at end of file
+        return False
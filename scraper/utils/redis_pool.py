@@ -0,0 +1,90 @@
+"""
+Pool de conexiones Redis compartido por el proceso
+
+El integrador, el gestor y cada instancia del scraper creaban su propio
+cliente (el del scraper, además, síncrono). Aquí se crea un solo cliente
+asyncio por proceso sobre un BlockingConnectionPool de tamaño
+`REDIS_POOL_SIZE`: con mucha concurrencia las corrutinas esperan una
+conexión libre en vez de abrir conexiones nuevas, y nada bloquea el loop.
+La configuración sale de `REDIS_URL` (o de REDIS_HOST/REDIS_PORT si no
+está definida).
+"""
+import os
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import redis.asyncio as aioredis
+
+REDIS_POOL_SIZE = int(os.getenv('REDIS_POOL_SIZE', '20'))
+# Segundos que una corrutina espera una conexión libre antes de fallar
+REDIS_POOL_TIMEOUT = int(os.getenv('REDIS_POOL_TIMEOUT', '20'))
+
+_client: Optional[aioredis.Redis] = None
+
+
+def redis_config_from_env() -> Dict[str, Any]:
+    """Parámetros de conexión a partir de REDIS_URL"""
+    redis_url = os.getenv('REDIS_URL')
+    if not redis_url:
+        return {
+            'host': os.getenv('REDIS_HOST', 'localhost'),
+            'port': int(os.getenv('REDIS_PORT', 6379)),
+        }
+
+    print(f"[DEBUG] REDIS_URL: {redis_url}")
+    try:
+        # Parse URL correctamente usando urllib.parse
+        parsed_url = urlparse(redis_url)
+
+        redis_host = parsed_url.hostname or 'localhost'
+        redis_port = parsed_url.port or 6379
+        redis_password = parsed_url.password
+        redis_username = parsed_url.username or 'default'
+
+        print(f"[DEBUG] Redis config: host={redis_host}, port={redis_port}, username={redis_username}")
+
+        redis_config = {'host': redis_host, 'port': redis_port}
+        if redis_password:
+            redis_config['password'] = redis_password
+            if redis_username != 'default':
+                redis_config['username'] = redis_username
+        return redis_config
+
+    except Exception as e:
+        print(f"[ERROR] Error parseando REDIS_URL: {e}")
+        # Fallback a configuración local
+        print("[INFO] Usando configuración Redis local como fallback")
+        return {'host': 'localhost', 'port': 6379}
+
+
+def get_redis(max_connections: Optional[int] = None, socket_timeout: Optional[float] = None) -> aioredis.Redis:
+    """
+    Cliente Redis del proceso. Solo la primera llamada configura el pool:
+    `socket_timeout` debe superar la espera de cualquier comando bloqueante
+    (BLPOP, XREADGROUP BLOCK) que se haga con él.
+    """
+    global _client
+    if _client is None:
+        redis_config = redis_config_from_env()
+        pool = aioredis.BlockingConnectionPool(
+            max_connections=max_connections or REDIS_POOL_SIZE,
+            timeout=REDIS_POOL_TIMEOUT,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            socket_timeout=socket_timeout,
+            retry_on_timeout=True,
+            **redis_config
+        )
+        _client = aioredis.Redis(connection_pool=pool)
+        print(f"[INFO] Configuración Redis: {redis_config['host']}:{redis_config['port']} "
+              f"(pool de {pool.max_connections} conexiones)")
+    return _client
+
+
+async def close_redis() -> None:
+    """Cierra el cliente y las conexiones del pool"""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
+        await client.connection_pool.disconnect()
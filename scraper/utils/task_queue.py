@@ -0,0 +1,139 @@
+"""
+Cola confiable de tareas del scraper sobre Redis Streams
+
+El backend sigue encolando tareas con RPUSH en `scraper:queue`. Un puente las
+mueve de forma atómica al stream `scraper:stream`, desde donde los workers las
+consumen con un grupo de consumidores. Una entrada solo se confirma (XACK)
+cuando la tarea terminó; si el worker muere a mitad del scraping la entrada
+queda pendiente y otro consumidor la reclama automáticamente.
+"""
+import socket
+import os
+from typing import List, Optional, Tuple
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+# Mueve todo el contenido de la lista legada al stream en una sola operación
+# atómica: una tarea nunca está fuera de ambas estructuras a la vez.
+MOVE_QUEUE_TO_STREAM = """
+local moved = 0
+while true do
+    local task = redis.call('LPOP', KEYS[1])
+    if not task then
+        break
+    end
+    redis.call('XADD', KEYS[2], '*', 'task', task)
+    moved = moved + 1
+end
+return moved
+"""
+
+# (id de la entrada, JSON de la tarea, número de entregas)
+StreamEntry = Tuple[str, str, int]
+
+
+class TaskStream:
+    """Consumidor de tareas con grupo de consumidores y recuperación de pendientes"""
+
+    def __init__(self, redis_client: Redis, consumer: Optional[str] = None,
+                 stream: str = 'scraper:stream', group: str = 'scraper-workers',
+                 legacy_queue: str = 'scraper:queue'):
+        self.redis = redis_client
+        self.consumer = consumer or os.getenv('SCRAPER_CONSUMER_NAME') or socket.gethostname()
+        self.stream = stream
+        self.group = group
+        self.legacy_queue = legacy_queue
+        self.dead_letter = f'{stream}:dead'
+        # Una entrada sin heartbeat durante este tiempo se considera huérfana
+        self.claim_idle_ms = int(os.getenv('SCRAPER_CLAIM_IDLE_MS', '120000'))
+        # Entregas máximas antes de enviar la tarea al dead letter
+        self.max_deliveries = int(os.getenv('SCRAPER_MAX_DELIVERIES', '3'))
+
+    async def setup(self) -> None:
+        """Crea el stream y el grupo de consumidores si no existen"""
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+            print(f"[INFO] Grupo de consumidores '{self.group}' creado en {self.stream}")
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        # Migrar lo que haya quedado en la cola legada
+        await self.redis.eval(MOVE_QUEUE_TO_STREAM, 2, self.legacy_queue, self.stream)
+
+    async def bridge_legacy_queue(self, timeout: int) -> int:
+        """
+        Espera hasta `timeout` segundos a que aparezcan tareas en la cola legada
+        y las mueve al stream. BLMOVE sobre la misma lista (LEFT -> LEFT) no
+        modifica la cola; solo sirve para bloquear sin hacer polling.
+        """
+        head = await self.redis.blmove(self.legacy_queue, self.legacy_queue, timeout, 'LEFT', 'LEFT')
+        if head is None:
+            return 0
+        return await self.redis.eval(MOVE_QUEUE_TO_STREAM, 2, self.legacy_queue, self.stream)
+
+    async def read(self, count: int = 1, block_ms: int = 2000) -> List[StreamEntry]:
+        """Lee entradas nuevas asignándolas a este consumidor"""
+        response = await self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream: '>'}, count=count, block=block_ms
+        )
+        entries = []
+        for _, messages in response or []:
+            for entry_id, fields in messages:
+                entries.append((entry_id, fields.get('task', ''), 1))
+        return entries
+
+    async def reclaim(self, count: int = 1) -> List[StreamEntry]:
+        """
+        Reclama entradas pendientes de consumidores caídos. El llamador decide
+        qué hacer con las que superan `max_deliveries`.
+        """
+        response = await self.redis.xautoclaim(
+            self.stream, self.group, self.consumer, self.claim_idle_ms, start_id='0-0', count=count
+        )
+        messages = response[1] if response and len(response) > 1 else []
+        entries = []
+        for entry_id, fields in messages:
+            if entry_id is None:
+                continue
+            if not fields:
+                # La entrada fue eliminada del stream mientras estaba pendiente
+                await self.redis.xack(self.stream, self.group, entry_id)
+                continue
+            deliveries = await self.delivery_count(entry_id)
+            print(f"[INFO] Entrada {entry_id} reclamada por {self.consumer} (entrega {deliveries})")
+            entries.append((entry_id, fields.get('task', ''), deliveries))
+        return entries
+
+    async def delivery_count(self, entry_id: str) -> int:
+        """Número de veces que la entrada fue entregada a algún consumidor"""
+        pending = await self.redis.xpending_range(self.stream, self.group, min=entry_id, max=entry_id, count=1)
+        return pending[0]['times_delivered'] if pending else 0
+
+    async def heartbeat(self, entry_ids: List[str]) -> None:
+        """Reinicia el tiempo de inactividad de las entradas en curso para que no sean reclamadas"""
+        if entry_ids:
+            await self.redis.xclaim(self.stream, self.group, self.consumer, 0, entry_ids, justid=True)
+
+    async def ack(self, entry_id: str) -> None:
+        """Confirma y elimina una entrada terminada"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            await pipe.execute()
+
+    async def requeue(self, entry_id: str, task_data: str) -> None:
+        """Devuelve una tarea interrumpida al stream para que otro worker la tome de inmediato"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(self.stream, {'task': task_data})
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            await pipe.execute()
+
+    async def dead_letter_entry(self, entry_id: str, task_data: str) -> None:
+        """Mueve una entrada al dead letter y la confirma"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(self.dead_letter, {'task': task_data, 'origin_id': entry_id})
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            await pipe.execute()
@@ -0,0 +1,199 @@
+"""
+Estado de las tareas del scraper en Redis
+
+Antes cada actualización hacía hget del JSON completo de la tarea, lo
+modificaba y lo volvía a escribir: dos escritores simultáneos (el scraper y
+el backend al recibir los movimientos) se pisaban, y el backend solo se
+enteraba del progreso consultando. Ahora:
+- el estado vive en campos separados del hash `scraper:tasks:{id}`
+  (status, message, progress, error, updated_at); cada avance de progreso
+  es un HSET de los campos que cambian, sin leer ni reescribir nada más,
+- el campo `data` (JSON con el resto de la tarea) solo se reconstruye en
+  las transiciones finales (completed, failed, cancelled) o al guardar un
+  resultado, en una transacción WATCH/MULTI; quien lee la tarea toma los
+  campos de estado del hash por encima de `data` (`task_from_hash`),
+- cada cambio se publica en `scraper:tasks:{id}:updates`, donde el backend
+  ya está suscrito (progress va como fracción 0-1, porque el backend lo
+  multiplica por 100).
+
+El resultado completo de una tarea (cuentas con sus movimientos y los
+movimientos procesados) no va en `data`, que se parsea en cada consulta de
+estado: se guarda comprimido en `scraper:results:{id}` con TTL, y la tarea
+solo lleva un resumen (totales y cuentas sin movimientos) con la clave
+donde encontrarlo.
+"""
+import base64
+import gzip
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import WatchError
+
+# Reintentos cuando otro escritor modifica la tarea entre la lectura y la escritura
+MAX_WATCH_RETRIES = 10
+
+# Tiempo que se conserva el resultado completo de una tarea (7 días por defecto)
+RESULT_TTL = int(os.getenv('SCRAPER_RESULT_TTL', str(7 * 24 * 3600)))
+
+# Listas de movimientos que solo viven en el resultado completo
+CAMPOS_PESADOS = ('cuentas', 'processed_movements', 'ultimos_movimientos')
+
+# Campos de estado del hash (los demás datos de la tarea van en `data`)
+STATUS_FIELDS = ('status', 'message', 'progress', 'error', 'updated_at')
+# Estados con los que se reconstruye el espejo `data`
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+def task_key(task_id: Any) -> str:
+    return f"scraper:tasks:{task_id}"
+
+
+def result_key(task_id: Any) -> str:
+    return f"scraper:results:{task_id}"
+
+
+def updates_channel(task_id: Any) -> str:
+    return f"{task_key(task_id)}:updates"
+
+
+def task_from_hash(campos: Dict[str, str]) -> Dict[str, Any]:
+    """Tarea a partir del hash: el JSON de `data` con los campos de estado (más recientes) encima"""
+    task = json.loads(campos['data']) if campos.get('data') else {}
+    for name in STATUS_FIELDS:
+        value = campos.get(name)
+        if value is None:
+            continue
+        if name == 'progress':
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+        task[name] = value
+    return task
+
+
+async def set_task_status(redis_client: Redis, task_id: Any, status: str,
+                          message: Optional[str] = None, progress: Optional[float] = None,
+                          error: Optional[str] = None, result: Optional[Dict[str, Any]] = None,
+                          create: bool = True) -> bool:
+    """
+    Actualiza el estado de una tarea y publica el cambio. `progress` va de
+    0 a 100. Con `create=False` no crea tareas inexistentes. Retorna True si
+    se guardó.
+    """
+    fields: Dict[str, Any] = {'status': status, 'updated_at': datetime.now().isoformat()}
+    if message is not None:
+        fields['message'] = message
+    if progress is not None:
+        fields['progress'] = progress
+    if error is not None:
+        fields['error'] = error
+
+    if status not in TERMINAL_STATUSES and result is None:
+        return await _set_fields(redis_client, task_id, fields, create)
+
+    key = task_key(task_id)
+    for _ in range(MAX_WATCH_RETRIES):
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                campos = await pipe.hgetall(key)
+                if not campos and not create:
+                    await pipe.unwatch()
+                    print(f"[WARNING] No se encontró la tarea {task_id} en Redis")
+                    return False
+                task = {'id': task_id, **task_from_hash(campos)}
+                task.update(fields)
+                resumen = None
+                if result is not None:
+                    resumen = summarize_result(task_id, result)
+                    task['result'] = resumen
+
+                pipe.multi()
+                if result is not None:
+                    pipe.set(result_key(task_id), encode_result(result), ex=RESULT_TTL)
+                pipe.hset(key, mapping={name: str(value) for name, value in fields.items()})
+                pipe.hset(key, 'data', json.dumps(task))
+                pipe.publish(updates_channel(task_id), json.dumps(_event(task_id, task, resumen)))
+                await pipe.execute()
+            return True
+        except WatchError:
+            # Otro escritor actualizó la tarea: leer de nuevo y reintentar
+            continue
+    print(f"ERROR: No se pudo actualizar la tarea {task_id}: demasiadas escrituras concurrentes")
+    return False
+
+
+async def _set_fields(redis_client: Redis, task_id: Any, fields: Dict[str, Any], create: bool) -> bool:
+    """Avance de progreso: HSET de los campos que cambian, sin tocar `data`"""
+    key = task_key(task_id)
+    if not create and not await redis_client.exists(key):
+        print(f"[WARNING] No se encontró la tarea {task_id} en Redis")
+        return False
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping={name: str(value) for name, value in fields.items()})
+        # El evento lleva el estado completo (p. ej. el último mensaje si este avance no trae uno)
+        pipe.hmget(key, list(STATUS_FIELDS))
+        _, valores = await pipe.execute()
+    task = {'id': task_id, **task_from_hash(dict(zip(STATUS_FIELDS, valores)))}
+    await redis_client.publish(updates_channel(task_id), json.dumps(_event(task_id, task, None)))
+    return True
+
+
+def _event(task_id: Any, task: Dict[str, Any], result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Mensaje para el canal de actualizaciones (con la tarea ya actualizada), en el formato que lee el backend"""
+    progress = task.get('progress')
+    event = {
+        'id': task_id,
+        'status': task['status'],
+        'message': task.get('message'),
+        'progress': progress / 100 if isinstance(progress, (int, float)) else 0,
+        'error': task.get('error'),
+        'updated_at': task['updated_at'],
+    }
+    if result is not None:
+        event['result'] = result
+    return event
+
+
+def encode_result(result: Dict[str, Any]) -> str:
+    """
+    Resultado en JSON comprimido con gzip. Va en base64 porque los clientes
+    Redis del scraper usan decode_responses=True y no leen binarios.
+    """
+    comprimido = gzip.compress(json.dumps(result, ensure_ascii=False).encode('utf-8'), compresslevel=6)
+    return base64.b64encode(comprimido).decode('ascii')
+
+
+def decode_result(blob: str) -> Dict[str, Any]:
+    return json.loads(gzip.decompress(base64.b64decode(blob)).decode('utf-8'))
+
+
+def summarize_result(task_id: Any, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Lo que queda del resultado en la tarea: campos escalares, totales y cuentas sin movimientos"""
+    resumen = {campo: valor for campo, valor in result.items() if campo not in CAMPOS_PESADOS}
+    cuentas = result.get('cuentas') or []
+    resumen['cuentas'] = [
+        {
+            **{campo: valor for campo, valor in cuenta.items() if campo != 'movimientos'},
+            'total_movimientos': len(cuenta.get('movimientos') or []),
+        }
+        for cuenta in cuentas
+    ]
+    resumen.setdefault('total_cuentas', len(cuentas))
+    resumen.setdefault('total_movimientos', sum(len(cuenta.get('movimientos') or []) for cuenta in cuentas))
+    if 'processed_movements' in result:
+        resumen['total_processed_movements'] = len(result['processed_movements'] or [])
+    resumen['result_key'] = result_key(task_id)
+    return resumen
+
+
+async def load_task_result(redis_client: Redis, task_id: Any) -> Optional[Dict[str, Any]]:
+    """Resultado completo de una tarea, o None si no existe o ya expiró"""
+    blob = await redis_client.get(result_key(task_id))
+    if blob is None:
+        return None
+    return decode_result(blob)
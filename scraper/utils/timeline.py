@@ -0,0 +1,172 @@
+"""
+Instrumentación por fases del scraper
+
+No había forma de saber en qué se iban los minutos de una ejecución: login,
+extracción de cuentas, cada cuenta, cada página, las pausas humanas, los
+selectores de respaldo, la categorización o el envío. Aquí:
+- `span(nombre, **atributos)` mide un bloque y `timed(nombre)` una
+  corrutina. Los spans se anidan solos mediante contextvars, también entre
+  pestañas que corren en paralelo (cada tarea asyncio hereda su propio
+  span padre).
+- cada span terminado se emite como una línea JSON en `SCRAPER_SPAN_LOG`
+  (por defecto logs/spans.jsonl; `-` para stdout, vacío para no emitir),
+- `Timeline` acumula los spans de una tarea y los guarda, con un resumen
+  por fase (cantidad, total y máximo), en el campo `timeline` del hash
+  `scraper:tasks:{id}`.
+
+Fuera de una tarea (sin timeline activo) `span` no hace nada.
+"""
+import functools
+import itertools
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from redis.asyncio import Redis
+
+SPAN_LOG = os.getenv('SCRAPER_SPAN_LOG', 'logs/spans.jsonl')
+# Spans detallados que se guardan con la tarea (el resumen por fase siempre es completo)
+MAX_STORED_SPANS = int(os.getenv('SCRAPER_TIMELINE_MAX_SPANS', '2000'))
+
+_timeline: ContextVar[Optional['Timeline']] = ContextVar('scraper_timeline', default=None)
+_span_actual: ContextVar[Optional[int]] = ContextVar('scraper_span', default=None)
+_log_file = None
+
+
+def emit(evento: Dict[str, Any]) -> None:
+    """Escribe un evento como línea JSON en el destino configurado"""
+    global _log_file
+    if not SPAN_LOG:
+        return
+    linea = json.dumps(evento, ensure_ascii=False, default=str)
+    if SPAN_LOG == '-':
+        print(linea, flush=True)
+        return
+    try:
+        if _log_file is None:
+            directory = os.path.dirname(SPAN_LOG)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            _log_file = open(SPAN_LOG, 'a', encoding='utf-8', buffering=1)
+        _log_file.write(linea + '\n')
+    except OSError as e:
+        print(f"[WARNING] No se pudo escribir el span en {SPAN_LOG}: {e}")
+
+
+class Timeline:
+    def __init__(self, task_id: Any):
+        self.task_id = task_id
+        self.started_at = datetime.now().isoformat()
+        self.spans: List[Dict[str, Any]] = []
+        self._inicio = time.monotonic()
+        self._ids = itertools.count(1)
+
+    def record(self, span_id: int, parent: Optional[int], name: str, inicio: float,
+               duracion: float, status: str, attrs: Dict[str, Any]) -> None:
+        registro = {
+            'id': span_id,
+            'parent': parent,
+            'name': name,
+            'offset_ms': round((inicio - self._inicio) * 1000, 1),
+            'duration_ms': round(duracion * 1000, 1),
+            'status': status,
+        }
+        if attrs:
+            registro['attrs'] = attrs
+        self.spans.append(registro)
+        emit({'task_id': self.task_id, **registro})
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Por nombre de span: cantidad, tiempo total y máximo (de mayor a menor total)"""
+        fases: Dict[str, Dict[str, Any]] = {}
+        for registro in self.spans:
+            fase = fases.setdefault(registro['name'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'errors': 0})
+            fase['count'] += 1
+            fase['total_ms'] += registro['duration_ms']
+            fase['max_ms'] = max(fase['max_ms'], registro['duration_ms'])
+            if registro['status'] != 'ok':
+                fase['errors'] += 1
+        for fase in fases.values():
+            fase['total_ms'] = round(fase['total_ms'], 1)
+        return dict(sorted(fases.items(), key=lambda item: item[1]['total_ms'], reverse=True))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'task_id': self.task_id,
+            'started_at': self.started_at,
+            'duration_ms': round((time.monotonic() - self._inicio) * 1000, 1),
+            'phases': self.summary(),
+            'spans': self.spans[:MAX_STORED_SPANS],
+            'spans_total': len(self.spans),
+        }
+
+    async def save(self, redis_client: Redis) -> None:
+        """Guarda el timeline junto a la tarea, en el campo `timeline` de su hash"""
+        try:
+            await redis_client.hset(f"scraper:tasks:{self.task_id}", 'timeline', json.dumps(self.to_dict()))
+        except Exception as e:
+            print(f"[WARNING] No se pudo guardar el timeline de la tarea {self.task_id}: {e}")
+
+    def print_report(self, limite: int = 10) -> None:
+        datos = self.to_dict()
+        print(f"[INFO] Timeline de la tarea {self.task_id}: {datos['duration_ms'] / 1000:.1f}s, "
+              f"{datos['spans_total']} spans")
+        for nombre, fase in list(datos['phases'].items())[:limite]:
+            print(f"  - {nombre}: {fase['total_ms'] / 1000:.2f}s en {fase['count']} "
+                  f"(máx {fase['max_ms'] / 1000:.2f}s)")
+
+
+@contextmanager
+def activate(timeline: Timeline) -> Iterator[Timeline]:
+    """Hace de `timeline` el destino de los spans del bloque (y de las tareas que cree)"""
+    token = _timeline.set(timeline)
+    token_span = _span_actual.set(None)
+    try:
+        yield timeline
+    finally:
+        _span_actual.reset(token_span)
+        _timeline.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Mide el bloque como un span hijo del span actual. Entrega el diccionario
+    de atributos para completarlo dentro del bloque (p. ej. filas leídas).
+    """
+    timeline = _timeline.get()
+    if timeline is None:
+        yield attrs
+        return
+    span_id = next(timeline._ids)
+    parent = _span_actual.get()
+    token = _span_actual.set(span_id)
+    inicio = time.monotonic()
+    status = 'ok'
+    try:
+        yield attrs
+    except Exception:
+        status = 'error'
+        raise
+    except BaseException:
+        # Cancelación de la tarea (TaskCancelled, asyncio.CancelledError)
+        status = 'cancelled'
+        raise
+    finally:
+        _span_actual.reset(token)
+        timeline.record(span_id, parent, name, inicio, time.monotonic() - inicio, status, attrs)
+
+
+def timed(name: str) -> Callable:
+    """Decorador: cada llamada a la corrutina es un span"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator